@@ -4,6 +4,8 @@ import time
 import json
 from typing import List, Dict, Optional
 
+import metrics
+
 class AmoCRMClient:
     def __init__(self, csv_path):
         try:
@@ -41,18 +43,22 @@ class AmoCRMClient:
         retry_delay = 5
         for attempt in range(max_retries):
             try:
-                response = requests.request(method, url, **kwargs)
+                with metrics.timer("amocrm_request"):
+                    response = requests.request(method, url, **kwargs)
+                metrics.count(f"amocrm_status_{response.status_code}")
                 if response.status_code == 401:
                     if self._check_token():
                         kwargs['headers']['Authorization'] = f"Bearer {self.access_token}"
                         continue
                 if response.status_code == 429:
+                    metrics.count("amocrm_rate_limited")
                     retry_after = int(response.headers.get('Retry-After', retry_delay))
                     print(f"Достигнут лимит запросов. Ожидание {retry_after} сек...")
                     time.sleep(retry_after)
                     continue
                 return response
             except requests.exceptions.RequestException as e:
+                metrics.count("amocrm_network_errors")
                 print(f"Ошибка сети (попытка {attempt+1}/{max_retries}): {e}")
                 if attempt < max_retries - 1:
                     time.sleep(retry_delay * (attempt + 1))
@@ -2,26 +2,39 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import os
-import re
-import string
-import joblib
-import fitz  # PyMuPDF
 import base64
-import pymorphy3
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem.snowball import SnowballStemmer
-from catboost import CatBoostClassifier
 import hashlib
 import json
 import io
+import logging
 import subprocess
 import sys
-import io
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-import pdf2image
+import threading
+import time
+import heapq
+from concurrent import futures
+from candidate_store import CandidateStore, LIST_COLUMNS
+from blob_store import BlobStore
+from search_index import SearchIndex
+from dedup import DuplicateIndex
+from resume_pipeline import get_detailed_comment, explain_features, render_pdf_pages
+from model_registry import ModelRegistry
+from feature_store import FeatureStore, manual_feature_names, vectorizer_version
+from isolation import Quarantine, analyze_documents
+from job_queue import JOB_QUEUE_ENABLED, JOB_BATCH_FILES, JOB_WAIT_TIMEOUT_S, SCORE_PDFS, JobQueue, collect_job
+from scheduler import SCHEDULER_STREAM_INFLIGHT, FairScheduler, SchedulerBusy
+from pochtalion import MAIL_POLL_ENABLED, MAIL_OWNER, MailPoller
+from session_memory import EVICTABLE_KEYS, PROTECTED_KEYS, MemoryMonitor, current_session_id
+from scoring_service import SCORING_SERVICE_URL, score_prepared_remote
+from excel_export import EXCEL_MIME, build_excel_export
+from archive_reader import ARCHIVE_TYPES, ARCHIVE_CHUNK_FILES, iter_archive, archive_member_count, chunked
+from thresholds import (
+    load_thresholds, save_thresholds, bucket_ranges, bucket_labels, assign_buckets, flipped_range
+)
+import ingest
+import metrics
+
+logger = logging.getLogger(__name__)
 
 # Установка заголовка страницы - это ДОЛЖНА быть первая команда Streamlit
 st.set_page_config(
@@ -36,13 +49,10 @@ if "clear" in query_params:
     # Очистка всех сессий на системном уровне
     if hasattr(st, "session_state"):
         for key in list(st.session_state.keys()):
-            if key not in ['authenticated', 'user_role', 'user_name']:
+            if key not in ['authenticated', 'user_role', 'user_name', 'username']:
                 del st.session_state[key]
     
     # Инициализация базовых переменных
-    st.session_state.processed_files = {}
-    st.session_state.results = []
-    st.session_state.has_processed_files = False
     st.session_state.selected_rows = set()
     
     # Удаляем параметр очистки из URL
@@ -81,6 +91,7 @@ def authenticate(username, password):
     users = load_users()
     hashed_password = hashlib.sha256(password.encode()).hexdigest()
     if username in users and users[username]["password"] == hashed_password:
+        st.session_state.username = username
         st.session_state.user_role = users[username]["role"]
         st.session_state.user_name = users[username].get("name", username)
         return True
@@ -90,7 +101,8 @@ def authenticate(username, password):
 def admin_panel():
     st.title("Панель администратора")
     
-    tab1, tab2 = st.tabs(["Управление пользователями", "Добавить пользователя"])
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["Управление пользователями", "Добавить пользователя",
+                                                        "Метрики", "Пороги", "Карантин", "Модель", "Память"])
     
     with tab1:
         st.subheader("Управление пользователями")
@@ -147,6 +159,223 @@ def admin_panel():
                     save_users(users)
                     st.success(f"Пользователь {new_username} успешно добавлен")
 
+    with tab3:
+        metrics_panel()
+
+    with tab4:
+        thresholds_panel()
+
+    with tab5:
+        quarantine_panel()
+
+    with tab6:
+        model_panel()
+
+    with tab7:
+        memory_panel()
+
+def metrics_panel():
+    st.subheader("Производительность конвейера")
+    enabled = st.toggle("Сбор метрик включен", value=metrics.enabled())
+    if enabled != metrics.enabled():
+        metrics.set_enabled(enabled)
+
+    data = metrics.snapshot()
+    if data["stages"]:
+        stages_df = pd.DataFrame(data["stages"]).rename(columns={
+            "stage": "Этап",
+            "calls": "Вызовов",
+            "documents": "Документов",
+            "total_s": "Всего, с",
+            "p50_ms": "p50, мс",
+            "p95_ms": "p95, мс",
+            "docs_per_s": "Док/с"
+        })
+        st.dataframe(stages_df, use_container_width=True, hide_index=True)
+    else:
+        st.info("Данных пока нет: обработайте резюме или отправьте их в AmoCRM.")
+
+    if data["caches"]:
+        st.write("Кеши")
+        st.dataframe(pd.DataFrame([
+            {"Кеш": name, "Попадания": stats["hits"], "Промахи": stats["misses"], "Доля попаданий": stats["hit_rate"]}
+            for name, stats in sorted(data["caches"].items())
+        ]), use_container_width=True, hide_index=True)
+    if data["counters"]:
+        st.write("Счетчики")
+        st.dataframe(pd.DataFrame(sorted(data["counters"].items()), columns=["Счетчик", "Значение"]),
+                     use_container_width=True, hide_index=True)
+
+    scheduler_stats = get_scheduler().stats()
+    st.write(f"Исполнитель оценки: занято {scheduler_stats['busy']} из {scheduler_stats['workers']} обработчиков, "
+             f"ждут {scheduler_stats['queued']} порций, выполнено {scheduler_stats['completed']}")
+    if scheduler_stats["owners"]:
+        st.dataframe(pd.DataFrame([
+            {"Пользователь": owner, "В очереди": entry["queued"], "Выполняется": entry["running"]}
+            for owner, entry in scheduler_stats["owners"].items()
+        ]), use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        prometheus_path = st.text_input("Файл для экспорта в формате Prometheus", value=metrics.PROMETHEUS_FILE)
+        if st.button("Экспортировать метрики"):
+            st.success(f"Метрики записаны в {metrics.write_prometheus(prometheus_path)}")
+    with col2:
+        if st.button("Сбросить метрики"):
+            metrics.reset()
+            st.rerun()
+    with st.expander("Prometheus"):
+        st.code(metrics.to_prometheus(), language="text")
+
+def model_panel():
+    st.subheader("Комплект модели")
+    if SCORING_SERVICE_URL:
+        st.info(f"Оценку выполняет сервис {SCORING_SERVICE_URL}, комплект модели загружен в нем. "
+                "Версия модели сервиса записывается в каждую оцененную строку.")
+        return
+    registry = get_model_registry()
+    if registry is None:
+        st.error("Модель не загружена")
+        return
+    status = registry.status()
+    st.table(pd.DataFrame({
+        "Параметр": ["Версия", "Загружена", "Последняя проверка файлов", "Идет загрузка"],
+        "Значение": [
+            status["version"],
+            pd.to_datetime(status["loaded_at"], unit="s").strftime("%Y-%m-%d %H:%M:%S"),
+            pd.to_datetime(status["last_checked_at"], unit="s").strftime("%Y-%m-%d %H:%M:%S"),
+            "да" if status["loading"] else "нет"
+        ]
+    }))
+    if status["last_error"]:
+        st.error(f"Последняя попытка обновления не удалась, работает прежняя версия: {status['last_error']}")
+    st.caption("Файлы модели проверяются автоматически. Загрузка идет в фоне, "
+               "начатые пачки дорабатывают на прежней версии.")
+    if st.button("Проверить файлы модели сейчас"):
+        with st.spinner("Загрузка новой версии..."):
+            changed = registry.check(wait=True)
+        if not changed:
+            st.info("Файлы модели не изменились")
+        elif registry.status()["version"] != status["version"]:
+            st.success(f"Модель обновлена до версии {registry.status()['version']}")
+        else:
+            st.warning("Новая версия не загружена, подробности выше после обновления страницы")
+
+def format_bytes(size):
+    return f"{size / 1024 / 1024:.1f} МБ" if size >= 1024 * 1024 else f"{size / 1024:.1f} КБ"
+
+def memory_panel():
+    st.subheader("Память процесса")
+    monitor = get_memory_monitor()
+    if monitor.history:
+        history = pd.DataFrame(list(monitor.history))
+        history["Время"] = pd.to_datetime(history["at"], unit="s")
+        history["RSS, МБ"] = history["rss"] / 1024 / 1024
+        history["Состояние сессий, МБ"] = history["session_state"] / 1024 / 1024
+        st.line_chart(history.set_index("Время")[["RSS, МБ", "Состояние сессий, МБ"]])
+        st.caption(f"Сессий сейчас: {history['sessions'].iloc[-1]}. "
+                   f"Замер раз в {monitor.interval:.0f} с, хранится {monitor.history.maxlen} замеров.")
+
+    cap_mb = st.number_input("Предел состояния одной сессии, МБ (0 - без предела)", min_value=0.0,
+                             value=monitor.cap_bytes / 1024 / 1024, step=8.0)
+    if int(cap_mb * 1024 * 1024) != monitor.cap_bytes:
+        monitor.cap_bytes = int(cap_mb * 1024 * 1024)
+        st.success("Предел применяется к каждой сессии при ее следующем действии")
+    st.caption(f"При превышении сбрасываются кеши сессии: {', '.join(EVICTABLE_KEYS)}.")
+
+    st.write("Сессии")
+    report = monitor.session_report()
+    if not report:
+        st.info("Список сессий доступен только при запуске через streamlit run.")
+    own_session = current_session_id()
+    for row in report:
+        title = (f"{row['username'] or 'без входа'} · {format_bytes(row['total'])}"
+                 f"{'' if row['active'] else ' · отключена'}{' · эта сессия' if row['session_id'] == own_session else ''}")
+        with st.expander(title):
+            if row["keys"]:
+                st.dataframe(pd.DataFrame([{"Ключ": key, "Размер": format_bytes(size)} for key, size in row["keys"]]),
+                             use_container_width=True, hide_index=True)
+            keys = [key for key, _ in row["keys"] if key not in PROTECTED_KEYS]
+            to_evict = st.multiselect("Ключи", keys, key=f"evict_keys_{row['session_id']}")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Вытеснить выбранные", key=f"evict_{row['session_id']}", disabled=not to_evict):
+                    monitor.request_eviction(row["session_id"], to_evict)
+                    st.success("Ключи будут удалены при следующем действии пользователя")
+            with col2:
+                if st.button("Сбросить кеши сессии", key=f"evict_all_{row['session_id']}"):
+                    monitor.request_eviction(row["session_id"])
+                    st.success("Кеши будут сброшены при следующем действии пользователя")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Крупнейшие типы объектов"):
+            with st.spinner("Обход всех объектов процесса..."):
+                rows = monitor.top_types()
+            st.dataframe(pd.DataFrame([{"Тип": name, "Объектов": count, "Размер": format_bytes(size)}
+                                       for name, count, size in rows]), use_container_width=True, hide_index=True)
+    with col2:
+        if st.button("Прирост с прошлого замера"):
+            with st.spinner("Сравнение с прошлым замером..."):
+                rows = monitor.growth()
+            if rows:
+                st.dataframe(pd.DataFrame([{"Тип": name, "Объектов": count, "Прирост": format_bytes(size)}
+                                           for name, count, size in rows]),
+                             use_container_width=True, hide_index=True)
+            else:
+                st.info("Исходный замер сохранен, нажмите еще раз позже, чтобы увидеть прирост")
+
+def thresholds_panel():
+    st.subheader("Пороги классификации")
+    current = load_thresholds()
+    with st.form("thresholds_form"):
+        threshold = st.number_input("Порог класса 1 (ниже - красная зона)", min_value=0.0, max_value=1.0,
+                                    value=float(current["threshold"]), step=0.01, format="%.2f")
+        green_threshold = st.number_input("Порог зеленой зоны", min_value=0.0, max_value=1.0,
+                                          value=float(current["green_threshold"]), step=0.01, format="%.2f")
+        submit = st.form_submit_button("Сохранить пороги")
+
+    if submit:
+        new = {"threshold": threshold, "green_threshold": green_threshold}
+        try:
+            save_thresholds(new)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        # Цветовые зоны пересчитываются при отображении, вероятности не меняются;
+        # комментарии переписываются только у резюме, сменивших класс
+        started = time.perf_counter()
+        updated = regenerate_flipped_comments(get_candidate_store(), current["threshold"], threshold)
+        st.success(f"Пороги сохранены. Обновлено комментариев: {updated} "
+                   f"за {time.perf_counter() - started:.2f} с")
+
+def quarantine_panel():
+    st.subheader("Карантин PDF")
+    st.caption("Файлы, которые превышали лимит времени или памяти при обработке. "
+               "После повторного сбоя файл пропускается без обработки.")
+    quarantine = get_quarantine()
+    entries = quarantine.entries()
+    if not entries:
+        st.info("Карантин пуст.")
+        return
+    st.dataframe(pd.DataFrame([
+        {
+            "Файл": entry["file_name"],
+            "Причина": entry["reason"],
+            "Сбоев": entry["failures"],
+            "Последний сбой": pd.to_datetime(entry["last_failed_at"], unit="s"),
+            "Хеш": entry["file_hash"]
+        }
+        for entry in entries
+    ]), use_container_width=True, hide_index=True)
+    to_release = st.selectbox("Вернуть файл в обработку", [entry["file_hash"] for entry in entries],
+                              format_func=lambda file_hash: next(entry["file_name"] for entry in entries
+                                                                 if entry["file_hash"] == file_hash))
+    if st.button("Убрать из карантина"):
+        quarantine.release(to_release)
+        st.success("Файл будет обработан при следующей загрузке")
+        st.rerun()
+
 # --- Инициализация сессионного состояния ---
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
@@ -154,195 +383,62 @@ if 'user_role' not in st.session_state:
     st.session_state.user_role = None
 if 'user_name' not in st.session_state:
     st.session_state.user_name = None
-if 'processed_files' not in st.session_state:
-    st.session_state.processed_files = {}
-if 'results' not in st.session_state:
-    st.session_state.results = []
-if 'has_processed_files' not in st.session_state:
-    st.session_state.has_processed_files = False
+if 'username' not in st.session_state:
+    st.session_state.username = None
 if 'selected_rows' not in st.session_state:
     st.session_state.selected_rows = set()
 
-# --- Загрузка NLTK данных ---
-nltk.download('stopwords')
-
-# --- Инициализация морфологического анализатора и стеммера ---
-morph = pymorphy3.MorphAnalyzer()
-stemmer = SnowballStemmer("russian")
-default_stopwords = set(stopwords.words("russian"))
-custom_stopwords = default_stopwords - {"без", "для", "по", "при", "над"}
-custom_stopwords |= {
-    "резюме", "обновлено", "контакт", "зарплата", "телефон", "месяц", "лет",
-    "января", "февраля", "марта", "апреля", "мая", "июня", "июля", "августа",
-    "сентября", "октября", "ноября", "декабря", "должность", "работа",
-    "компания", "обязанности", "основной", "задача", "опыт", "место",
-    "года", "году", "владение", "информация", "образование", "гражданство"
-}
-
-# --- Ручные фичи ---
-features = {
-    "sales_experience": [
-        r"опыт.*прода", r"звонк[а-я]*", r"\bCRM\b", r"SPIN", r"AIDA", r"скрипт",
-        r"обработка заявк", r"воронк", r"телемаркет", r"менеджер по продаж"
-    ],
-    "hard_skills": [
-        r"возражен", r"переговор", r"следовать инструкц", r"многозада",
-        r"ведение.*переговор", r"обработка входящ", r"1с", r"excel", r"анализ"
-    ],
-    "soft_skills": [
-        r"мотивир", r"самостоят", r"проактив", r"обуча[еия]", r"дружелюб", r"стрессоустойчив",
-        r"клиентоориент", r"гибкост", r"адаптир", r"энергичн", r"настойчив", r"коммуникаб"
-    ],
-    "performance_metrics": [
-        r"конверс", r"выручк", r"чек", r"план", r"результат", r"рост.*конверс",
-        r"лояльн", r"возврат", r"kpi", r"достиж", r"удвоил", r"выполн", r"закрыт"
-    ]
-}
-
-# --- Функции для анализа резюме и комментирования (перенесены из comments.py) ---
-def detect_red_flag_areas(text):
-    text = text.lower()
-    
-    # Нежелательные области опыта
-    red_flag_areas = {
-        "фитнес": ["фитнес", "тренер", "спортивный клуб", "фитнес центр", "тренажерный зал"],
-        "недвижимость": ["недвижимость", "риэлтор", "агент по недвижимости", "агентство недвижимости", "продажа квартир", "продажа домов"],
-        "авто": ["автосалон", "автомобили", "машины", "продажа авто", "автодилер", "продавец авто"],
-        "банки": ["банк", "кредитный специалист", "кредитный менеджер", "финансовый консультант", "ипотечный", "кредитные продукты"],
-        "салоны красоты": ["салон красоты", "косметика", "парикмахер", "стилист", "визажист", "косметолог"],
-        "продавец-консультант": ["продавец-консультант", "консультант по продажам", "продавец в магазине", "консультация покупателей", "работа в торговом зале"]
-    }
-    
-    # Положительные индикаторы (телефонные продажи)
-    positive_indicators = [
-        "телефонные продажи", "холодные звонки", "телемаркетинг", "продажи по телефону",
-        "call-центр", "колл центр", "телефонные переговоры", "обзвон клиентов",
-        "холодная база", "лиды", "удаленные продажи", "оператор call-центра"
-    ]
-    
-    # Проверяем совпадения с red flag областями
-    found_red_flags = []
-    for area, keywords in red_flag_areas.items():
-        for keyword in keywords:
-            if keyword in text:
-                found_red_flags.append(area)
-                break
-    
-    # Проверяем положительные индикаторы
-    has_phone_sales = False
-    for indicator in positive_indicators:
-        if indicator in text:
-            has_phone_sales = True
-            break
-    
-    # Если есть red flags, но нет телефонных продаж
-    if found_red_flags and not has_phone_sales:
-        return True, found_red_flags, has_phone_sales
-    
-    return False, found_red_flags, has_phone_sales
-
-def get_detailed_comment(text, predicted_class, relevance_prob):
-    # Проверяем red flags
-    is_red_flag, red_flag_areas, has_phone_sales = detect_red_flag_areas(text)
-    
-    # Начинаем с пустого комментария
-    comment = ""
-    
-    if is_red_flag:
-        red_flag_str = ", ".join(set(red_flag_areas))
-        comment += f"RED FLAG: Имеет опыт работы в областях: {red_flag_str}, но отсутствует опыт телефонных продаж."
-    elif red_flag_areas and has_phone_sales:
-        red_flag_str = ", ".join(set(red_flag_areas))
-        comment += f"Имеет опыт работы в областях: {red_flag_str}, но присутствует опыт телефонных продаж, что является положительным фактором."
-    elif has_phone_sales:
-        comment += "Кандидат имеет опыт телефонных продаж, что соответствует требованиям позиции."
-    elif predicted_class == 0:
-        comment += "Недостаточное соответствие требованиям."
-    
-    # Анализ наличия ключевых навыков для продаж
-    sales_skills = []
-    
-    skill_patterns = {
-        "CRM": ["crm", "срм", "customer relationship management"],
-        "Холодные звонки": ["холодные звонки", "холодный обзвон", "холодная база"],
-        "Работа с возражениями": ["возражен", "работа с возражениями", "отработка возражений"],
-        "Ведение переговоров": ["переговоры", "ведение переговоров", "навыки переговоров"],
-        "SPIN/AIDA": ["spin", "aida", "техника продаж", "методы продаж"],
-        "Выполнение плана": ["план продаж", "выполнение плана", "перевыполнение плана", "плановые показатели"],
-        "Аналитика продаж": ["аналитика", "анализ продаж", "продажная воронка", "конверсия"]
-    }
-    
-    for skill, patterns in skill_patterns.items():
-        for pattern in patterns:
-            if pattern in text.lower():
-                sales_skills.append(skill)
-                break
-    
-    if sales_skills:
-        skills_str = ", ".join(sales_skills)
-        comment += f" Обладает следующими навыками: {skills_str}."
-    else:
-        comment += " В резюме не указаны ключевые навыки для телефонных продаж."
-    
-    return comment, is_red_flag
-
 # --- Загрузка модели и вспомогательных объектов ---
 @st.cache_resource
-def load_model():
-    model_path = "catboost_model.cbm"
-    if not os.path.exists(model_path):
-        st.error(f"Файл модели {model_path} не найден!")
-        return None, None, None
+def get_model_registry():
     try:
-        model = CatBoostClassifier()
-        model.load_model(model_path)
-        try:
-            scaler = joblib.load("scaler.pkl")
-        except:
-            scaler = joblib.load("scaler.joblib")
-        try:
-            tfidf = joblib.load("tfidf_vectorizer.pkl")
-        except:
-            tfidf = joblib.load("tfidf_vectorizer.joblib")
+        registry = ModelRegistry()
+        # Новые файлы модели подхватываются фоновым потоком без перезапуска сервера
+        registry.start_watcher()
         st.success("Модель и компоненты успешно загружены")
-        return model, scaler, tfidf
+        return registry
+    except FileNotFoundError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Ошибка при загрузке модели: {e}")
         import traceback
         st.code(traceback.format_exc())
-        return None, None, None
+        return None
+
+def load_model():
+    # Комплект берется один раз на прогон: начатая пачка дорабатывает на нем после замены модели.
+    # Модель сервиса оценки здесь не нужна: комплект в процесс страницы не загружается
+    if SCORING_SERVICE_URL:
+        return None
+    registry = get_model_registry()
+    return registry.current() if registry is not None else None
     
 # --- Функции обработки ---
-def extract_text_from_pdf(pdf_file):
-    try:
-        doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        return text
-    except Exception as e:
-        return f"[Ошибка] {e}"
-
 # Добавьте эту функцию перед функцией display_pdf
 def convert_pdf_to_images(pdf_file):
     try:
         pdf_file.seek(0)
-        # Значительно уменьшаем DPI для получения изображений меньшего размера
-        # Чем меньше DPI, тем меньше будет текст
-        images = pdf2image.convert_from_bytes(
-            pdf_file.read(),
-            dpi=72,  # Уменьшаем DPI до 72 (стандартное разрешение экрана)
-            fmt='jpeg',
-            size=(800, None)  # Ограничиваем ширину изображения 800 пикселями
-        )
-        return images
+        return render_pdf_pages(pdf_file.read())
     except Exception as e:
         st.error(f"Ошибка при конвертации PDF в изображения: {e}")
         return None
 
-def display_pdf(pdf_file):
-    images = convert_pdf_to_images(pdf_file)
+@st.cache_data(max_entries=16, show_spinner=False)
+def _pdf_pages_by_hash(file_hash):
+    # Страницы одного и того же PDF не рендерятся заново при каждом перезапуске
+    pdf_bytes = get_blob_store().get(file_hash)
+    return render_pdf_pages(pdf_bytes) if pdf_bytes is not None else None
+
+def display_pdf(pdf_file, file_hash=None):
+    if file_hash is not None:
+        try:
+            images = _pdf_pages_by_hash(file_hash)
+        except Exception as e:
+            st.error(f"Ошибка при конвертации PDF в изображения: {e}")
+            images = None
+    else:
+        images = convert_pdf_to_images(pdf_file)
     if images:
         # Создаем вкладки для каждой страницы PDF
         if len(images) > 1:
@@ -359,6 +455,8 @@ def display_pdf(pdf_file):
     else:
         # Запасной вариант
         try:
+            if pdf_file is None:
+                pdf_file = io.BytesIO(get_blob_store().get(file_hash))
             pdf_file.seek(0)
             base64_pdf = base64.b64encode(pdf_file.read()).decode("utf-8")
             pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="600px" type="application/pdf"></iframe>'
@@ -366,131 +464,616 @@ def display_pdf(pdf_file):
         except Exception as e:
             st.error(f"Не удалось отобразить PDF: {e}")
 
-def extract_resume_info(text):
-    info = {
-        "phone": "-",
-        "position": "-",
-        "city": "-",
-        "age": "-",
-        "gender": "-",
-        "salary": "-"
+# --- Хранилище кандидатов ---
+@st.cache_resource
+def get_candidate_store():
+    return CandidateStore()
+
+@st.cache_resource
+def get_blob_store():
+    # PDF лежат на диске под sha256, в сессии хранятся только хеши
+    return BlobStore()
+
+def backfill_in_background(name, index_missing, message):
+    # Догонка индекса по старым кандидатам идет в фоне: первая страница не ждет разбора всей базы.
+    # Новые кандидаты индексируются при сохранении, повторная запись одного id безопасна
+    def run():
+        try:
+            indexed = index_missing()
+        except Exception:
+            logger.exception("Ошибка фоновой индексации %s", name)
+            return
+        if indexed:
+            logger.info(message, indexed)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+
+@st.cache_resource
+def get_search_index():
+    # Индекс ссылается на таблицу кандидатов, поэтому она создается первой
+    get_candidate_store()
+    index = SearchIndex()
+    backfill_in_background("search-backfill", index.index_missing,
+                           "В поисковый индекс добавлено %d ранее оцененных резюме")
+    return index
+
+@st.cache_resource
+def get_duplicate_index():
+    get_candidate_store()
+    index = DuplicateIndex()
+    backfill_in_background("dedup-backfill", index.index_missing,
+                           "Построены MinHash-подписи для %d ранее оцененных резюме")
+    return index
+
+@st.cache_resource
+def get_feature_store():
+    get_candidate_store()
+    return FeatureStore()
+
+@st.cache_resource
+def get_memory_monitor():
+    monitor = MemoryMonitor()
+    monitor.start()
+    return monitor
+
+@st.cache_resource
+def get_quarantine():
+    get_candidate_store()
+    return Quarantine()
+
+def current_owner():
+    return st.session_state.username
+
+def save_candidates(store, owner, candidates):
+    return ingest.save_candidates(store, owner, candidates, get_search_index(), get_duplicate_index(),
+                                  get_feature_store())
+
+# Колонки хранилища -> колонки таблицы результатов
+DISPLAY_COLUMNS = {
+    "id": "row_id",
+    "file_name": "Файл",
+    "probability": "raw_proba",
+    "phone": "Телефон",
+    "position": "Желаемая должность",
+    "city": "Город",
+    "age": "Возраст",
+    "gender": "Пол",
+    "salary": "Зарплата",
+    "comment": "Комментарий"
+}
+EXPORT_COLUMNS = [
+    "Файл", "Вероятность класса 1", "Телефон", "Желаемая должность",
+    "Город", "Возраст", "Пол", "Зарплата", "Комментарий"
+]
+
+# --- Таблица результатов ---
+RESULTS_GRID_COLUMNS = [0.1, 1.5, 0.8, 0.8, 1.5, 0.8, 0.8, 0.8, 2, 0.3]
+RESULTS_PAGE_SIZES = [25, 50, 100]
+SORT_OPTIONS = {
+    "Вероятность ↓": ("probability", False),
+    "Вероятность ↑": ("probability", True),
+    "ФИО": ("file_name", True),
+    "Дата загрузки": ("ingested_at", False)
+}
+
+# Стили таблицы подключаются один раз на страницу, строки ссылаются на классы
+RESULTS_GRID_CSS = """
+<style>
+    .row-green, .row-yellow, .row-red {
+        padding: 5px;
+        overflow-wrap: break-word;
     }
-    phone_match = re.search(r'\+7\s*\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}', text)
-    if phone_match:
-        info["phone"] = phone_match.group()
-    position_match = re.search(r"[жЖ]елаемая должность и зарплата\s*[:—]?\s*\s*(.*?)(?=\n|$)", text, re.IGNORECASE | re.DOTALL)
-    if position_match:
-        info["position"] = position_match.group(1).strip()
-    city_match = re.search(r'(Москва|Санкт-Петербург|Екатеринбург|Казань|Новосибирск|Самара|Омск|Челябинск)', text)
-    if city_match:
-        info["city"] = city_match.group(1)
-    age_match = re.search(r',\s(\d{2})\s*(год|лет|года),', text)
-    if age_match:
-        info["age"] = age_match.group(1)
-    if 'женщина,' in text.lower()[:500]:
-        info["gender"] = "Женщина"
-    elif 'мужчина,' in text.lower()[:500]:
-        info["gender"] = "Мужчина"
-    salary_match = re.search(r'\d{2,3}\s*(000|т.р.)\s*(₽|р|руб)', text)
-    if salary_match:
-        info["salary"] = re.sub(r'\D', '', salary_match.group(0))
-    return info
-
-def preprocess_resume(text):
-    cover_idx = text.lower().find("сопроводительное письмо")
-    position_idx = text.lower().find("желаемая должность и зарплата")
-    if cover_idx != -1:
-        text = text[cover_idx:]
-    elif position_idx != -1:
-        text = text[position_idx:]
-    text = re.sub(r'Сопроводительное письмо', '[COVER]', text, flags=re.IGNORECASE)
-    text = re.sub(r'Желаемая должность и зарплата', '[POSITION]', text, flags=re.IGNORECASE)
-    text = re.sub(r'Специализации', '[SPECIALIZATIONS]', text, flags=re.IGNORECASE)
-    text = re.sub(r'Занятость:.*?Опыт работы —', 'Опыт работы —', text, flags=re.DOTALL)
-    text = text.split('История общения с кандидатом')[0]
-    text = re.sub(r'\S+@\S+', ' ', text)
-    text = re.sub(r'\+7\s*\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}', ' ', text)
-    text = re.sub(r'http\S+|www\.\S+|\S+\.ru|\S+\.com', ' ', text)
-    months = r'(январ[ья]|феврал[ья]|марта?|апрел[ья]|ма[йя]|июн[ья]|июл[ья]|август[а]?|сентябр[ья]|октябр[ья]|ноябр[ья]|декабр[ья])'
-    text = re.sub(rf'{months}\s+\d{{4}}\s*[—-]\s*{months}\s+\d{{4}}', ' ', text, flags=re.IGNORECASE)
-    text = re.sub(rf'{months}\s+\d{{4}}', ' ', text, flags=re.IGNORECASE)
-    text = re.sub(r'\b\d{1,2}[./]\d{1,2}[./]\d{2,4}\b', ' ', text)
-    text = re.sub(r'\b\d{4}\b', ' ', text)
-    text = re.sub(r'\b\d+\b', ' ', text)
-    text = re.sub(r'<.*?>', ' ', text)
-    text = text.translate(str.maketrans('', '', string.punctuation + '•–—'))
-    replacements = {
-        r'Навыки': '[SKILLS]',
-        r'Обо мне': '[ABOUT]',
-        r'Опыт работы': '[EXPERIENCE]',
-        r'Образование': '[EDUCATION]',
-        r'Знание языков': '[LANGUAGES]',
-        r'Дополнительная информация': '[EXTRA]',
+    .row-green { background-color: #ccffcc; }
+    .row-yellow { background-color: #fff6cc; }
+    .row-red { background-color: #ffcccc; }
+    div[data-testid="stButton"] > button {
+        background-color: transparent;
+        font-size: 12px;
+        padding: 1px 6px;
+        border: 1px solid #9e9e9e;
+        border-radius: 4px;
+        color: #505050;
+        height: auto;
     }
-    for pattern, tag in replacements.items():
-        text = re.sub(pattern, tag, text, flags=re.IGNORECASE)
-    text = text.lower()
-    words = re.findall(r'\b\w+\b', text)
-    processed_words = []
-    for word in words:
-        if word not in custom_stopwords:
-            lemma = morph.parse(word)[0].normal_form
-            stem = stemmer.stem(lemma)
-            processed_words.append(stem)
-    if len(processed_words) > 2:
-        processed_words = processed_words[:-2]
-    return ' '.join(processed_words)
-
-def extract_features(text, feature_dict):
-    text = text.lower()
-    return {
-        category: sum(int(re.search(pattern, text) is not None) for pattern in patterns)
-        for category, patterns in feature_dict.items()
+    div[data-testid="stButton"] > button:hover {
+        border-color: #6e6e6e;
+        color: #303030;
     }
+</style>
+"""
 
-def extract_resume_features(text):
-    clean_text = text.replace('\n', ' ').replace('\r', ' ').lower()
-    try:
-        features = {
-            'gender': 1 if 'женщина,' in clean_text[:500] else (-1 if 'мужчина,' in clean_text[:500] else 0),
-            'age': int(re.search(r',\s(\d{2})\s*(год|лет|года),', clean_text).group(1)) if re.search(r',\s(\d{2})\s*(год|лет|года),', clean_text) else -1,
-            'salary': int(re.sub(r'\D', '', re.search(r'\d{2,3}\s*(000|т.р.)\s*(₽|р|руб)', clean_text)[0])) if re.search(r'\d{2,3}\s*(000|т.р.)\s*(₽|р|руб)', clean_text) else -1,
-            'student': int('студент' in clean_text or 'учусь' in clean_text or 'очная' in clean_text),
-            'wants_sales_position': int('продаж' in clean_text),
-            'text_length': len(clean_text),
-            'num_digits': sum(c.isdigit() for c in clean_text),
-        }
-        return features
-    except Exception as e:
-        st.warning(f"Ошибка при извлечении признаков из резюме: {e}")
-        return {
-            'gender': 0,
-            'age': -1,
-            'salary': -1,
-            'student': 0,
-            'wants_sales_position': 0,
-            'text_length': len(clean_text),
-            'num_digits': sum(c.isdigit() for c in clean_text),
+def build_results_frame(rows, thresholds):
+    result_df = pd.DataFrame(rows, columns=LIST_COLUMNS).rename(columns=DISPLAY_COLUMNS)
+    result_df["raw_proba"] = pd.to_numeric(result_df["raw_proba"], errors='coerce').fillna(0.0)
+    result_df["bucket"] = assign_buckets(result_df["raw_proba"].to_numpy(), thresholds)
+    return result_df
+
+def format_display_df(result_df):
+    display_df = result_df.copy()
+    display_df["Файл"] = display_df["Файл"].str.replace('.pdf', '', regex=False)
+    display_df["Вероятность класса 1"] = display_df["raw_proba"].map("{:.2f}".format)
+    display_df["Зарплата"] = display_df["Зарплата"].apply(lambda x: f"{int(x):,}".replace(',', ' ') if str(x).isdigit() else x)
+    return display_df[EXPORT_COLUMNS]
+
+def _set_selection(row_ids, selected):
+    if selected:
+        st.session_state.selected_rows |= set(row_ids)
+    else:
+        st.session_state.selected_rows -= set(row_ids)
+
+def _on_group_toggle(key, proba_ranges):
+    # Идентификаторы группы выбираются запросом к хранилищу только при переключении
+    row_ids = get_candidate_store().ids(current_owner(), proba_ranges)
+    _set_selection(row_ids, st.session_state[key])
+
+def _on_row_toggle(row_id):
+    _set_selection([row_id], st.session_state[f"select_{row_id}"])
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _results_page(owner, version, thresholds_key, offset, limit, order_by, ascending, proba_ranges):
+    # version - версия данных владельца в хранилище: после записи старые страницы не используются
+    store = get_candidate_store()
+    rows = store.page(owner, offset=offset, limit=limit, order_by=order_by, ascending=ascending,
+                      proba_ranges=proba_ranges)
+    page_df = build_results_frame(rows, dict(thresholds_key))
+    return page_df, format_display_df(page_df)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _results_count(owner, version, proba_ranges):
+    return get_candidate_store().count(owner, proba_ranges)
+
+@st.fragment
+def results_panel(owner, thresholds):
+    """
+    Поиск, таблица, выделение и отправка в AmoCRM. Клик по чекбоксу или фильтру
+    перезапускает только этот фрагмент, а не весь скрипт.
+    """
+    store = get_candidate_store()
+    with metrics.timer("results_panel_render"):
+        render_search(store, owner)
+        render_results_grid(store, owner, thresholds)
+
+    # Добавляем информацию о количестве выбранных резюме
+    if st.session_state.selected_rows:
+        selected_count = len(st.session_state.selected_rows)
+        st.write(f"Выбрано: {selected_count} резюме")
+
+        # Кнопка для отправки выбранных резюме в AmoCRM
+        if st.button(f"Отправить выбранные резюме в AmoCRM ({selected_count})"):
+            if send_to_amocrm(store, owner, st.session_state.selected_rows):
+                st.success(f"Выбранные резюме ({selected_count}) успешно отправлены в AmoCRM!")
+    else:
+        # Обычная кнопка отправки всех данных в AmoCRM
+        if st.button("Отправить все данные в AmoCRM"):
+            success = send_to_amocrm(store, owner)
+            if success:
+                st.success("Данные успешно отправлены в AmoCRM!")
+
+def render_results_grid(store, owner, thresholds):
+    st.markdown(RESULTS_GRID_CSS, unsafe_allow_html=True)
+    labels = bucket_labels(thresholds)
+    ranges = bucket_ranges(thresholds)
+
+    # Групповое выделение
+    col1, col2, col3 = st.columns([1, 1, 1])
+    col1.checkbox("Выделить всех", key="select_all", on_change=_on_group_toggle,
+                  args=("select_all", None))
+    col2.checkbox(labels["green"], key="green_filter", on_change=_on_group_toggle,
+                  args=("green_filter", [ranges["green"]]))
+    col3.checkbox(labels["yellow"], key="yellow_filter", on_change=_on_group_toggle,
+                  args=("yellow_filter", [ranges["yellow"]]))
+
+    # Фильтр отображения, сортировка и размер страницы
+    ctrl1, ctrl2, ctrl3 = st.columns([2, 1, 1])
+    shown_buckets = ctrl1.multiselect("Показывать", list(labels), default=list(labels),
+                                      format_func=labels.get, key="bucket_view")
+    sort_label = ctrl2.selectbox("Сортировка", list(SORT_OPTIONS), key="results_sort")
+    page_size = ctrl3.selectbox("Строк на странице", RESULTS_PAGE_SIZES, key="results_page_size")
+
+    proba_ranges = [ranges[bucket] for bucket in shown_buckets]
+    version = store.version(owner)
+    total = _results_count(owner, version, proba_ranges)
+    n_pages = max(1, -(-total // page_size))
+    if st.session_state.get("results_page", 1) > n_pages:
+        st.session_state.results_page = n_pages
+    page = st.number_input(f"Страница (всего {n_pages}, строк {total})", min_value=1,
+                           max_value=n_pages, step=1, key="results_page")
+
+    # Из хранилища читается только текущая страница, готовые таблицы кешируются
+    order_by, ascending = SORT_OPTIONS[sort_label]
+    page_df, display_page = _results_page(owner, version, tuple(sorted(thresholds.items())),
+                                          (page - 1) * page_size, page_size, order_by, ascending,
+                                          proba_ranges)
+
+    # Состояние чекбоксов нужно только строкам текущей страницы, ключи прошлых страниц удаляются
+    page_keys = {f"select_{int(row_id)}" for row_id in page_df["row_id"]}
+    for key in [key for key in st.session_state
+                if key.startswith("select_") and key[len("select_"):].isdigit() and key not in page_keys]:
+        del st.session_state[key]
+
+    cols = st.columns(RESULTS_GRID_COLUMNS)
+    for col, title in zip(cols, ["", "ФИО", "Вероятность", "Возраст", "Телефон", "Город", "Пол", "Зарплата", "Комментарий", ""]):
+        col.write(title)
+
+    for row_id, bucket, file_name, file_hash, row in zip(page_df["row_id"], page_df["bucket"], page_df["Файл"],
+                                                         page_df["file_hash"], display_page.to_dict("records")):
+        row_id = int(row_id)
+        row_cols = st.columns(RESULTS_GRID_COLUMNS)
+        css_class = f"row-{bucket}"
+
+        # Состояние чекбокса берется из выделения, изменения приходят через callback
+        select_key = f"select_{row_id}"
+        st.session_state[select_key] = row_id in st.session_state.selected_rows
+        row_cols[0].checkbox("Выбрать", key=select_key, on_change=_on_row_toggle, args=(row_id,),
+                             label_visibility="collapsed")
+
+        for col, field in zip(row_cols[1:9], ["Файл", "Вероятность класса 1", "Возраст", "Телефон",
+                                              "Город", "Пол", "Зарплата", "Комментарий"]):
+            col.markdown(f'<div class="{css_class}">{row[field]}</div>', unsafe_allow_html=True)
+
+        if row_cols[9].button("PDF", key=f"pdf_{row_id}", help="Просмотр резюме"):
+            if file_hash and get_blob_store().exists(file_hash):
+                st.session_state.selected_pdf = {"hash": file_hash, "name": file_name, "candidate_id": row_id}
+                st.rerun(scope="app")  # Перезагрузить страницу для отображения PDF
+            else:
+                st.info("PDF этого резюме больше не хранится на сервере")
+
+# --- Поиск по резюме ---
+SEARCH_MODES = {
+    "По релевантности": "ranked",
+    "Логический (ИЛИ, -исключить, \"фраза\")": "boolean"
+}
+
+def render_search(store, owner):
+    col1, col2 = st.columns([3, 1])
+    query = col1.text_input("Поиск по резюме", key="search_query",
+                            placeholder='Например: 1С "холодные звонки" Москва')
+    mode = col2.selectbox("Режим поиска", list(SEARCH_MODES), key="search_mode")
+    if not query.strip():
+        return
+
+    started = time.perf_counter()
+    with metrics.timer("search_query"):
+        hits = get_search_index().search(owner, query, SEARCH_MODES[mode])
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if not hits:
+        st.info(f"Ничего не найдено ({elapsed_ms:.0f} мс)")
+        return
+
+    relevance = dict(hits)
+    rows = {row["id"]: row for row in store.fetch_by_ids(list(relevance))}
+    found_df = pd.DataFrame([
+        {
+            "Файл": rows[candidate_id]["file_name"].replace('.pdf', ''),
+            "Релевантность": score,
+            "Вероятность класса 1": round(rows[candidate_id]["probability"], 2),
+            "Телефон": rows[candidate_id]["phone"],
+            "Город": rows[candidate_id]["city"],
+            "Комментарий": rows[candidate_id]["comment"]
         }
+        for candidate_id, score in hits if candidate_id in rows
+    ])
+    st.caption(f"Найдено: {len(found_df)} ({elapsed_ms:.0f} мс)")
+    st.dataframe(found_df, use_container_width=True, hide_index=True)
+    st.button("Выделить найденных", key="select_found", on_click=_set_selection,
+              args=(list(relevance), True))
+
+# --- Оценка резюме ---
+# Размер первой порции: первые результаты видны через несколько секунд
+PROGRESS_FIRST_CHUNK = 4
+PREVIEW_TOP_N = 10
+
+def score_pdf_batch(pdf_items, model, scaler, tfidf, threshold, owner=None, model_version=None):
+    """
+    Оценивает пачку PDF: pdf_items - итерируемое пар (имя файла, байты PDF).
+
+    Признаки всех документов собираются в одну разреженную матрицу,
+    модель вызывается одним пакетом. Если задан SCORING_SERVICE_URL,
+    оценка выполняется общим сервисом (scoring_service.py): ему уходят уже
+    подготовленные документы, модель и векторизатор есть только у сервиса,
+    model, scaler и tfidf могут быть None.
+    Если передан owner, почти одинаковые резюме (среди уже сохраненных у
+    владельца и с почты, см. ingest.dedup_owners, и внутри пачки) не оцениваются: они помечаются ключом
+    duplicate_of - id сохраненного кандидата или словарь представителя из пачки. Копии резюме
+    из чужой таблицы оцениваются и сохраняются у владельца, см. ingest.mark_duplicates.
+    model_version записывается в каждую оцененную строку.
+    """
+    items = []
+    documents = []
+    for file_name, pdf_bytes in pdf_items:
+        # PDF сразу уходит в хранилище на диске, дальше работаем только с хешем
+        with metrics.timer("blob_store_put"):
+            file_hash = get_blob_store().put(pdf_bytes)
+        items.append((file_name, file_hash))
+        documents.append(pdf_bytes)
+
+    # Разбор и предобработка идут в изолированных процессах с лимитами,
+    # PDF из карантина не обрабатываются вовсе
+    quarantine = get_quarantine()
+    blocked = quarantine.blocked({file_hash for _, file_hash in items})
+    metrics.count("documents_quarantined", sum(1 for _, file_hash in items if file_hash in blocked))
+    positions = [position for position, (_, file_hash) in enumerate(items) if file_hash not in blocked]
+    with metrics.timer("isolated_analysis", documents=len(positions)):
+        analyses = dict(zip(positions, analyze_documents([documents[position] for position in positions])))
+    candidates, scored, prepared = ingest.build_candidates(
+        items, analyses, lambda file_hash: f"файл в карантине: {blocked[file_hash]}")
+    quarantine.record_failures(ingest.quarantine_failures(candidates))
+
+    if scored and owner is not None:
+        unique = ingest.mark_duplicates(scored, owner, get_duplicate_index())
+        prepared = [prepared[position] for position in unique]
+        scored = [scored[position] for position in unique]
+
+    if not scored:
+        return candidates
+    if SCORING_SERVICE_URL:
+        # Признаки собирает и сохраняет сервис своим векторизатором, объяснения - от его модели
+        with metrics.timer("scoring_service_request", documents=len(scored)):
+            response = score_prepared_remote(prepared, [candidate["file_hash"] for candidate in scored])
+        ingest.apply_scores(scored, response["probabilities"], response["explanations"], threshold,
+                            response.get("model_version") or "service")
+    else:
+        # Признаки остаются в кандидатах и сохраняются вместе с ними (ingest.save_candidates)
+        ingest.score_candidates(scored, prepared, model, scaler, tfidf, threshold, model_version)
+    return candidates
+
+# --- Оценка через очередь заданий ---
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+def enqueue_pdf_batch(pdf_items, threshold):
+    """
+    Кладет PDF в общее хранилище и ставит задание оценки. Возвращает номер
+    задания (None, если ставить нечего) и строки для файлов из карантина.
+    """
+    items = []
+    for file_name, pdf_bytes in pdf_items:
+        with metrics.timer("blob_store_put"):
+            items.append((file_name, get_blob_store().put(pdf_bytes)))
+    blocked = get_quarantine().blocked({file_hash for _, file_hash in items})
+    rejected = []
+    for file_name, file_hash in items:
+        if file_hash in blocked:
+            metrics.count("documents_quarantined")
+            rejected.append(ingest.error_candidate(file_name, file_hash, f"файл в карантине: {blocked[file_hash]}"))
+    accepted = [(file_name, file_hash) for file_name, file_hash in items if file_hash not in blocked]
+    if not accepted:
+        return None, rejected
+    job_id, = get_job_queue().enqueue(SCORE_PDFS, [{"items": accepted, "threshold": threshold}])
+    return job_id, rejected
+
+def collect_pdf_job(job, owner):
+    return collect_job(job, owner, get_duplicate_index(), get_quarantine())
+
+# --- Общий исполнитель оценки ---
+@st.cache_resource
+def get_scheduler():
+    # Один на процесс: число одновременно оцениваемых порций не зависит от числа сессий
+    return FairScheduler()
+
+def score_chunk(pdf_items, bundle, threshold, owner):
+    # Выполняется в потоке исполнителя, без элементов страницы; bundle - None при оценке сервисом
+    with metrics.timer("ingest_chunk_total", documents=len(pdf_items)):
+        if bundle is None:
+            return score_pdf_batch(pdf_items, None, None, None, threshold, owner)
+        return score_pdf_batch(pdf_items, bundle.model, bundle.scaler, bundle.tfidf,
+                               threshold, owner, bundle.version)
+
+# --- Фоновая загрузка резюме с почты ---
+# Как часто панель администратора перечитывает состояние опроса почты
+MAIL_STATUS_REFRESH_S = 10
+
+def ingest_mail_files(paths):
+    """Оценивает и сохраняет вложения с почты; вызывается из потока MailPoller, без элементов страницы."""
+    bundle = load_model()
+    if bundle is None and not SCORING_SERVICE_URL:
+        raise RuntimeError("модель не загружена")
+    threshold = load_thresholds()["threshold"]
+    store = get_candidate_store()
+    queue = get_job_queue() if JOB_QUEUE_ENABLED else None
+    for chunk in chunked(paths, JOB_BATCH_FILES if queue is not None else ARCHIVE_CHUNK_FILES):
+        pdf_items = []
+        for file_path in chunk:
+            with open(file_path, "rb") as f:
+                pdf_items.append((os.path.basename(file_path), f.read()))
+        with metrics.timer("mail_ingest_chunk", documents=len(pdf_items)):
+            if queue is None:
+                # Почта - такой же пользователь исполнителя, как и остальные
+                results = get_scheduler().submit(MAIL_OWNER, score_chunk, pdf_items, bundle, threshold,
+                                                 MAIL_OWNER).result()
+            else:
+                job_id, results = enqueue_pdf_batch(pdf_items, threshold)
+                if job_id is not None:
+                    jobs = list(queue.wait([job_id]))
+                    queue.delete([job_id])
+                    if not jobs:
+                        raise TimeoutError(f"очередь не ответила за {JOB_WAIT_TIMEOUT_S:.0f} с")
+                    results += collect_pdf_job(jobs[0], MAIL_OWNER)
+        if results:
+            save_candidates(store, MAIL_OWNER, results)
+    metrics.count("mail_documents_ingested", len(paths))
+
+@st.cache_resource
+def get_mail_poller():
+    # Один поток на сервер, общий для всех сессий
+    poller = MailPoller(ingest_mail_files)
+    if MAIL_POLL_ENABLED:
+        poller.start()
+    return poller
+
+def regenerate_flipped_comments(store, old_threshold, new_threshold):
+    # Класс меняется только у вероятностей между старым и новым порогом, остальные строки не трогаем
+    if old_threshold == new_threshold:
+        return 0
+    lo, hi = flipped_range(old_threshold, new_threshold)
+    updated = 0
+    with metrics.timer("regenerate_flipped_comments"):
+        for rows in store.iter_probability_range(lo, hi):
+            comments = []
+            for row in rows:
+                prediction = 1 if row["probability"] >= new_threshold else 0
+                comment, _ = get_detailed_comment(row["raw_text"], prediction, row["probability"])
+                comments.append((row["id"], comment))
+            store.update_comments(comments)
+            updated += len(comments)
+    metrics.count("comments_regenerated", updated)
+    return updated
+
+def process_pdf_stream(items, total, bundle, thresholds, store, owner):
+    """
+    Оценивает поток PDF порциями и показывает прогресс по мере работы.
+
+    items - итерируемое троек (имя файла, байты или None, ошибка или None),
+    total - число файлов, если известно, bundle - комплект модели на весь прогон.
+    Первая порция маленькая, каждая порция
+    сохраняется сразу, а лучшие кандидаты прогона выводятся, не дожидаясь конца.
+    Порции оцениваются общим исполнителем процесса (scheduler.py) поровну
+    между пользователями, пока ждет порция, показывается место в очереди.
+    При JOB_QUEUE_ENABLED порции оцениваются воркерами очереди параллельно,
+    результаты сохраняются по мере готовности заданий.
+    """
+    errors = []
+    top = []
+    done = 0
+    started = time.perf_counter()
+    progress = st.progress(0.0, text="Обработка файлов...") if total else None
+    status = st.empty() if not total else None
+    preview = st.empty()
+    queue_status = st.empty()
+
+    def record(results, n_files):
+        nonlocal top, done
+        if results:
+            save_candidates(store, owner, results)
+            report_duplicates(results)
+            top = heapq.nlargest(PREVIEW_TOP_N, top + [candidate for candidate in results
+                                                      if not ingest.is_skipped_duplicate(candidate)],
+                                 key=lambda candidate: candidate["probability"])
+        if done == 0 and n_files:
+            metrics.observe("time_to_first_result", time.perf_counter() - started)
+        done += n_files
+
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0.0
+        text = f"Обработано {done}" + (f" из {total}" if total else "") + f" · {rate:.1f} файлов/с"
+        if total and rate:
+            text += f" · осталось ~{max(total - done, 0) / rate:.0f} с"
+        if progress is not None:
+            progress.progress(min(done / total, 1.0), text=text)
+        else:
+            status.write(text)
+        if top:
+            with preview.container():
+                st.write("Лучшие кандидаты на данный момент (уже сохранены в таблицу):")
+                st.dataframe(pd.DataFrame([
+                    {
+                        "Файл": candidate["file_name"].replace('.pdf', ''),
+                        "Вероятность класса 1": round(candidate["probability"], 2),
+                        "Город": candidate["city"],
+                        "Телефон": candidate["phone"]
+                    }
+                    for candidate in top
+                ]), use_container_width=True, hide_index=True)
+
+    scheduler = get_scheduler()
+    inflight = {}  # порция в исполнителе -> файлов в порции
+
+    def drain(limit):
+        # Ждем, пока в работе останется не больше limit порций, и показываем место в очереди
+        while len(inflight) > limit:
+            finished, _ = futures.wait(inflight, timeout=0.5, return_when=futures.FIRST_COMPLETED)
+            for future in finished:
+                record(future.result(), inflight.pop(future))
+            position = scheduler.position(owner)
+            if position is not None:
+                queue_status.info(f"Ожидание обработчика: перед вашей порцией {position} порций других пользователей")
+            else:
+                queue_status.empty()
+        queue_status.empty()
+
+    queue = get_job_queue() if JOB_QUEUE_ENABLED else None
+    pending = {}  # номер задания -> файлы задания
+    chunk_size = JOB_BATCH_FILES if queue is not None else ARCHIVE_CHUNK_FILES
+    for chunk in chunked(items, chunk_size, first_size=PROGRESS_FIRST_CHUNK):
+        pdf_items = []
+        for file_name, pdf_bytes, error in chunk:
+            if error is not None:
+                errors.append(f"{file_name}: {error}")
+            else:
+                pdf_items.append((file_name, pdf_bytes))
+        if queue is None:
+            # Следующая порция уже прочитана, пока предыдущая оценивалась
+            drain(SCHEDULER_STREAM_INFLIGHT - 1)
+            if not pdf_items:
+                record([], len(chunk))
+                continue
+            try:
+                future = scheduler.submit(owner, score_chunk, pdf_items, bundle, thresholds["threshold"], owner)
+            except SchedulerBusy as e:
+                errors.extend(f"{file_name}: сервер перегружен, {e}" for file_name, _ in pdf_items)
+                record([], len(chunk))
+                continue
+            inflight[future] = len(chunk)
+            continue
+
+        job_id, rejected = enqueue_pdf_batch(pdf_items, thresholds["threshold"]) if pdf_items else (None, [])
+        if job_id is not None:
+            pending[job_id] = len(pdf_items) - len(rejected)
+        record(rejected, len(chunk) - pending.get(job_id, 0))
+        # Пока читаются следующие файлы, готовые задания уже сохраняются
+        for job in queue.wait(list(pending), timeout=0):
+            record(collect_pdf_job(job, owner), pending.pop(job["id"]))
+            queue.delete([job["id"]])
+
+    drain(0)
+    if queue is not None:
+        for job in queue.wait(list(pending)):
+            record(collect_pdf_job(job, owner), pending.pop(job["id"]))
+            queue.delete([job["id"]])
+        if pending:
+            # Воркеры не успели: задания снимаются, файлы попадают в список ошибок
+            for job in queue.get(list(pending)):
+                errors.extend(f"{file_name}: очередь не ответила за {JOB_WAIT_TIMEOUT_S:.0f} с"
+                              for file_name, _ in job["payload"]["items"])
+            queue.delete(list(pending))
+            record([], sum(pending.values()))
+    metrics.count("ingest_errors", len(errors))
+    if errors:
+        st.session_state.ingest_errors = errors
+    return done
+
+def report_duplicates(candidates):
+    # Список переживает st.rerun, копится по порциям архива и показывается один раз
+    duplicates = [candidate["file_name"] for candidate in candidates if ingest.is_skipped_duplicate(candidate)]
+    if duplicates:
+        st.session_state.setdefault("duplicate_files", []).extend(duplicates)
 
 # --- Функция отправки в AmoCRM ---
-def send_to_amocrm():
-    if not st.session_state.results or len(st.session_state.results) == 0:
+def write_amocrm_csv(path, pages, thresholds):
+    # CSV пишется постранично, все результаты в память не загружаются
+    written = 0
+    with open(path, "w", newline='', encoding='utf-8') as f:
+        for rows in pages:
+            chunk = format_display_df(build_results_frame(rows, thresholds))
+            chunk.to_csv(f, index=False, header=written == 0)
+            written += len(chunk)
+    return written
+
+def send_to_amocrm(store, owner, candidate_ids=None):
+    if candidate_ids is None:
+        pages = store.iter_pages(owner)
+        temp_csv_path = "temp_results.csv"
+    else:
+        ids = sorted(candidate_ids)
+        pages = (store.fetch_by_ids(ids[i:i + 500]) for i in range(0, len(ids), 500))
+        temp_csv_path = "temp_selected_results.csv"
+
+    # Создаем временный CSV файл с результатами
+    if write_amocrm_csv(temp_csv_path, pages, load_thresholds()) == 0:
         st.error("Нет данных для отправки в AmoCRM. Сначала обработайте файлы.")
         return False
     
-    # Создаем временный CSV файл с результатами
-    result_df = pd.DataFrame(st.session_state.results)
-    result_df["Файл"] = result_df["Файл"].str.replace('.pdf', '', regex=False)
-    result_df["Вероятность класса 1"] = result_df["Вероятность класса 1"].astype(float).map("{:.2f}".format)
-    result_df["Зарплата"] = result_df["Зарплата"].apply(lambda x: f"{int(x):,}".replace(',', ' ') if str(x).isdigit() else x)
-    
-    display_df = result_df.drop(columns=["raw_proba", "raw_text", "prediction_class"], errors="ignore")
-    
-    # Сохраняем DataFrame в CSV
-    temp_csv_path = "temp_results.csv"
-    display_df.to_csv(temp_csv_path, index=False, encoding='utf-8')
-    
     try:
         # Вызываем функцию из amo_script.py
         from amo_script import AmoCRMClient
@@ -499,16 +1082,137 @@ def send_to_amocrm():
             client = AmoCRMClient(temp_csv_path)
             client.process_csv()
         
-        # Удаляем временный CSV файл
-        if os.path.exists(temp_csv_path):
-            os.remove(temp_csv_path)
-        
         return True
     except Exception as e:
         st.error(f"Ошибка при отправке данных в AmoCRM: {e}")
         import traceback
         st.code(traceback.format_exc())
         return False
+    finally:
+        # Удаляем временный CSV файл
+        if os.path.exists(temp_csv_path):
+            os.remove(temp_csv_path)
+
+# --- Объяснение оценки ---
+MANUAL_FEATURE_LABELS = {
+    "sales_experience": "Опыт продаж (ключевые слова)",
+    "hard_skills": "Профессиональные навыки",
+    "soft_skills": "Личные качества",
+    "performance_metrics": "Результаты и показатели",
+    "gender": "Пол",
+    "age": "Возраст",
+    "salary": "Зарплата",
+    "student": "Студент",
+    "wants_sales_position": "Упоминание продаж",
+    "text_length": "Длина текста",
+    "num_digits": "Количество цифр"
+}
+
+def render_explanation(explanation_json):
+    # Вклады признаков посчитаны при оценке пачки, здесь только показываются
+    if not explanation_json:
+        return
+    explanation = json.loads(explanation_json)
+    if not explanation:
+        return
+    st.write("Что повлияло на оценку модели:")
+    st.dataframe(pd.DataFrame([
+        {
+            "Признак": (MANUAL_FEATURE_LABELS.get(item["feature"], item["feature"]) if item["kind"] == "manual"
+                        else f"слово «{item['feature']}»"),
+            "Значение": item["value"],
+            "Влияние": "повышает" if item["contribution"] > 0 else "понижает",
+            "Вклад": item["contribution"]
+        }
+        for item in explanation
+    ]), use_container_width=True, hide_index=True)
+
+def refresh_explanation(candidate):
+    """
+    Объяснение, сброшенное пересчетом вероятностей (feature_store rescore), считается
+    при первом просмотре по сохраненным признакам и записывается в строку кандидата.
+    """
+    bundle = load_model()
+    # Объяснение другой модели не соответствует сохраненной вероятности
+    if bundle is None or candidate.get("model_version") != bundle.version:
+        return None
+    manual_keys = manual_feature_names()
+    _, features = get_feature_store().get(vectorizer_version(bundle.tfidf, manual_keys), [candidate["file_hash"]])
+    if features is None:
+        return None
+    explanation, = explain_features(features, bundle.model, bundle.scaler, manual_keys, bundle.tfidf)
+    get_candidate_store().update_explanations([(candidate["id"], explanation)])
+    return json.dumps(explanation, ensure_ascii=False)
+
+# --- Просмотр PDF и выгрузка ---
+@st.fragment
+def pdf_viewer():
+    selected_pdf = st.session_state.selected_pdf
+    st.divider()
+    st.subheader(f"📄 Просмотр: {selected_pdf['name']}")
+    if get_blob_store().exists(selected_pdf['hash']):
+        display_pdf(None, file_hash=selected_pdf['hash'])
+    else:
+        st.warning("PDF удален из хранилища на сервере")
+
+    # Информация о кандидате
+    candidate = get_candidate_store().get(selected_pdf['candidate_id'])
+    # Поля анкеты извлечены при загрузке и хранятся в строке кандидата, текст заново не разбирается
+    candidate = candidate or {}
+    info_df = pd.DataFrame({
+        "Поле": ["Телефон", "Должность", "Город", "Возраст", "Пол", "Зарплата", "Версия модели"],
+        "Значение": [
+            candidate.get(column) or "-"
+            for column in ("phone", "position", "city", "age", "gender", "salary", "model_version")
+        ]
+    })
+    st.table(info_df)
+    if candidate.get("duplicate_of"):
+        st.caption(f"Это резюме уже загружено в таблицу другого пользователя (кандидат №{candidate['duplicate_of']})")
+    explanation = candidate.get("explanation")
+    if explanation is None and candidate.get("file_hash"):
+        explanation = refresh_explanation(candidate)
+    render_explanation(explanation)
+
+    duplicates = get_duplicate_index().duplicates_of(selected_pdf['candidate_id'])
+    if duplicates:
+        st.write(f"Дубликаты этого резюме: {len(duplicates)}")
+        st.dataframe(pd.DataFrame([
+            {"Файл": duplicate["file_name"], "Сходство": round(duplicate["similarity"], 2)}
+            for duplicate in duplicates
+        ]), use_container_width=True, hide_index=True)
+
+    # Кнопка закрыть просмотр PDF: перезапускается вся страница
+    if st.button("Закрыть просмотр PDF"):
+        del st.session_state.selected_pdf
+        st.rerun(scope="app")
+
+@st.fragment
+def excel_export_panel(owner, thresholds):
+    # Excel формируется только по запросу и кешируется по версии данных и порогам
+    store = get_candidate_store()
+    results_version = (store.version(owner), tuple(sorted(thresholds.items())))
+    excel_export = st.session_state.get("excel_export")
+    if excel_export and excel_export["version"] == results_version:
+        metrics.cache_hit("excel_export", True)
+        st.download_button(
+            label="Скачать результаты (Excel)",
+            data=excel_export["data"],
+            file_name="predictions.xlsx",
+            mime=EXCEL_MIME
+        )
+    elif st.button("Сформировать Excel", key="build_excel"):
+        metrics.cache_hit("excel_export", False)
+        with st.spinner("Формирование Excel..."), metrics.timer("excel_export"):
+            export_df = pd.concat(
+                [format_display_df(build_results_frame(rows, thresholds)) for rows in store.iter_pages(owner)],
+                ignore_index=True
+            )
+            st.session_state.excel_export = {
+                "version": results_version,
+                "data": build_excel_export(export_df, thresholds["threshold"], thresholds["green_threshold"])
+            }
+        st.rerun(scope="fragment")
 
 # --- Страница авторизации ---
 def login_page():
@@ -527,7 +1231,9 @@ def login_page():
 
 
 def main_app():
-    model, scaler, tfidf = load_model()
+    bundle = load_model()
+    store = get_candidate_store()
+    owner = current_owner()
     st.title("Классификация резюме менеджеров по продажам")
     st.markdown("### Фокус: поиск кандидатов с опытом телефонных продаж")
     
@@ -541,263 +1247,37 @@ def main_app():
             del st.session_state.selected_pdf
         st.session_state.reset_pdf = False
     
-    THRESHOLD = 0.19
+    thresholds = load_thresholds()
     uploaded_files = st.file_uploader("Загрузите PDF-файлы", type="pdf", accept_multiple_files=True)
+    if st.session_state.get("duplicate_files"):
+        duplicates = st.session_state.pop("duplicate_files")
+        st.info(f"Пропущено дубликатов уже загруженных резюме: {len(duplicates)} "
+                f"({', '.join(duplicates[:10])}{', ...' if len(duplicates) > 10 else ''})")
+    if st.session_state.get("ingest_errors"):
+        ingest_errors = st.session_state.pop("ingest_errors")
+        with st.expander(f"Не удалось прочитать файлов: {len(ingest_errors)}"):
+            st.text("\n".join(ingest_errors))
     
     if uploaded_files and st.button("Обработать файлы"):
-        results = []
-        with st.spinner("Обработка файлов..."):
-            for file in uploaded_files:
-                file.seek(0)
-                raw_text = extract_text_from_pdf(file)
-                if "[Ошибка]" in raw_text:
-                    results.append({
-                        "Файл": file.name,
-                        "Вероятность класса 1": 0,
-                        "Телефон": "-",
-                        "Желаемая должность": "-",
-                        "Город": "-",
-                        "Возраст": "-",
-                        "Пол": "-",
-                        "Зарплата": "-",
-                        "Комментарий": f"Ошибка обработки файла: {raw_text}"
-                    })
-                    continue
-                st.session_state.processed_files[file.name] = {
-                    "file": file,
-                    "raw_text": raw_text
-                }
-                info = extract_resume_info(raw_text)
-                processed_text = preprocess_resume(raw_text)
-                keyword_features = extract_features(processed_text, features)
-                resume_features = extract_resume_features(raw_text)
-                manual_df = pd.DataFrame([keyword_features | resume_features])
-                tfidf_features = tfidf.transform([processed_text]).toarray()
-                combined_features = np.hstack([manual_df.values, tfidf_features])
-                scaled_features = scaler.transform(combined_features)
-                proba = model.predict_proba(scaled_features)[0]
-                raw_proba = proba[1]
-                prediction = 1 if raw_proba >= THRESHOLD else 0
-                comment, is_red_flag = get_detailed_comment(raw_text, prediction, raw_proba)
-                
-                results.append({
-                    "Файл": file.name,
-                    "Вероятность класса 1": raw_proba,
-                    "Телефон": info["phone"],
-                    "Желаемая должность": info["position"],
-                    "Город": info["city"],
-                    "Возраст": info["age"],
-                    "Пол": info["gender"],
-                    "Зарплата": info["salary"],
-                    "Комментарий": comment,
-                    "raw_proba": raw_proba,
-                    "raw_text": raw_text
-                })
-        st.session_state.results = results
-        st.session_state.has_processed_files = True
+        with metrics.timer("upload_batch_total", documents=len(uploaded_files)):
+            process_pdf_stream(((file.name, file.getvalue(), None) for file in uploaded_files),
+                               len(uploaded_files), bundle, thresholds, store, owner)
+        enforce_session_memory(force=True)
         st.rerun()  # Перезагружаем страницу после обработки файлов
+
+    archive = st.file_uploader("Или загрузите архив с резюме (ZIP, TAR)", type=ARCHIVE_TYPES, key="archive_upload")
+    if archive is not None and st.button("Обработать архив"):
+        process_pdf_stream(iter_archive(archive, archive.name), archive_member_count(archive, archive.name),
+                           bundle, thresholds, store, owner)
+        enforce_session_memory(force=True)
+        st.rerun()
     
     # Этот блок должен быть вне условия обработки файлов, чтобы выполняться при каждой загрузке страницы
-    if st.session_state.has_processed_files and st.session_state.results:
-        for r in st.session_state.results:
-            r["prediction_class"] = 1 if r["raw_proba"] >= THRESHOLD else 0
-            if "raw_text" in r:
-                r["Комментарий"], is_red_flag = get_detailed_comment(r["raw_text"], r["prediction_class"], r["raw_proba"])
-        
-        # Создаем DataFrame из результатов
-        result_df = pd.DataFrame(st.session_state.results)
-        
-        # Убедимся, что raw_proba имеет числовой тип
-        result_df["raw_proba"] = pd.to_numeric(result_df["raw_proba"], errors='coerce')
-        
-        # Сортировка по вероятности от высокой к низкой
-        result_df = result_df.sort_values(by="raw_proba", ascending=False).reset_index(drop=True)
-        
-        # Продолжаем с обычным форматированием
-        result_df["Файл"] = result_df["Файл"].str.replace('.pdf', '', regex=False)
-        result_df["Вероятность класса 1"] = result_df["raw_proba"].astype(float).map("{:.2f}".format)
-        result_df["Зарплата"] = result_df["Зарплата"].apply(lambda x: f"{int(x):,}".replace(',', ' ') if str(x).isdigit() else x)
-    
+    if store.count(owner):
         # Создаем контейнер для результатов
         st.write("### Результаты анализа")
-    
-        # Добавляем чекбокс "Выделить всех"
-        col1, col2, col3 = st.columns([1, 1, 1])
-        with col1:
-            if st.checkbox("Выделить всех", key="select_all"):
-                st.session_state.selected_rows = set(range(len(result_df)))
-            else:
-                if len(st.session_state.selected_rows) == len(result_df):  # Если все выбраны, снимаем выбор
-                    st.session_state.selected_rows = set()
-    
-        # Добавляем фильтры по цветовым категориям
-        with col2:
-            if st.checkbox("Зеленые (≥81%)", key="green_filter"):
-                green_indices = set(result_df[result_df["Вероятность класса 1"].astype(float) >= 0.81].index)
-                st.session_state.selected_rows = st.session_state.selected_rows.union(green_indices)
-    
-        with col3:
-            if st.checkbox("Желтые (19-80%)", key="yellow_filter"):
-                yellow_indices = set(result_df[
-                    (result_df["Вероятность класса 1"].astype(float) >= 0.19) & 
-                    (result_df["Вероятность класса 1"].astype(float) < 0.81)
-                ].index)
-                st.session_state.selected_rows = st.session_state.selected_rows.union(yellow_indices)
-        
-        # Создаем пользовательскую таблицу с чекбоксами и кнопками PDF
-        cols = st.columns([0.1, 1.5, 0.8, 0.8, 1.5, 0.8, 0.8, 0.8, 2, 0.3])
-        cols[0].write("") # Пустой заголовок для чекбоксов
-        cols[1].write("ФИО")
-        cols[2].write("Вероятность")
-        cols[3].write("Возраст")
-        cols[4].write("Телефон")
-        cols[5].write("Город")
-        cols[6].write("Пол")
-        cols[7].write("Зарплата")
-        cols[8].write("Комментарий")
-        cols[9].write("") # Пустой заголовок для кнопок PDF
-        
-        # Создаем строки для каждого резюме
-        display_df = result_df.drop(columns=["raw_proba", "raw_text", "prediction_class"], errors="ignore")
-        
-        for idx, row in display_df.iterrows():
-            # Определяем цвет фона строки в зависимости от вероятности
-            try:
-                prob = float(row["Вероятность класса 1"].replace(',', '.'))
-            except:
-                prob = 0
-            
-            if prob >= 0.81:
-                bg_color = "#ccffcc"  # зеленый
-            elif prob < 0.19:
-                bg_color = "#ffcccc"  # красный
-            else:
-                bg_color = "#fff6cc"  # желтый
-            
-            # Создаем строку для каждого резюме
-            row_cols = st.columns([0.1, 1.5, 0.8, 0.8, 1.5, 0.8, 0.8, 0.8, 2, 0.3])
-            
-            # Чекбокс для выбора
-            is_selected = idx in st.session_state.selected_rows
-            if row_cols[0].checkbox("", key=f"select_{idx}", value=is_selected):
-                st.session_state.selected_rows.add(idx)
-            else:
-                if idx in st.session_state.selected_rows:
-                    st.session_state.selected_rows.remove(idx)
-            
-            # Данные о кандидате
-            name = row["Файл"].replace(".pdf", "")
-            row_cols[1].markdown(f'<div style="background-color:{bg_color}; padding:5px;">{name}</div>', unsafe_allow_html=True)
-            row_cols[2].markdown(f'<div style="background-color:{bg_color}; padding:5px;">{row["Вероятность класса 1"]}</div>', unsafe_allow_html=True)
-            row_cols[3].markdown(f'<div style="background-color:{bg_color}; padding:5px;">{row["Возраст"]}</div>', unsafe_allow_html=True)
-            row_cols[4].markdown(f'<div style="background-color:{bg_color}; padding:5px;">{row["Телефон"]}</div>', unsafe_allow_html=True)
-            row_cols[5].markdown(f'<div style="background-color:{bg_color}; padding:5px;">{row["Город"]}</div>', unsafe_allow_html=True)
-            row_cols[6].markdown(f'<div style="background-color:{bg_color}; padding:5px;">{row["Пол"]}</div>', unsafe_allow_html=True)
-            row_cols[7].markdown(f'<div style="background-color:{bg_color}; padding:5px;">{row["Зарплата"]}</div>', unsafe_allow_html=True)
-            
-            # Комментарий с ограничением длины для улучшения отображения
-            comment = row["Комментарий"]
-            row_cols[8].markdown(f'<div style="background-color:{bg_color}; padding:5px; overflow-wrap: break-word;">{comment}</div>', unsafe_allow_html=True)
-            
-            # Кнопка PDF
-            row_cols[9].markdown(f"""
-            <style>
-                div[data-testid="stButton"] > button {{
-                    background-color: transparent;
-                    color: #FF0000;
-                    font-size: 12px;
-                    padding: 1px 6px;
-                    border: 1px solid #FF0000;
-                    border-radius: 4px;
-                    width: 80%;
-                    height: auto;
-                    margin: 0 auto;
-                    display: block;
-                }}
-            </style>
-            """, unsafe_allow_html=True)
-            if row_cols[9].button("PDF", key=f"pdf_{idx}", help="Просмотр резюме"):
-                # Найдем имя файла в processed_files
-                file_name = row["Файл"] + ".pdf" if not row["Файл"].endswith(".pdf") else row["Файл"]
-                if file_name in st.session_state.processed_files:
-                    file_data = st.session_state.processed_files[file_name]["file"]
-                    st.session_state.selected_pdf = {"file": file_data, "name": file_name}
-                    st.rerun()  # Перезагрузить страницу для отображения PDF
-        
-        # Создаем буфер для Excel файла
-        buffer = io.BytesIO()
-
-        # Создаем Excel файл
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Результаты анализа"
-
-        # Добавляем заголовки
-        headers = list(display_df.columns)
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
-            
-            # Настройка ширины столбца
-            ws.column_dimensions[get_column_letter(col_num)].width = 15
-
-        # Записываем данные
-        for row_idx, row in enumerate(display_df.values, 2):
-            # Получаем вероятность для определения цвета строки
-            try:
-                prob = float(row[list(display_df.columns).index("Вероятность класса 1")].replace(',', '.'))
-            except:
-                prob = 0
-            
-            # Определяем цвет фона в зависимости от вероятности
-            if prob >= 0.81:
-                fill_color = "CCFFCC"  # зеленый
-            elif prob < 0.19:
-                fill_color = "FFCCCC"  # красный
-            else:
-                fill_color = "FFF6CC"  # желтый
-                
-            fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
-            
-            # Добавляем данные в строку
-            for col_idx, value in enumerate(row, 1):
-                cell = ws.cell(row=row_idx, column=col_idx)
-                cell.value = value
-                cell.fill = fill
-                
-                # Для комментариев устанавливаем перенос текста
-                if col_idx == list(display_df.columns).index("Комментарий") + 1:
-                    cell.alignment = Alignment(wrap_text=True, vertical='top')
-                    ws.row_dimensions[row_idx].height = 60  # Увеличиваем высоту строки
-
-        # Сохраняем в буфер
-        wb.save(buffer)
-        buffer.seek(0)
-
-        # Создаем кнопку скачивания Excel
-        st.download_button(
-            label="Скачать результаты (Excel)",
-            data=buffer,
-            file_name="predictions.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        
-        st.markdown("""
-        <style>
-            div[data-testid="stButton"] > button {
-                border-color: #9e9e9e;
-                color: #505050;
-            }
-            div[data-testid="stButton"] > button:hover {
-                border-color: #6e6e6e;
-                color: #303030;
-            }
-        </style>
-        """, unsafe_allow_html=True)
-
+        results_panel(owner, thresholds)
+        excel_export_panel(owner, thresholds)
 
         # Кнопка для полной очистки всех данных резюме
         if st.button("Очистить все выбранные резюме", key="clear_all_button"):
@@ -812,9 +1292,7 @@ def main_app():
             
             
             # Обязательно инициализируем заново с пустыми значениями
-            st.session_state.processed_files = {}
-            st.session_state.results = []
-            st.session_state.has_processed_files = False
+            store.delete_owner(owner)
             st.session_state.selected_rows = set()
                 
             # Сообщение об успешной очистке
@@ -823,76 +1301,10 @@ def main_app():
             # Принудительно перезагружаем страницу
             st.rerun()  # Используем просто rerun() вместо experimental_rerun()
         
-        # Добавляем информацию о количестве выбранных резюме
-        if st.session_state.selected_rows:
-            selected_count = len(st.session_state.selected_rows)
-            st.write(f"Выбрано: {selected_count} резюме")
-            
-            # Кнопка для отправки выбранных резюме в AmoCRM
-            if st.button(f"Отправить выбранные резюме в AmoCRM ({selected_count})"):
-                selected_results = [st.session_state.results[idx] for idx in st.session_state.selected_rows]
-                
-                # Создаем временный DataFrame только с выбранными резюме
-                temp_df = pd.DataFrame(selected_results)
-                temp_df["Файл"] = temp_df["Файл"].str.replace('.pdf', '', regex=False)
-                temp_df["Вероятность класса 1"] = temp_df["Вероятность класса 1"].astype(float).map("{:.2f}".format)
-                temp_df["Зарплата"] = temp_df["Зарплата"].apply(lambda x: f"{int(x):,}".replace(',', ' ') if str(x).isdigit() else x)
-                
-                display_temp_df = temp_df.drop(columns=["raw_proba", "raw_text", "prediction_class"], errors="ignore")
-                
-                # Сохраняем DataFrame в CSV
-                temp_csv_path = "temp_selected_results.csv"
-                display_temp_df.to_csv(temp_csv_path, index=False, encoding='utf-8')
-                
-                try:
-                    # Вызываем функцию из amo_script.py
-                    from amo_script import AmoCRMClient
-                    
-                    with st.spinner("Отправка выбранных данных в AmoCRM..."):
-                        client = AmoCRMClient(temp_csv_path)
-                        client.process_csv()
-                    
-                    # Удаляем временный CSV файл
-                    if os.path.exists(temp_csv_path):
-                        os.remove(temp_csv_path)
-                    
-                    st.success(f"Выбранные резюме ({selected_count}) успешно отправлены в AmoCRM!")
-                except Exception as e:
-                    st.error(f"Ошибка при отправке данных в AmoCRM: {e}")
-        else:
-            # Обычная кнопка отправки всех данных в AmoCRM
-            if st.button("Отправить все данные в AmoCRM"):
-                success = send_to_amocrm()
-                if success:
-                    st.success("Данные успешно отправлены в AmoCRM!")
     
     # Если выбран PDF для просмотра, отображаем его
     if hasattr(st.session_state, 'selected_pdf') and st.session_state.selected_pdf:
-        st.divider()
-        st.subheader(f"📄 Просмотр: {st.session_state.selected_pdf['name']}")
-        display_pdf(st.session_state.selected_pdf['file'])
-        
-        # Информация о кандидате
-        file_name = st.session_state.selected_pdf['name']
-        raw_text = st.session_state.processed_files[file_name]["raw_text"]
-        info = extract_resume_info(raw_text)
-        info_df = pd.DataFrame({
-            "Поле": ["Телефон", "Должность", "Город", "Возраст", "Пол", "Зарплата"],
-            "Значение": [
-                info["phone"], 
-                info["position"], 
-                info["city"], 
-                info["age"], 
-                info["gender"],
-                info["salary"]
-            ]
-        })
-        st.table(info_df)
-        
-        # Кнопка закрыть просмотр PDF
-        if st.button("Закрыть просмотр PDF"):
-            del st.session_state.selected_pdf
-            st.rerun()
+        pdf_viewer()
     else:
         if uploaded_files:
             st.info("Нажмите кнопку 'Обработать файлы' для анализа резюме.")
@@ -903,65 +1315,55 @@ def main_app():
     if st.session_state.user_role == "admin":
         st.divider()
         st.subheader("Загрузка резюме с почты")
-        if st.button("Получить резюме с почты"):
-            try:
-                from pochtalion import download_pdfs
-                downloaded_files = download_pdfs()
-                if downloaded_files:
-                    # Обработка новых файлов
-                    results = []
-                    for file_path in downloaded_files:
-                        with open(file_path, "rb") as f:
-                            file = io.BytesIO(f.read())
-                            file.name = os.path.basename(file_path)
-                            raw_text = extract_text_from_pdf(file)
-                            info = extract_resume_info(raw_text)
-                            processed_text = preprocess_resume(raw_text)
-                            keyword_features = extract_features(processed_text, features)
-                            resume_features = extract_resume_features(raw_text)
-                            manual_df = pd.DataFrame([keyword_features | resume_features])
-                            tfidf_features = tfidf.transform([processed_text]).toarray()
-                            combined_features = np.hstack([manual_df.values, tfidf_features])
-                            scaled_features = scaler.transform(combined_features)
-                            proba = model.predict_proba(scaled_features)[0]
-                            raw_proba = proba[1]
-                            prediction = 1 if raw_proba >= THRESHOLD else 0
-                            
-                            comment, is_red_flag = get_detailed_comment(raw_text, prediction, raw_proba)
-                            
-                            results.append({
-                                "Файл": file.name,
-                                "Вероятность класса 1": raw_proba,
-                                "Телефон": info["phone"],
-                                "Желаемая должность": info["position"],
-                                "Город": info["city"],
-                                "Возраст": info["age"],
-                                "Пол": info["gender"],
-                                "Зарплата": info["salary"],
-                                "Комментарий": comment,
-                                "raw_proba": raw_proba,
-                                "raw_text": raw_text
-                            })
-                            
-                            # Сохраняем файл в processed_files для возможности просмотра PDF
-                            st.session_state.processed_files[file.name] = {
-                                "file": file,
-                                "raw_text": raw_text
-                            }
-                            
-                    st.session_state.results.extend(results)
-                    st.session_state.has_processed_files = True
-                    st.success(f"Загружено {len(downloaded_files)} новых резюме")
-                    st.rerun()  # Перезагружаем страницу для отображения результатов
-                else:
-                    st.info("Новых резюме не найдено")
-            except Exception as e:
-                st.error(f"Ошибка при загрузке резюме с почты: {e}")
-                st.info("Убедитесь, что файл pochtalion.py находится в той же директории и содержит функцию download_pdfs")
+        mail_status_panel()
+
+@st.fragment(run_every=MAIL_STATUS_REFRESH_S)
+def mail_status_panel():
+    # Почта читается фоновым потоком, панель только показывает его состояние
+    poller = get_mail_poller()
+    status = poller.status()
+
+    def format_time(timestamp):
+        return pd.to_datetime(timestamp, unit="s").strftime("%Y-%m-%d %H:%M:%S") if timestamp else "-"
+
+    st.table(pd.DataFrame({
+        "Параметр": ["Состояние", "IMAP IDLE", "Последняя проверка", "Следующая проверка",
+                     "Файлов в последней проверке", "Файлов всего", "Ошибок подряд"],
+        "Значение": [
+            status["state"] if status["running"] else "остановлен",
+            {True: "да", False: "нет", None: "-"}[status["idle_supported"]],
+            format_time(status["last_poll_at"]),
+            format_time(status["next_poll_at"]),
+            str(status["last_files"]),
+            str(status["files_total"]),
+            str(status["consecutive_errors"])
+        ]
+    }))
+    if status["last_error"]:
+        st.error(f"Последняя ошибка ({format_time(status['last_error_at'])}): {status['last_error']}")
+    st.caption(f"Новые резюме оцениваются автоматически и попадают в таблицу пользователя {MAIL_OWNER}.")
+    if status["running"]:
+        if st.button("Проверить почту сейчас"):
+            poller.wake()
+            st.info("Проверка запущена, состояние обновится через несколько секунд")
+    elif st.button("Запустить опрос почты"):
+        poller.start()
+        st.rerun(scope="fragment")
+
+
+def enforce_session_memory(force=False):
+    # Без force размер состояния пересчитывается не чаще SESSION_MEMORY_CHECK_INTERVAL_S
+    evicted = get_memory_monitor().enforce(st.session_state, current_session_id(), force=force)
+    if evicted:
+        logger.info("Из состояния сессии %s вытеснено: %s", current_session_id(), ", ".join(evicted))
 
 
 # --- Главная ---
 def main():
+    # Опрос почты запускается вместе с сервером, а не по кнопке
+    get_mail_poller()
+    # Запрошенные администратором вытеснения и предел размера состояния этой сессии
+    enforce_session_memory()
     if st.session_state.authenticated:
         st.sidebar.write(f"Вы вошли как: **{st.session_state.user_name}** ({st.session_state.user_role})")
         
@@ -976,12 +1378,8 @@ def main():
         
         if st.sidebar.button("Выйти"):
             # Полный сброс всех ключей сессии
-            if 'processed_files' in st.session_state:
-                del st.session_state['processed_files']
-            if 'results' in st.session_state:
-                del st.session_state['results']
-            if 'has_processed_files' in st.session_state:
-                del st.session_state['has_processed_files']
+            if 'excel_export' in st.session_state:
+                del st.session_state['excel_export']
             if 'selected_rows' in st.session_state:
                 del st.session_state['selected_rows']
             if 'selected_pdf' in st.session_state:
@@ -991,11 +1389,9 @@ def main():
             st.session_state.authenticated = False
             st.session_state.user_role = None
             st.session_state.user_name = None
+            st.session_state.username = None
             
-            # Инициализируем пустые структуры данных
-            st.session_state.processed_files = {}
-            st.session_state.results = []
-            st.session_state.has_processed_files = False
+            # Инициализируем пустые структуры данных; результаты остаются в хранилище
             st.session_state.selected_rows = set()
             
             st.rerun()
@@ -0,0 +1,105 @@
+import os
+import tarfile
+import zipfile
+from itertools import islice
+
+# Архивы резюме от партнеров (ZIP, tar, tar.gz). Файлы распаковываются по
+# одному и отдаются порциями, поэтому в памяти одновременно находится не
+# больше ARCHIVE_CHUNK_FILES распакованных PDF.
+
+ARCHIVE_TYPES = ["zip", "tar", "gz", "tgz", "bz2", "xz"]
+ARCHIVE_CHUNK_FILES = int(os.getenv("ARCHIVE_CHUNK_FILES", "32"))
+ARCHIVE_MAX_MEMBER_MB = int(os.getenv("ARCHIVE_MAX_MEMBER_MB", "20"))
+
+
+def _is_resume(name):
+    base = os.path.basename(name)
+    # Служебные файлы macOS и скрытые файлы в архивах пропускаются молча
+    if not base or base.startswith(".") or "__MACOSX/" in name:
+        return False
+    return base.lower().endswith(".pdf")
+
+
+def _read_limited(stream, max_bytes):
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"файл больше {max_bytes // (1024 * 1024)} МБ")
+    return data
+
+
+def _iter_zip(fileobj, max_bytes):
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not _is_resume(info.filename):
+                continue
+            name = os.path.basename(info.filename)
+            if info.file_size > max_bytes:
+                yield name, None, f"файл больше {max_bytes // (1024 * 1024)} МБ"
+                continue
+            try:
+                with archive.open(info) as member:
+                    yield name, _read_limited(member, max_bytes), None
+            except (zipfile.BadZipFile, RuntimeError, ValueError, NotImplementedError, OSError) as e:
+                # RuntimeError - зашифрованный файл, NotImplementedError - неизвестное сжатие
+                yield name, None, str(e)
+
+
+def _iter_tar(fileobj, max_bytes):
+    # Потоковый режим "r|*": архив читается последовательно, без перемотки
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if not member.isfile() or not _is_resume(member.name):
+                continue
+            name = os.path.basename(member.name)
+            if member.size > max_bytes:
+                yield name, None, f"файл больше {max_bytes // (1024 * 1024)} МБ"
+                continue
+            try:
+                yield name, _read_limited(archive.extractfile(member), max_bytes), None
+            except (tarfile.TarError, ValueError, OSError) as e:
+                yield name, None, str(e)
+
+
+def iter_archive(fileobj, archive_name, max_member_mb=ARCHIVE_MAX_MEMBER_MB):
+    """
+    Перебирает PDF из архива: тройки (имя файла, байты или None, ошибка или None).
+    Ошибка одного файла не прерывает чтение остальных; поврежденный сам архив
+    выдается одной записью с именем архива.
+    """
+    max_bytes = max_member_mb * 1024 * 1024
+    try:
+        if archive_name.lower().endswith(".zip"):
+            yield from _iter_zip(fileobj, max_bytes)
+        else:
+            yield from _iter_tar(fileobj, max_bytes)
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        yield archive_name, None, f"архив поврежден или не поддерживается: {e}"
+
+
+def archive_member_count(fileobj, archive_name):
+    # Число PDF известно заранее только для ZIP; tar читается потоком, для него None
+    if not archive_name.lower().endswith(".zip"):
+        return None
+    try:
+        with zipfile.ZipFile(fileobj) as archive:
+            count = sum(1 for info in archive.infolist() if not info.is_dir() and _is_resume(info.filename))
+    except zipfile.BadZipFile:
+        return None
+    finally:
+        fileobj.seek(0)
+    return count
+
+
+def chunked(iterable, size=ARCHIVE_CHUNK_FILES, first_size=None):
+    """
+    Делит поток на порции по size. Если задан first_size, первая порция меньше,
+    а следующие удваиваются до size: первые результаты появляются быстрее.
+    """
+    iterator = iter(iterable)
+    current = min(first_size or size, size)
+    while True:
+        chunk = list(islice(iterator, current))
+        if not chunk:
+            return
+        yield chunk
+        current = min(current * 2, size)
@@ -0,0 +1,319 @@
+import argparse
+import html
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# --- Синтетический корпус резюме в стиле hh.ru ---
+FIRST_NAMES = ["Иван", "Алексей", "Мария", "Ольга", "Дмитрий", "Анна", "Сергей", "Екатерина", "Павел", "Наталья"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков", "Федоров"]
+CITIES = ["Москва", "Санкт-Петербург", "Екатеринбург", "Казань", "Новосибирск", "Самара", "Омск", "Челябинск"]
+POSITIONS = ["Менеджер по продажам", "Оператор call-центра", "Менеджер по работе с клиентами",
+             "Специалист по телемаркетингу", "Продавец-консультант", "Администратор", "Кассир"]
+COMPANIES = ["ООО Ромашка", "АО ТехноТрейд", "ПАО Связь", "ООО СтройМаркет", "ИП Сидоров", "ООО ФитнесЛайф"]
+MONTHS = ["январь", "февраль", "март", "апрель", "май", "июнь", "июль", "август",
+          "сентябрь", "октябрь", "ноябрь", "декабрь"]
+DUTY_PHRASES = [
+    "холодные звонки по базе клиентов", "работа с возражениями", "ведение переговоров с ЛПР",
+    "ведение клиентской базы в CRM", "выполнение плана продаж на 120%", "обработка входящих заявок",
+    "консультация покупателей в торговом зале", "продажа кредитных продуктов банка",
+    "телефонные продажи B2B", "проведение презентаций продукта", "анализ воронки продаж и конверсии",
+    "работа по скриптам SPIN и AIDA", "обучение новых сотрудников", "контроль дебиторской задолженности",
+    "работа с кассой и 1С", "подготовка коммерческих предложений", "обзвон клиентов и допродажи"
+]
+SKILLS = ["Активные продажи", "Холодные звонки", "Деловая переписка", "CRM", "1С", "Excel",
+          "Переговоры", "Работа с возражениями", "Клиентоориентированность", "Стрессоустойчивость"]
+ABOUT_PHRASES = ["Коммуникабельный, целеустремленный.", "Быстро обучаюсь, ориентирован на результат.",
+                 "Стрессоустойчив, умею работать в режиме многозадачности.", "Нацелен на долгосрочное сотрудничество."]
+
+
+def generate_resume_text(rng, n_jobs=3, duties_per_job=5):
+    gender = rng.choice(["Мужчина", "Женщина"])
+    age = rng.randint(19, 55)
+    lines = [
+        f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}",
+        f"{gender}, {age} {'года' if age % 10 in (2, 3, 4) else 'лет'}, родился {rng.randint(1, 28)} {rng.choice(MONTHS)} {2024 - age}",
+        f"+7 ({rng.randint(900, 999)}) {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}",
+        f"candidate{rng.randint(1, 99999)}@mail.ru",
+        f"Проживает: {rng.choice(CITIES)}",
+        "Гражданство: Россия",
+        "Желаемая должность и зарплата",
+        rng.choice(POSITIONS),
+        "Специализации:",
+        "— Менеджер по продажам, менеджер по работе с клиентами",
+        "Занятость: полная занятость",
+        "График работы: полный день",
+        f"{rng.randint(30, 150)} 000 ₽ на руки",
+        f"Опыт работы — {n_jobs * 2} года {rng.randint(1, 11)} месяцев",
+    ]
+    year = 2024
+    for _ in range(n_jobs):
+        start = year - rng.randint(1, 3)
+        lines.append(f"{rng.choice(MONTHS).capitalize()} {start} — {rng.choice(MONTHS)} {year}")
+        lines.append(rng.choice(COMPANIES))
+        lines.append(rng.choice(POSITIONS))
+        lines.extend(f"- {rng.choice(DUTY_PHRASES)}" for _ in range(duties_per_job))
+        year = start
+    lines.append("Образование")
+    lines.append(f"Высшее {year - 5} Московский государственный университет, экономика")
+    lines.append("Навыки")
+    lines.append("  ".join(rng.sample(SKILLS, k=min(6, len(SKILLS)))))
+    lines.append("Обо мне")
+    lines.append(" ".join(rng.sample(ABOUT_PHRASES, k=2)))
+    return "\n".join(lines)
+
+
+def text_to_pdf(text):
+    import fitz
+
+    # Story верстает HTML встроенными шрифтами PyMuPDF (с кириллицей)
+    # и сам переносит текст на новые страницы
+    page_rect = fitz.paper_rect("a4")
+    body = page_rect + (40, 40, -40, -40)
+    story = fitz.Story(html="".join(f"<p>{html.escape(line)}</p>" for line in text.split("\n")),
+                       user_css="* {font-size: 10px;}")
+    buffer = io.BytesIO()
+    writer = fitz.DocumentWriter(buffer)
+    more = True
+    while more:
+        device = writer.begin_page(page_rect)
+        more, _ = story.place(body)
+        story.draw(device)
+        writer.end_page()
+    writer.close()
+    return buffer.getvalue()
+
+
+def generate_corpus(count, n_jobs=3, duties_per_job=5, seed=42):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        text = generate_resume_text(rng, n_jobs=n_jobs, duties_per_job=duties_per_job)
+        corpus.append((f"synthetic_{i:05d}.pdf", text_to_pdf(text)))
+    return corpus
+
+
+def load_pdf_dir(path, limit=None):
+    names = sorted(name for name in os.listdir(path) if name.lower().endswith(".pdf"))[:limit]
+    corpus = []
+    for name in names:
+        with open(os.path.join(path, name), "rb") as f:
+            corpus.append((name, f.read()))
+    return corpus
+
+
+# --- Замер этапов ---
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+        self.documents = {}
+
+    @contextmanager
+    def stage(self, name, documents=1):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(name, []).append(time.perf_counter() - started)
+            self.documents[name] = self.documents.get(name, 0) + documents
+
+    def summary(self):
+        result = {}
+        for name, samples in self.samples.items():
+            values = np.array(samples) * 1000
+            total = float(np.sum(samples))
+            result[name] = {
+                "calls": len(samples),
+                "documents": self.documents[name],
+                "total_s": round(total, 4),
+                "mean_ms": round(float(values.mean()), 3),
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3),
+                "max_ms": round(float(values.max()), 3),
+                "docs_per_s": round(self.documents[name] / total, 2) if total else None
+            }
+        return result
+
+
+def run_benchmark(corpus, repeat=1, batch_size=64, preview_docs=5, excel_rows=None):
+    from resume_pipeline import (
+        load_artifacts, extract_text_from_pdf, ParsedDocument, preprocess_resume, extract_features,
+        extract_resume_features, extract_resume_info, comment_from_matches, features, render_pdf_pages
+    )
+    from feature_assembly import assemble_features, scale_features, explain_batch
+    from excel_export import build_excel_export
+    from thresholds import DEFAULT_THRESHOLDS
+
+    timer = StageTimer()
+    with timer.stage("load_artifacts", documents=0):
+        model, scaler, tfidf = load_artifacts()
+
+    for _ in range(repeat):
+        raw_texts = []
+        for _, pdf_bytes in corpus:
+            with timer.stage("extract_text_from_pdf"):
+                raw_texts.append(extract_text_from_pdf(io.BytesIO(pdf_bytes)))
+
+        manual_rows, processed_texts, infos, documents = [], [], [], []
+        for raw_text in raw_texts:
+            with timer.stage("parse_document"):
+                doc = ParsedDocument(raw_text)
+            documents.append(doc)
+            with timer.stage("extract_resume_info"):
+                infos.append(extract_resume_info(doc))
+            with timer.stage("preprocess_resume"):
+                processed_text = preprocess_resume(doc)
+            with timer.stage("extract_features"):
+                keyword_features = extract_features(processed_text, features)
+            with timer.stage("extract_resume_features"):
+                resume_features = extract_resume_features(doc)
+            manual_rows.append(keyword_features | resume_features)
+            processed_texts.append(processed_text)
+
+        probabilities = []
+        for start in range(0, len(raw_texts), batch_size):
+            rows = manual_rows[start:start + batch_size]
+            texts = processed_texts[start:start + batch_size]
+            with timer.stage("tfidf_transform", documents=len(texts)):
+                tfidf.transform(texts)
+            with timer.stage("assemble_features", documents=len(texts)):
+                combined = assemble_features(rows, texts, tfidf)
+            with timer.stage("scaler_transform", documents=len(texts)):
+                scaled = scale_features(combined, scaler)
+            with timer.stage("catboost_predict_proba", documents=len(texts)):
+                probabilities.extend(model.predict_proba(scaled)[:, 1])
+            with timer.stage("explain_batch", documents=len(texts)):
+                explain_batch(model, scaler, combined, list(rows[0]), tfidf)
+
+        comments = []
+        for doc, proba in zip(documents, probabilities):
+            with timer.stage("get_detailed_comment"):
+                prediction = int(proba >= DEFAULT_THRESHOLDS["threshold"])
+                comments.append(comment_from_matches(doc.matches(), prediction)[0])
+
+        # Экспорт: размер таблицы можно задать отдельно, чтобы мерить, например, 5000 строк
+        import pandas as pd
+
+        n_rows = excel_rows or len(corpus)
+        export_df = pd.DataFrame([
+            {
+                "Файл": corpus[i % len(corpus)][0].replace(".pdf", ""),
+                "Вероятность класса 1": f"{probabilities[i % len(corpus)]:.2f}",
+                "Телефон": infos[i % len(corpus)]["phone"],
+                "Желаемая должность": infos[i % len(corpus)]["position"],
+                "Город": infos[i % len(corpus)]["city"],
+                "Возраст": infos[i % len(corpus)]["age"],
+                "Пол": infos[i % len(corpus)]["gender"],
+                "Зарплата": infos[i % len(corpus)]["salary"],
+                "Комментарий": comments[i % len(corpus)]
+            }
+            for i in range(n_rows)
+        ])
+        with timer.stage("excel_export", documents=n_rows):
+            build_excel_export(export_df)
+
+        for _, pdf_bytes in corpus[:preview_docs]:
+            try:
+                with timer.stage("convert_pdf_to_images"):
+                    render_pdf_pages(pdf_bytes)
+            except Exception as e:
+                # pdf2image требует poppler; без него этап пропускается
+                print(f"Этап convert_pdf_to_images пропущен: {e}", file=sys.stderr)
+                timer.samples.pop("convert_pdf_to_images", None)
+                timer.documents.pop("convert_pdf_to_images", None)
+                break
+
+    return timer.summary()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{'Этап':<28}{old['meta']['commit']:>12}{new['meta']['commit']:>12}{'Δ':>10}")
+    for stage, stats in new["stages"].items():
+        before = old["stages"].get(stage, {}).get("p50_ms")
+        after = stats["p50_ms"]
+        delta = f"{(after - before) / before * 100:+.1f}%" if before else "-"
+        print(f"{stage:<28}{before if before is not None else '-':>12}{after:>12}{delta:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поэтапный бенчмарк конвейера обработки резюме")
+    parser.add_argument("--count", type=int, default=100, help="Число синтетических резюме")
+    parser.add_argument("--jobs", type=int, default=3, help="Мест работы в каждом резюме (длина текста)")
+    parser.add_argument("--duties", type=int, default=5, help="Обязанностей на каждое место работы")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pdf-dir", default=None, help="Брать реальные PDF из папки вместо синтетики")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--preview-docs", type=int, default=5, help="Сколько PDF рендерить в картинки")
+    parser.add_argument("--excel-rows", type=int, default=None, help="Размер таблицы для замера экспорта")
+    parser.add_argument("--output", default=None, help="JSON с результатами (по умолчанию bench_<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Сравнить два файла результатов")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    started = time.perf_counter()
+    if args.pdf_dir:
+        corpus = load_pdf_dir(args.pdf_dir, limit=args.count)
+    else:
+        corpus = generate_corpus(args.count, n_jobs=args.jobs, duties_per_job=args.duties, seed=args.seed)
+    print(f"Корпус: {len(corpus)} PDF, {sum(len(data) for _, data in corpus) / 1024:.0f} КБ "
+          f"({time.perf_counter() - started:.1f} с)", file=sys.stderr)
+
+    stages = run_benchmark(corpus, repeat=args.repeat, batch_size=args.batch_size,
+                           preview_docs=args.preview_docs, excel_rows=args.excel_rows)
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": {
+                "source": args.pdf_dir or "synthetic",
+                "documents": len(corpus),
+                "jobs": args.jobs,
+                "duties": args.duties,
+                "seed": args.seed
+            },
+            "repeat": args.repeat,
+            "batch_size": args.batch_size
+        },
+        "stages": stages
+    }
+    output = args.output or f"bench_{commit}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for stage, stats in stages.items():
+        print(f"{stage:<28} p50 {stats['p50_ms']:>9.3f} мс  p95 {stats['p95_ms']:>9.3f} мс  "
+              f"{stats['docs_per_s'] or 0:>9.1f} док/с")
+    print(f"Результаты сохранены в {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Optional, Set
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: очистку от параллельных процессов защищает только порядок по mtime
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Для воркеров очереди на других машинах каталог должен быть общим
+BLOB_DIR = os.getenv("BLOB_DIR", "blobs")
+MAX_STORE_BYTES = int(os.getenv("BLOB_STORE_MAX_MB", "2048")) * 1024 * 1024
+CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_MB", "64")) * 1024 * 1024
+# В каталог пишут и другие процессы (воркеры очереди, соседние серверы), поэтому свой счетчик
+# размера сверяется с диском не реже, чем раз в этот интервал
+BLOB_MEASURE_INTERVAL_S = float(os.getenv("BLOB_MEASURE_INTERVAL_S", "60"))
+# PDF кандидатов, сохраненных за это время, и файлы заданий очереди при очистке не удаляются
+BLOB_PIN_RECENT_S = float(os.getenv("BLOB_PIN_RECENT_S", str(24 * 3600)))
+# Если закрепленные файлы не дают уложиться в лимит, очистка по превышению повторяется не чаще
+# этого интервала; используемые хеши все равно перепроверяются при сверке с диском
+BLOB_EVICT_RETRY_S = float(os.getenv("BLOB_EVICT_RETRY_S", "300"))
+
+
+def referenced_hashes() -> Set[str]:
+    """Хеши, на которые еще ссылаются задания очереди и недавно сохраненные кандидаты."""
+    from candidate_store import DB_PATH, CandidateStore
+    from job_queue import JOB_QUEUE_DB, JobQueue
+
+    since = time.time() - BLOB_PIN_RECENT_S
+    hashes = set()
+    # На машине воркера базы кандидатов может не быть, пустая база не создается
+    if os.path.exists(DB_PATH):
+        hashes |= CandidateStore(DB_PATH).recent_file_hashes(since)
+    if os.path.exists(JOB_QUEUE_DB):
+        hashes |= JobQueue(JOB_QUEUE_DB).pending_blob_hashes(since)
+    return hashes
+
+
+class BlobStore:
+    """
+    Контентно-адресуемое хранилище PDF на диске.
+
+    Файл сохраняется один раз под своим sha256, сессии держат только хеши.
+    Чтение идет через небольшой LRU-кеш в памяти, при превышении лимита
+    на диске удаляются давно не использованные файлы, кроме тех, что
+    вернул referenced (по умолчанию - задания очереди и недавние кандидаты).
+    """
+
+    def __init__(self, root: str = BLOB_DIR, max_bytes: int = MAX_STORE_BYTES,
+                 cache_max_bytes: int = CACHE_MAX_BYTES,
+                 referenced: Optional[Callable[[], Set[str]]] = referenced_hashes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self.referenced = referenced
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._total_bytes = self._disk_bytes()
+        self._measured_at = time.monotonic()
+        self._evict_retry_at = 0.0
+        self._over_limit = False
+
+    def _path(self, blob_hash: str) -> str:
+        return os.path.join(self.root, blob_hash[:2], blob_hash + ".pdf")
+
+    def _iter_blobs(self):
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name.endswith(".pdf"):
+                    yield os.path.join(prefix_dir, name), name[:-4]
+
+    def _disk_bytes(self) -> int:
+        total = 0
+        for path, _ in self._iter_blobs():
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return total
+
+    @contextmanager
+    def _dir_lock(self):
+        # Очистку одновременно выполняет только один процесс на общем каталоге
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, ".evict.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def put(self, data: bytes) -> str:
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self._path(blob_hash)
+        with self._lock:
+            try:
+                os.utime(path)
+                return blob_hash
+            except FileNotFoundError:
+                pass  # нет файла или его только что удалила очистка другого процесса
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Пишем во временный файл и переименовываем, чтобы не оставить обрезанный blob
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data)
+            now = time.monotonic()
+            if ((self._total_bytes > self.max_bytes and now >= self._evict_retry_at)
+                    or now - self._measured_at >= BLOB_MEASURE_INTERVAL_S):
+                self._evict(keep=blob_hash)
+        return blob_hash
+
+    def get(self, blob_hash: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._cache.get(blob_hash)
+            if data is not None:
+                self._cache.move_to_end(blob_hash)
+        metrics.cache_hit("blob", data is not None)
+        if data is not None:
+            return data
+        path = self._path(blob_hash)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._remember(blob_hash, data)
+        return data
+
+    def exists(self, blob_hash: str) -> bool:
+        return os.path.exists(self._path(blob_hash))
+
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _remember(self, blob_hash: str, data: bytes):
+        if len(data) > self.cache_max_bytes or blob_hash in self._cache:
+            return
+        self._cache[blob_hash] = data
+        self._cache_bytes += len(data)
+        while self._cache_bytes > self.cache_max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+
+    def _evict(self, keep: str):
+        # Размер пересчитывается по диску под блокировкой каталога: счетчик процесса не видит
+        # файлов, записанных и удаленных другими процессами
+        with self._dir_lock():
+            blobs = []
+            for path, blob_hash in self._iter_blobs():
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, path, blob_hash))
+            self._total_bytes = sum(size for _, size, _, _ in blobs)
+            self._measured_at = time.monotonic()
+            if self._total_bytes <= self.max_bytes:
+                self._set_over_limit(False)
+                return
+
+            # Удаляем самые старые по времени последнего доступа, пока не уложимся в 90% лимита
+            try:
+                pinned = {keep} | (self.referenced() if self.referenced is not None else set())
+            except Exception:
+                # Не зная, какие файлы еще нужны, ничего не удаляем; попробуем при следующей записи
+                logger.exception("Хранилище PDF: не удалось получить используемые хеши, очистка отложена")
+                self._evict_retry_at = time.monotonic() + BLOB_EVICT_RETRY_S
+                return
+            target = int(self.max_bytes * 0.9)
+            removed = 0
+            for _, size, path, blob_hash in sorted(blobs):
+                if self._total_bytes <= target:
+                    break
+                if blob_hash in pinned:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._total_bytes -= size
+                removed += 1
+                cached = self._cache.pop(blob_hash, None)
+                if cached is not None:
+                    self._cache_bytes -= len(cached)
+        metrics.count("blob_evictions", removed)
+        if self._total_bytes > self.max_bytes:
+            # Повторная очистка до конца интервала снова упрется в те же файлы
+            self._evict_retry_at = time.monotonic() + BLOB_EVICT_RETRY_S
+            self._set_over_limit(True)
+        else:
+            self._set_over_limit(False)
+            logger.info("Хранилище PDF очищено до %.1f МБ, удалено файлов: %d",
+                        self._total_bytes / 1024 / 1024, removed)
+
+    def _set_over_limit(self, over_limit: bool):
+        # О превышении лимита пишем один раз, пока хранилище снова в него не уложится
+        if over_limit and not self._over_limit:
+            logger.warning("Хранилище PDF: %.1f МБ при лимите %.1f МБ, остальные файлы еще нужны заданиям "
+                           "и недавним кандидатам", self._total_bytes / 1024 / 1024, self.max_bytes / 1024 / 1024)
+        elif not over_limit:
+            self._evict_retry_at = 0.0
+        self._over_limit = over_limit
@@ -0,0 +1,307 @@
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+DB_PATH = "candidates.db"
+
+# Колонки, которые можно отдавать в таблицу без тяжелого raw_text
+LIST_COLUMNS = [
+    "id", "file_name", "file_hash", "probability", "phone", "position",
+    "city", "age", "gender", "salary", "comment", "ingested_at"
+]
+SORTABLE_COLUMNS = {"probability", "file_name", "ingested_at", "city", "phone"}
+
+# Колонки, добавленные после первой версии схемы: в старых базах создаются через ALTER TABLE
+MIGRATIONS = {
+    "model_version": "ALTER TABLE candidates ADD COLUMN model_version TEXT",
+    "explanation": "ALTER TABLE candidates ADD COLUMN explanation TEXT",
+    "duplicate_of": "ALTER TABLE candidates ADD COLUMN duplicate_of INTEGER"
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS candidates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    file_hash TEXT,
+    probability REAL NOT NULL DEFAULT 0,
+    phone TEXT,
+    position TEXT,
+    city TEXT,
+    age TEXT,
+    gender TEXT,
+    salary TEXT,
+    comment TEXT,
+    raw_text TEXT,
+    model_version TEXT,
+    explanation TEXT,
+    duplicate_of INTEGER,
+    ingested_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_candidates_owner_probability ON candidates(owner, probability);
+CREATE INDEX IF NOT EXISTS idx_candidates_phone ON candidates(phone);
+CREATE INDEX IF NOT EXISTS idx_candidates_city ON candidates(city);
+CREATE INDEX IF NOT EXISTS idx_candidates_file_hash ON candidates(file_hash);
+CREATE INDEX IF NOT EXISTS idx_candidates_owner_ingested ON candidates(owner, ingested_at);
+"""
+
+
+def _dump_explanation(explanation):
+    # Объяснение оценки хранится JSON-списком вкладов признаков
+    return json.dumps(explanation, ensure_ascii=False) if explanation is not None else None
+
+
+class CandidateStore:
+    """
+    Локальное хранилище оцененных кандидатов (SQLite).
+
+    Результаты переживают выход из системы и не дублируются по сессиям:
+    интерфейс и выгрузка в amoCRM читают их постранично.
+    """
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(candidates)")}
+            if existing:
+                for column, statement in MIGRATIONS.items():
+                    if column not in existing:
+                        conn.execute(statement)
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Отдельное соединение на операцию: Streamlit выполняет скрипты в разных потоках
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _where(owner: str, proba_ranges: Optional[Sequence[Tuple[Optional[float], Optional[float]]]]):
+        # proba_ranges - список полуинтервалов [lo, hi), None означает отсутствие границы
+        clauses = ["owner = ?"]
+        params: List = [owner]
+        if proba_ranges is not None:
+            range_clauses = []
+            for lo, hi in proba_ranges:
+                parts = []
+                if lo is not None:
+                    parts.append("probability >= ?")
+                    params.append(lo)
+                if hi is not None:
+                    parts.append("probability < ?")
+                    params.append(hi)
+                range_clauses.append("(" + " AND ".join(parts or ["1"]) + ")")
+            clauses.append("(" + " OR ".join(range_clauses or ["0"]) + ")")
+        return " AND ".join(clauses), params
+
+    def add_candidates(self, owner: str, candidates: List[Dict]) -> List[int]:
+        now = time.time()
+        ids = []
+        with self._connect() as conn:
+            for candidate in candidates:
+                cursor = conn.execute(
+                    """
+                    INSERT INTO candidates (owner, file_name, file_hash, probability, phone, position, city, age,
+                                            gender, salary, comment, raw_text, model_version, explanation,
+                                            duplicate_of, ingested_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        owner, candidate["file_name"], candidate.get("file_hash"),
+                        float(candidate.get("probability") or 0), candidate.get("phone"),
+                        candidate.get("position"), candidate.get("city"), candidate.get("age"),
+                        candidate.get("gender"), candidate.get("salary"), candidate.get("comment"),
+                        candidate.get("raw_text"), candidate.get("model_version"),
+                        _dump_explanation(candidate.get("explanation")), candidate.get("duplicate_of"), now, now
+                    )
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def count(self, owner: str, proba_ranges=None) -> int:
+        where, params = self._where(owner, proba_ranges)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM candidates WHERE {where}", params).fetchone()[0]
+
+    def version(self, owner: str) -> Tuple:
+        # Меняется при любой вставке, обновлении или удалении записей владельца
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MAX(id), MAX(updated_at) FROM candidates WHERE owner = ?", (owner,)
+            ).fetchone()
+        return tuple(row)
+
+    def page(self, owner: str, offset: int = 0, limit: int = 50, order_by: str = "probability",
+             ascending: bool = False, proba_ranges=None) -> List[Dict]:
+        if order_by not in SORTABLE_COLUMNS:
+            raise ValueError(f"Недопустимая колонка сортировки: {order_by}")
+        where, params = self._where(owner, proba_ranges)
+        direction = "ASC" if ascending else "DESC"
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(LIST_COLUMNS)} FROM candidates WHERE {where} "
+                f"ORDER BY {order_by} {direction}, id LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_pages(self, owner: str, page_size: int = 500, **query) -> Iterator[List[Dict]]:
+        offset = 0
+        while True:
+            rows = self.page(owner, offset=offset, limit=page_size, **query)
+            if not rows:
+                return
+            yield rows
+            offset += len(rows)
+
+    def ids(self, owner: str, proba_ranges=None) -> List[int]:
+        where, params = self._where(owner, proba_ranges)
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(f"SELECT id FROM candidates WHERE {where}", params)]
+
+    def get(self, candidate_id: int) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM candidates WHERE id = ?", (candidate_id,)).fetchone()
+        return dict(row) if row else None
+
+    def fetch_by_ids(self, candidate_ids: Sequence[int], with_text: bool = False) -> List[Dict]:
+        columns = "*" if with_text else ", ".join(LIST_COLUMNS)
+        rows = []
+        ids = list(candidate_ids)
+        with self._connect() as conn:
+            # SQLite ограничивает число параметров в запросе, поэтому читаем порциями
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows.extend(conn.execute(
+                    f"SELECT {columns} FROM candidates WHERE id IN ({placeholders}) ORDER BY probability DESC, id",
+                    chunk
+                ).fetchall())
+        return [dict(row) for row in rows]
+
+    def find_by_hash(self, owner: str, file_hash: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(LIST_COLUMNS)} FROM candidates WHERE owner = ? AND file_hash = ? LIMIT 1",
+                (owner, file_hash)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def recent_file_hashes(self, since: float) -> Set[str]:
+        # Хеши PDF кандидатов, сохраненных после since: их еще открывают в просмотре
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT file_hash FROM candidates WHERE ingested_at >= ? AND file_hash IS NOT NULL",
+                (since,)
+            ).fetchall()
+        return {file_hash for file_hash, in rows}
+
+    def update_fields(self, candidate_id: int, **fields) -> None:
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE candidates SET {assignments}, updated_at = ? WHERE id = ?",
+                list(fields.values()) + [time.time(), candidate_id]
+            )
+
+    def iter_probability_range(self, lo: float, hi: float, batch_size: int = 500) -> Iterator[List[Dict]]:
+        # Все владельцы: пороги общие для приложения. Строки с ошибкой (без текста) пропускаются
+        last_id = 0
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT id, probability, raw_text FROM candidates "
+                    "WHERE probability >= ? AND probability < ? AND raw_text IS NOT NULL AND id > ? "
+                    "ORDER BY id LIMIT ?",
+                    (lo, hi, last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+            last_id = rows[-1]["id"]
+
+    def update_comments(self, comments: Sequence[Tuple[int, str]]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE candidates SET comment = ?, updated_at = ? WHERE id = ?",
+                [(comment, now, candidate_id) for candidate_id, comment in comments]
+            )
+
+    def iter_scored_texts(self, batch_size: int = 500) -> Iterator[List[Dict]]:
+        # Кандидаты с текстом и PDF во всех владельцах, порциями по возрастанию id
+        last_id = 0
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT id, file_hash, raw_text FROM candidates "
+                    "WHERE raw_text IS NOT NULL AND file_hash IS NOT NULL AND id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+            last_id = rows[-1]["id"]
+
+    def iter_by_hashes(self, file_hashes: Sequence[str], batch_size: int = 500) -> Iterator[List[Dict]]:
+        hashes = list(file_hashes)
+        for start in range(0, len(hashes), batch_size):
+            chunk = hashes[start:start + batch_size]
+            placeholders = ", ".join("?" * len(chunk))
+            with self._connect() as conn:
+                rows = conn.execute(
+                    f"SELECT id, file_hash, probability, comment, raw_text FROM candidates "
+                    f"WHERE file_hash IN ({placeholders})",
+                    chunk
+                ).fetchall()
+            yield [dict(row) for row in rows]
+
+    def update_scores(self, scores: Sequence[Tuple[int, float, str, Optional[List[Dict]]]],
+                      model_version: Optional[str] = None) -> None:
+        # scores - четверки (id, вероятность, комментарий, объяснение)
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE candidates SET probability = ?, comment = ?, explanation = ?, model_version = ?, "
+                "updated_at = ? WHERE id = ?",
+                [(probability, comment, _dump_explanation(explanation), model_version, now, candidate_id)
+                 for candidate_id, probability, comment, explanation in scores]
+            )
+
+    def iter_unexplained(self, model_version: Optional[str], batch_size: int = 500) -> Iterator[List[Dict]]:
+        # Кандидаты без объяснения (сброшено пересчетом вероятностей), оцененные model_version
+        last_id = 0
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT id, file_hash FROM candidates WHERE explanation IS NULL AND file_hash IS NOT NULL "
+                    "AND model_version IS ? AND id > ? ORDER BY id LIMIT ?",
+                    (model_version, last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+            last_id = rows[-1]["id"]
+
+    def update_explanations(self, explanations: Sequence[Tuple[int, Optional[List[Dict]]]]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE candidates SET explanation = ?, updated_at = ? WHERE id = ?",
+                [(_dump_explanation(explanation), now, candidate_id) for candidate_id, explanation in explanations]
+            )
+
+    def delete_owner(self, owner: str) -> int:
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM candidates WHERE owner = ?", (owner,)).rowcount
@@ -0,0 +1,229 @@
+import hashlib
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from candidate_store import DB_PATH
+
+# Поиск почти одинаковых резюме (повторная выгрузка с hh.ru, копия из почты)
+# по MinHash-подписям шинглов предобработанного текста. Кандидаты на дубликат
+# ищутся через LSH-корзины в SQLite, поэтому проверка не перебирает всю базу.
+
+NUM_PERM = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 3
+# Оценка коэффициента Жаккара, начиная с которой резюме считаются одним кандидатом
+SIMILARITY_THRESHOLD = 0.8
+
+_PRIME = 4294967291  # наибольшее простое меньше 2^32
+_rng = np.random.RandomState(20240501)
+_PERM_A = _rng.randint(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS minhash_signatures (
+    candidate_id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    owner TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    candidate_id INTEGER NOT NULL,
+    PRIMARY KEY (owner, band, bucket, candidate_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_lsh_buckets_candidate ON lsh_buckets(candidate_id);
+CREATE TABLE IF NOT EXISTS candidate_duplicates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    representative_id INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    file_hash TEXT,
+    similarity REAL NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_candidate_duplicates_representative ON candidate_duplicates(representative_id);
+CREATE TRIGGER IF NOT EXISTS trg_candidates_dedup_cleanup AFTER DELETE ON candidates
+BEGIN
+    DELETE FROM minhash_signatures WHERE candidate_id = old.id;
+    DELETE FROM lsh_buckets WHERE candidate_id = old.id;
+    DELETE FROM candidate_duplicates WHERE representative_id = old.id;
+END;
+"""
+
+
+def signature(processed_text: str) -> Optional[np.ndarray]:
+    # Слишком короткий текст не дает шинглов, такие резюме не сравниваются
+    tokens = processed_text.split()
+    if len(tokens) < SHINGLE_SIZE:
+        return None
+    shingles = {zlib.crc32(" ".join(tokens[i:i + SHINGLE_SIZE]).encode("utf-8"))
+                for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    return ((np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def band_keys(sig: np.ndarray) -> List[Tuple[int, int]]:
+    keys = []
+    for band in range(LSH_BANDS):
+        digest = hashlib.blake2b(sig[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes(), digest_size=8).digest()
+        keys.append((band, int.from_bytes(digest, "little", signed=True)))
+    return keys
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+class DuplicateIndex:
+    """LSH-индекс MinHash-подписей и журнал дубликатов."""
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def find(self, owners: Optional[Sequence[str]], sig: np.ndarray) -> Optional[Tuple[int, float]]:
+        """
+        Самый похожий сохраненный кандидат выше порога среди кандидатов owners
+        (None - среди всех владельцев): (id, сходство) или None.
+        """
+        keys = band_keys(sig)
+        condition = " OR ".join(["(band = ? AND bucket = ?)"] * len(keys))
+        params = [value for key in keys for value in key]
+        owner_filter = ""
+        if owners is not None:
+            owners = sorted(set(owners))
+            owner_filter = f"owner IN ({', '.join('?' * len(owners))}) AND "
+            params = owners + params
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT s.candidate_id, s.signature FROM minhash_signatures s WHERE s.candidate_id IN ("
+                f"SELECT candidate_id FROM lsh_buckets WHERE {owner_filter}({condition}))",
+                params
+            ).fetchall()
+        best = None
+        for candidate_id, blob in rows:
+            score = similarity(sig, np.frombuffer(blob, dtype=np.uint32))
+            if score >= SIMILARITY_THRESHOLD and (best is None or score > best[1]):
+                best = (candidate_id, score)
+        return best
+
+    def add(self, owner: str, signatures: Sequence[Tuple[int, np.ndarray]]) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO minhash_signatures (candidate_id, owner, signature) VALUES (?, ?, ?)",
+                [(candidate_id, owner, sig.tobytes()) for candidate_id, sig in signatures]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO lsh_buckets (owner, band, bucket, candidate_id) VALUES (?, ?, ?, ?)",
+                [(owner, band, bucket, candidate_id)
+                 for candidate_id, sig in signatures for band, bucket in band_keys(sig)]
+            )
+
+    def owners_of(self, candidate_ids: Sequence[int]) -> Dict[int, str]:
+        ids = list(candidate_ids)
+        owners = {}
+        if not ids:
+            return owners
+        with self._connect() as conn:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                owners.update(conn.execute(
+                    f"SELECT candidate_id, owner FROM minhash_signatures "
+                    f"WHERE candidate_id IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall())
+        return owners
+
+    def record_duplicates(self, duplicates: Sequence[Tuple[int, str, Optional[str], float]]) -> None:
+        # duplicates - четверки (id представителя, имя файла, хеш PDF, сходство)
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO candidate_duplicates (representative_id, file_name, file_hash, similarity, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [duplicate + (now,) for duplicate in duplicates]
+            )
+
+    def duplicates_of(self, candidate_id: int) -> List[Dict]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT file_name, file_hash, similarity, ingested_at FROM candidate_duplicates "
+                "WHERE representative_id = ? ORDER BY ingested_at",
+                (candidate_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def index_missing(self, batch_size: int = 200) -> int:
+        # Подписи для кандидатов, сохраненных до появления дедупликации
+        from resume_pipeline import preprocess_resume
+
+        indexed = 0
+        last_id = 0
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT c.id, c.owner, c.raw_text FROM candidates c "
+                    "LEFT JOIN minhash_signatures s ON s.candidate_id = c.id "
+                    "WHERE s.candidate_id IS NULL AND c.raw_text IS NOT NULL AND c.id > ? ORDER BY c.id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return indexed
+            last_id = rows[-1][0]
+            by_owner = {}
+            for candidate_id, owner, raw_text in rows:
+                sig = signature(preprocess_resume(raw_text))
+                if sig is not None:
+                    by_owner.setdefault(owner, []).append((candidate_id, sig))
+            for owner, signatures in by_owner.items():
+                self.add(owner, signatures)
+                indexed += len(signatures)
+
+
+def cluster_batch(index: DuplicateIndex, owners: Optional[Sequence[str]], signatures: Sequence[Optional[np.ndarray]]):
+    """
+    Для каждой подписи пачки возвращает None, если документ новый, иначе
+    ("stored", id кандидата, сходство) или ("batch", номер документа пачки, сходство).
+    Сохраненные кандидаты ищутся среди owners (None - среди всех).
+    Внутри пачки дубликат всегда ссылается на первый документ кластера.
+    """
+    result = []
+    buckets = {}
+    for position, sig in enumerate(signatures):
+        if sig is None:
+            result.append(None)
+            continue
+        stored = index.find(owners, sig)
+        if stored is not None:
+            result.append(("stored",) + stored)
+            continue
+        keys = band_keys(sig)
+        best = None
+        for other in {other for key in keys for other in buckets.get(key, ())}:
+            score = similarity(sig, signatures[other])
+            if score >= SIMILARITY_THRESHOLD and (best is None or score > best[1]):
+                best = (other, score)
+        if best is not None:
+            result.append(("batch",) + best)
+            continue
+        result.append(None)
+        for key in keys:
+            buckets.setdefault(key, []).append(position)
+    return result
@@ -0,0 +1,68 @@
+import io
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import PatternFill, Font, Alignment
+from openpyxl.utils import get_column_letter
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def build_excel_export(display_df, threshold=0.19, green_threshold=0.81):
+    # Потоковая запись: строки сразу уходят в файл, цвет задается условным форматированием
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Результаты анализа")
+
+    headers = list(display_df.columns)
+    prob_col = headers.index("Вероятность класса 1")
+    comment_col = headers.index("Комментарий")
+    last_col = get_column_letter(len(headers))
+    prob_letter = get_column_letter(prob_col + 1)
+
+    for col_num in range(1, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = 15
+
+    header_font = Font(bold=True)
+    header_alignment = Alignment(horizontal='center', vertical='center')
+    header_fill = PatternFill(start_color="E0E0E0", end_color="E0E0E0", fill_type="solid")
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_font
+        cell.alignment = header_alignment
+        cell.fill = header_fill
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    # Вероятность пишем числом, чтобы по ней работали правила раскраски
+    probs = pd.to_numeric(
+        display_df.iloc[:, prob_col].astype(str).str.replace(',', '.', regex=False),
+        errors='coerce'
+    ).fillna(0).to_numpy()
+    comment_alignment = Alignment(wrap_text=True, vertical='top')
+
+    for row_idx, (row, prob) in enumerate(zip(display_df.itertuples(index=False, name=None), probs), 2):
+        values = list(row)
+        values[prob_col] = float(prob)
+        comment_cell = WriteOnlyCell(ws, value=values[comment_col])
+        comment_cell.alignment = comment_alignment
+        values[comment_col] = comment_cell
+        ws.row_dimensions[row_idx].height = 60  # Увеличиваем высоту строки для комментариев
+        ws.append(values)
+
+    n_rows = len(display_df)
+    if n_rows:
+        data_range = f"A2:{last_col}{n_rows + 1}"
+        prob_ref = f"${prob_letter}2"
+        for formula, color in (
+            (f"{prob_ref}>={green_threshold}", "CCFFCC"),  # зеленый
+            (f"{prob_ref}<{threshold}", "FFCCCC"),  # красный
+            (f"AND({prob_ref}>={threshold},{prob_ref}<{green_threshold})", "FFF6CC"),  # желтый
+        ):
+            fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+            ws.conditional_formatting.add(data_range, FormulaRule(formula=[formula], fill=fill, stopIfTrue=True))
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
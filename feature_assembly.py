@@ -0,0 +1,120 @@
+import weakref
+
+import numpy as np
+import scipy.sparse as sp
+
+# Модель обучена на признаках, которые помещаются в float32 без потери точности сплитов
+FEATURE_DTYPE = np.float32
+# Сколько строк за раз разворачивается в плотный вид перед CatBoost
+SCORE_CHUNK_ROWS = 256
+# Сколько признаков с наибольшим вкладом попадает в объяснение оценки
+EXPLAIN_TOP_K = 6
+# Approximate заметно быстрее точного расчета SHAP в CatBoost и для топа признаков дает тот же порядок
+EXPLAIN_SHAP_CALC_TYPE = "Approximate"
+
+_tfidf_terms = weakref.WeakKeyDictionary()
+
+
+def assemble_features(manual_rows, processed_texts, tfidf):
+    """
+    Собирает матрицу признаков [ручные признаки | TF-IDF] в формате CSR.
+
+    manual_rows - список словарей ручных признаков (порядок ключей как при обучении),
+    processed_texts - тексты после preprocess_resume в том же порядке.
+    """
+    keys = list(manual_rows[0].keys())
+    manual = np.array([[row[key] for key in keys] for row in manual_rows], dtype=FEATURE_DTYPE)
+    text_block = tfidf.transform(processed_texts).astype(FEATURE_DTYPE)
+    return sp.hstack([sp.csr_matrix(manual), text_block], format="csr", dtype=FEATURE_DTYPE)
+
+
+def scale_features(X, scaler):
+    """
+    Применяет параметры StandardScaler к CSR-матрице без промежуточных float64-копий.
+
+    Без центрирования результат остается разреженным. С центрированием нули
+    переходят в -mean/scale, поэтому блок разворачивается один раз в float32
+    и заполняется только по ненулевым элементам.
+    """
+    if not hasattr(scaler, "scale_") or not hasattr(scaler, "with_mean"):
+        # Неизвестный скейлер - используем его собственный transform
+        return np.asarray(scaler.transform(X.toarray()), dtype=FEATURE_DTYPE)
+
+    n_features = X.shape[1]
+    if getattr(scaler, "with_std", True) and scaler.scale_ is not None:
+        inv_scale = (1.0 / scaler.scale_).astype(FEATURE_DTYPE)
+    else:
+        inv_scale = np.ones(n_features, dtype=FEATURE_DTYPE)
+
+    if not scaler.with_mean:
+        return (X @ sp.diags(inv_scale, format="csr")).astype(FEATURE_DTYPE)
+
+    offset = (-scaler.mean_ * inv_scale).astype(FEATURE_DTYPE)
+    dense = np.tile(offset, (X.shape[0], 1))
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+    dense[rows, X.indices] += X.data * inv_scale[X.indices]
+    return dense
+
+
+def predict_proba_batch(model, scaler, X, chunk_rows=SCORE_CHUNK_ROWS):
+    """Возвращает вероятности класса 1 для всех строк X, масштабируя их порциями."""
+    probabilities = np.empty(X.shape[0], dtype=np.float64)
+    for start in range(0, X.shape[0], chunk_rows):
+        block = scale_features(X[start:start + chunk_rows], scaler)
+        probabilities[start:start + chunk_rows] = model.predict_proba(block)[:, 1]
+    return probabilities
+
+
+def tfidf_terms(tfidf):
+    # Слова словаря по номеру столбца; get_feature_names_out каждый раз строит массив заново
+    terms = _tfidf_terms.get(tfidf)
+    if terms is None:
+        terms = _tfidf_terms[tfidf] = tfidf.get_feature_names_out()
+    return terms
+
+
+def top_contributions(shap_values, X, manual_keys, terms, top_k=EXPLAIN_TOP_K):
+    """
+    Для каждой строки - до top_k признаков с наибольшим по модулю вкладом.
+    Ручные признаки рассматриваются все, слова TF-IDF - только те, что есть в резюме.
+    """
+    n_manual = len(manual_keys)
+    manual_columns = np.arange(n_manual)
+    explanations = []
+    for i in range(X.shape[0]):
+        start, end = X.indptr[i], X.indptr[i + 1]
+        values = dict(zip(X.indices[start:end].tolist(), X.data[start:end].tolist()))
+        present_terms = X.indices[start:end]
+        columns = np.concatenate([manual_columns, present_terms[present_terms >= n_manual]])
+        contributions = shap_values[i, columns]
+        explanation = []
+        for position in np.argsort(-np.abs(contributions))[:top_k]:
+            if contributions[position] == 0:
+                break
+            column = int(columns[position])
+            explanation.append({
+                "feature": manual_keys[column] if column < n_manual else str(terms[column - n_manual]),
+                "kind": "manual" if column < n_manual else "term",
+                "value": round(values.get(column, 0.0), 4),
+                "contribution": round(float(contributions[position]), 4)
+            })
+        explanations.append(explanation)
+    return explanations
+
+
+def explain_batch(model, scaler, X, manual_keys, tfidf, top_k=EXPLAIN_TOP_K, chunk_rows=SCORE_CHUNK_ROWS):
+    """
+    Объяснения оценок всех строк X: SHAP-вклады CatBoost (в логитах) считаются
+    одним вызовом на порцию, как и predict_proba_batch.
+    """
+    from catboost import Pool
+
+    terms = tfidf_terms(tfidf)
+    explanations = []
+    for start in range(0, X.shape[0], chunk_rows):
+        X_chunk = X[start:start + chunk_rows]
+        shap_values = model.get_feature_importance(Pool(scale_features(X_chunk, scaler)), type="ShapValues",
+                                                   shap_calc_type=EXPLAIN_SHAP_CALC_TYPE)
+        # Последний столбец - базовое значение модели, к признакам он не относится
+        explanations.extend(top_contributions(shap_values[:, :-1], X_chunk, manual_keys, terms, top_k))
+    return explanations
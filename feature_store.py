@@ -0,0 +1,318 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+import uuid
+import weakref
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from candidate_store import DB_PATH, CandidateStore
+
+# Хранилище собранных признаков [ручные признаки | TF-IDF] по хешу PDF.
+# Строки пишутся CSR-шардами (.npz), расположение строки - в индексе SQLite.
+# Признаки зависят только от текста и векторизатора, поэтому после замены
+# catboost_model.cbm достаточно прогнать скейлер и модель по сохраненной матрице.
+
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", "features")
+# Шарды меньше этого размера объединяются командой compact
+COMPACT_TARGET_ROWS = 50000
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feature_index (
+    file_hash TEXT NOT NULL,
+    version TEXT NOT NULL,
+    shard TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (file_hash, version)
+);
+CREATE INDEX IF NOT EXISTS idx_feature_index_shard ON feature_index(version, shard);
+"""
+
+_versions = weakref.WeakKeyDictionary()
+
+
+def vectorizer_version(tfidf, manual_keys: Sequence[str]) -> str:
+    """Отпечаток словаря и idf векторизатора вместе с порядком ручных признаков."""
+    version = _versions.get(tfidf)
+    if version is None:
+        digest = hashlib.sha1()
+        for term, column in sorted(tfidf.vocabulary_.items()):
+            digest.update(f"{term}\t{column}\n".encode("utf-8"))
+        idf = getattr(tfidf, "idf_", None)
+        if idf is not None:
+            digest.update(np.ascontiguousarray(idf, dtype=np.float64).tobytes())
+        version = _versions[tfidf] = digest.hexdigest()[:12]
+    manual = hashlib.sha1("\t".join(manual_keys).encode("utf-8")).hexdigest()[:6]
+    return f"{version}-{manual}"
+
+
+def manual_feature_names() -> List[str]:
+    # Порядок ключей такой же, как в assemble_features для любого документа
+    from resume_pipeline import prepare_document
+    return list(prepare_document("")[0].keys())
+
+
+class FeatureStore:
+    def __init__(self, root: str = FEATURE_STORE_DIR, db_path: str = DB_PATH):
+        self.root = root
+        self.db_path = db_path
+        os.makedirs(root, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(INDEX_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _shard_path(self, version: str, shard: str) -> str:
+        return os.path.join(self.root, version, f"{shard}.npz")
+
+    def _write_shard(self, version: str, X: sp.csr_matrix) -> str:
+        shard = f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+        path = self._shard_path(version, shard)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        sp.save_npz(tmp_path, X.tocsr(), compressed=True)
+        os.replace(tmp_path, path)
+        return shard
+
+    def known(self, version: str, file_hashes: Sequence[str]) -> set:
+        hashes = list(file_hashes)
+        known = set()
+        with self._connect() as conn:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                known.update(row[0] for row in conn.execute(
+                    f"SELECT file_hash FROM feature_index WHERE version = ? AND file_hash IN ({placeholders})",
+                    [version] + chunk
+                ))
+        return known
+
+    def put(self, version: str, file_hashes: Sequence[str], X: sp.csr_matrix) -> int:
+        """Сохраняет строки X под хешами PDF; уже сохраненные хеши и повторы в пачке пропускаются."""
+        known = self.known(version, file_hashes)
+        rows = []
+        hashes = []
+        for row, file_hash in enumerate(file_hashes):
+            if file_hash and file_hash not in known:
+                known.add(file_hash)
+                rows.append(row)
+                hashes.append(file_hash)
+        if not rows:
+            return 0
+        shard = self._write_shard(version, X[rows])
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO feature_index (file_hash, version, shard, row) VALUES (?, ?, ?, ?)",
+                [(file_hash, version, shard, row) for row, file_hash in enumerate(hashes)]
+            )
+        return len(rows)
+
+    def _locations(self, version: str) -> Dict[str, List[Tuple[int, str]]]:
+        by_shard = defaultdict(list)
+        with self._connect() as conn:
+            for file_hash, shard, row in conn.execute(
+                "SELECT file_hash, shard, row FROM feature_index WHERE version = ? ORDER BY shard, row", (version,)
+            ):
+                by_shard[shard].append((row, file_hash))
+        return by_shard
+
+    def load(self, version: str) -> Tuple[List[str], Optional[sp.csr_matrix]]:
+        """Все сохраненные строки версии: (хеши, CSR-матрица в том же порядке)."""
+        return self._gather(version, self._locations(version))
+
+    def get(self, version: str, file_hashes: Sequence[str]) -> Tuple[List[str], Optional[sp.csr_matrix]]:
+        """Строки версии для file_hashes: (найденные хеши, CSR-матрица в том же порядке)."""
+        hashes = list(dict.fromkeys(file_hash for file_hash in file_hashes if file_hash))
+        by_shard = defaultdict(list)
+        with self._connect() as conn:
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                for file_hash, shard, row in conn.execute(
+                    f"SELECT file_hash, shard, row FROM feature_index WHERE version = ? AND file_hash IN ({placeholders})",
+                    [version] + chunk
+                ):
+                    by_shard[shard].append((row, file_hash))
+        return self._gather(version, by_shard)
+
+    def _gather(self, version: str, by_shard) -> Tuple[List[str], Optional[sp.csr_matrix]]:
+        hashes = []
+        blocks = []
+        for shard, entries in by_shard.items():
+            X = sp.load_npz(self._shard_path(version, shard)).tocsr()
+            blocks.append(X[[row for row, _ in entries]])
+            hashes.extend(file_hash for _, file_hash in entries)
+        if not blocks:
+            return [], None
+        return hashes, sp.vstack(blocks, format="csr")
+
+    def compact(self, version: str, target_rows: int = COMPACT_TARGET_ROWS) -> int:
+        """Объединяет мелкие шарды версии в крупные; возвращает число удаленных шардов."""
+        small = {shard: entries for shard, entries in self._locations(version).items() if len(entries) < target_rows}
+        if len(small) < 2:
+            return 0
+        hashes = []
+        blocks = []
+        for shard, entries in small.items():
+            X = sp.load_npz(self._shard_path(version, shard)).tocsr()
+            blocks.append(X[[row for row, _ in entries]])
+            hashes.extend(file_hash for _, file_hash in entries)
+        merged = sp.vstack(blocks, format="csr")
+        new_shards = []
+        for start in range(0, len(hashes), target_rows):
+            shard = self._write_shard(version, merged[start:start + target_rows])
+            new_shards.extend((file_hash, version, shard, row)
+                              for row, file_hash in enumerate(hashes[start:start + target_rows]))
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO feature_index (file_hash, version, shard, row) VALUES (?, ?, ?, ?)",
+                new_shards
+            )
+        for shard in small:
+            os.remove(self._shard_path(version, shard))
+        return len(small)
+
+    def stats(self) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT version, COUNT(*), COUNT(DISTINCT shard) FROM feature_index GROUP BY version"
+            ).fetchall()
+        return [{"version": version, "rows": n_rows, "shards": n_shards} for version, n_rows, n_shards in rows]
+
+
+# --- Консольные команды ---
+def backfill(feature_store, store, tfidf, batch_size=256):
+    """Признаки для кандидатов, оцененных до появления хранилища: считаются по сохраненному тексту."""
+    from resume_pipeline import prepare_document
+    from feature_assembly import assemble_features
+
+    version = vectorizer_version(tfidf, manual_feature_names())
+    added = 0
+    for rows in store.iter_scored_texts(batch_size):
+        known = feature_store.known(version, [row["file_hash"] for row in rows])
+        missing = [row for row in rows if row["file_hash"] not in known]
+        if not missing:
+            continue
+        prepared = [prepare_document(row["raw_text"]) for row in missing]
+        X = assemble_features([manual for manual, _ in prepared], [text for _, text in prepared], tfidf)
+        added += feature_store.put(version, [row["file_hash"] for row in missing], X)
+        print(f"Добавлено признаков: {added}")
+    return added
+
+
+def rescore(feature_store, store, model, scaler, tfidf, threshold, model_version=None):
+    """
+    Пересчитывает вероятности всех кандидатов по сохраненным признакам. Объяснения
+    прежней модели сбрасываются: их считает отдельный проход explain или просмотр кандидата.
+    """
+    from feature_assembly import predict_proba_batch
+    from resume_pipeline import get_detailed_comment
+
+    manual_keys = manual_feature_names()
+    version = vectorizer_version(tfidf, manual_keys)
+    started = time.perf_counter()
+    hashes, X = feature_store.load(version)
+    if X is None:
+        print(f"Для версии векторизатора {version} признаков нет: запустите backfill")
+        return 0
+    loaded = time.perf_counter()
+    probabilities = dict(zip(hashes, predict_proba_batch(model, scaler, X)))
+    predicted = time.perf_counter()
+
+    # Комментарий зависит от класса, поэтому переписывается только у сменивших класс
+    updates = []
+    flipped = 0
+    for rows in store.iter_by_hashes(hashes):
+        for row in rows:
+            new_proba = float(probabilities[row["file_hash"]])
+            comment = row["comment"]
+            if (row["probability"] >= threshold) != (new_proba >= threshold) and row["raw_text"]:
+                comment, _ = get_detailed_comment(row["raw_text"], int(new_proba >= threshold), new_proba)
+                flipped += 1
+            updates.append((row["id"], new_proba, comment, None))
+    store.update_scores(updates, model_version)
+    print(f"Загрузка признаков: {loaded - started:.2f} с ({X.shape[0]} строк), "
+          f"модель: {predicted - loaded:.2f} с, всего: {time.perf_counter() - started:.2f} с")
+    print(f"Обновлено кандидатов: {len(updates)}, сменили класс: {flipped}")
+    return len(updates)
+
+
+def explain(feature_store, store, model, scaler, tfidf, model_version=None, batch_size=2000):
+    """Объяснения для кандидатов, у которых их сбросил rescore; SHAP считается порциями."""
+    from feature_assembly import explain_batch
+
+    manual_keys = manual_feature_names()
+    version = vectorizer_version(tfidf, manual_keys)
+    started = time.perf_counter()
+    explained = 0
+    for rows in store.iter_unexplained(model_version, batch_size):
+        hashes, X = feature_store.get(version, [row["file_hash"] for row in rows])
+        if X is None:
+            continue
+        explanations = dict(zip(hashes, explain_batch(model, scaler, X, manual_keys, tfidf)))
+        updates = [(row["id"], explanations[row["file_hash"]]) for row in rows if row["file_hash"] in explanations]
+        store.update_explanations(updates)
+        explained += len(updates)
+        print(f"Объяснено кандидатов: {explained}")
+    print(f"Объяснения: {time.perf_counter() - started:.2f} с, кандидатов: {explained}")
+    return explained
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Хранилище признаков и пересчет вероятностей без повторного разбора")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rescore_parser = subparsers.add_parser("rescore", help="Пересчитать вероятности текущей моделью")
+    rescore_parser.add_argument("--model", default=None, help="Путь к модели CatBoost (по умолчанию MODEL_PATH)")
+    rescore_parser.add_argument("--explain", action="store_true",
+                                help="Сразу пересчитать объяснения (иначе - при просмотре или командой explain)")
+    explain_parser = subparsers.add_parser("explain", help="Пересчитать объяснения, сброшенные rescore")
+    explain_parser.add_argument("--model", default=None, help="Путь к модели CatBoost (по умолчанию MODEL_PATH)")
+    subparsers.add_parser("backfill", help="Сохранить признаки кандидатов, оцененных раньше")
+    subparsers.add_parser("compact", help="Объединить мелкие шарды текущей версии")
+    subparsers.add_parser("stats", help="Показать содержимое хранилища")
+
+    args = parser.parse_args(argv)
+    feature_store = FeatureStore()
+    if args.command == "stats":
+        for entry in feature_store.stats():
+            print(f"{entry['version']}: строк {entry['rows']}, шардов {entry['shards']}")
+        return 0
+
+    from resume_pipeline import load_artifacts
+    from model_registry import MODEL_BUNDLE_DIR, bundle_checksum
+    from thresholds import load_thresholds
+
+    model_path = getattr(args, "model", None)
+    model, scaler, tfidf = load_artifacts(model_path, bundle_dir=MODEL_BUNDLE_DIR)
+    store = CandidateStore()
+    if args.command == "backfill":
+        backfill(feature_store, store, tfidf)
+    elif args.command == "compact":
+        removed = feature_store.compact(vectorizer_version(tfidf, manual_feature_names()))
+        print(f"Объединено шардов: {removed}")
+    else:
+        # С --model версия считается по этой модели вместе со скейлером и векторизатором комплекта
+        model_version = bundle_checksum(MODEL_BUNDLE_DIR, model_path=model_path)
+        if args.command == "rescore":
+            rescore(feature_store, store, model, scaler, tfidf, load_thresholds()["threshold"], model_version)
+        if args.command == "explain" or args.explain:
+            explain(feature_store, store, model, scaler, tfidf, model_version)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import scipy.sparse as sp
+
+import metrics
+from dedup import cluster_batch, signature
+from feature_store import vectorizer_version
+from pochtalion import MAIL_OWNER
+
+# Общий путь от разобранного PDF до строки в базе: интерфейс (app13), воркеры
+# очереди и консольная команда job_queue score оценивают и сохраняют кандидатов
+# одними функциями. Разбор PDF выполняет isolation, здесь - сборка кандидатов,
+# оценка пачкой, поиск дубликатов и запись в хранилище, поиск и признаки.
+
+
+def error_candidate(file_name, file_hash, error, failure=False):
+    """Строка для файла, который не удалось оценить; failure - сбой изолированного разбора (в карантин)."""
+    metrics.count("documents_failed")
+    return {
+        "file_name": file_name,
+        "file_hash": file_hash,
+        "probability": 0,
+        "phone": "-",
+        "position": "-",
+        "city": "-",
+        "age": "-",
+        "gender": "-",
+        "salary": "-",
+        "comment": f"Ошибка обработки файла: {error}",
+        "error": error,
+        "failure": failure
+    }
+
+
+def build_candidates(items: Sequence[Tuple[str, str]], analyses: Dict[int, Dict],
+                     missing_error: Callable[[str], str]):
+    """
+    items - пары (имя файла, хеш PDF), analyses - номер файла -> результат
+    analyze_documents; для файлов без разбора причину дает missing_error(хеш).
+    Возвращает (все строки по порядку items, кандидаты для оценки, их подготовленные признаки).
+    """
+    candidates = []
+    scored = []
+    prepared = []
+    for position, (file_name, file_hash) in enumerate(items):
+        analysis = analyses.get(position)
+        if analysis is None:
+            candidates.append(error_candidate(file_name, file_hash, missing_error(file_hash)))
+            continue
+        if "error" in analysis:
+            candidates.append(error_candidate(file_name, file_hash, analysis["error"], failure=True))
+            continue
+        if "[Ошибка]" in analysis["raw_text"]:
+            candidates.append(error_candidate(file_name, file_hash, analysis["raw_text"]))
+            continue
+        info = analysis["info"]
+        candidate = {
+            "file_name": file_name,
+            "file_hash": file_hash,
+            "phone": info["phone"],
+            "position": info["position"],
+            "city": info["city"],
+            "age": info["age"],
+            "gender": info["gender"],
+            "salary": info["salary"],
+            "raw_text": analysis["raw_text"],
+            "processed_text": analysis["processed_text"],
+            "matches": analysis["matches"]
+        }
+        candidates.append(candidate)
+        scored.append(candidate)
+        prepared.append((analysis["manual"], analysis["processed_text"]))
+    return candidates, scored, prepared
+
+
+def quarantine_failures(candidates) -> List[Tuple[str, str, str]]:
+    # Тройки для Quarantine.record_failures
+    return [(candidate["file_hash"], candidate["file_name"], candidate["error"])
+            for candidate in candidates if candidate.get("failure")]
+
+
+def apply_scores(scored, probabilities, explanations, threshold, model_version):
+    """Записывает в кандидатов вероятность, комментарий, объяснение и версию модели."""
+    from resume_pipeline import comment_from_matches
+
+    for candidate, raw_proba, explanation in zip(scored, probabilities, explanations):
+        raw_proba = float(raw_proba)
+        prediction = 1 if raw_proba >= threshold else 0
+        with metrics.timer("get_detailed_comment"):
+            candidate["comment"], _ = comment_from_matches(candidate["matches"], prediction)
+        candidate["probability"] = raw_proba
+        candidate["explanation"] = explanation
+        candidate["model_version"] = model_version
+    metrics.count("documents_scored", len(scored))
+
+
+def score_candidates(scored, prepared, model, scaler, tfidf, threshold, model_version):
+    """
+    Оценивает кандидатов одной разреженной матрицей. Строка признаков каждого
+    остается в candidate["features"] - (версия векторизатора, строка CSR), ее
+    сохраняет save_candidates, чтобы новую модель можно было применить без разбора PDF.
+    """
+    from resume_pipeline import assemble_prepared, score_features, explain_features
+
+    combined_features = assemble_prepared(prepared, tfidf)
+    manual_keys = list(prepared[0][0])
+    version = vectorizer_version(tfidf, manual_keys)
+    probabilities = score_features(combined_features, model, scaler)
+    explanations = explain_features(combined_features, model, scaler, manual_keys, tfidf)
+    for position, candidate in enumerate(scored):
+        candidate["features"] = (version, combined_features[position])
+    apply_scores(scored, probabilities, explanations, threshold, model_version)
+
+
+# --- Дубликаты ---
+def dedup_owners(owner) -> Optional[List[str]]:
+    """
+    Чьи сохраненные резюме считаются копиями: резюме с почты общие, поэтому
+    загрузка сверяется со своими и почтовыми, а почта - со всеми (None).
+    """
+    if owner == MAIL_OWNER:
+        return None
+    return [owner, MAIL_OWNER]
+
+
+def mark_duplicates(scored, owner, duplicate_index):
+    """
+    Помечает почти одинаковые резюме ключом duplicate_of (id сохраненного
+    кандидата или словарь представителя из пачки); возвращает позиции тех, что
+    нужно оценить. Копия резюме из чужой таблицы (например, с почты) владельцу
+    не видна, поэтому она оценивается и сохраняется у него со ссылкой
+    duplicate_of и отметкой stored_copy, остальные дубликаты пропускаются.
+    """
+    with metrics.timer("dedup_lookup", documents=len(scored)):
+        signatures = [signature(candidate["processed_text"]) for candidate in scored]
+        clusters = cluster_batch(duplicate_index, dedup_owners(owner), signatures)
+        stored_owners = duplicate_index.owners_of(
+            [cluster[1] for cluster in clusters if cluster is not None and cluster[0] == "stored"])
+    unique = []
+    copies = {}  # id чужого кандидата -> позиция его копии, сохраняемой из этой пачки
+    for position, (candidate, sig, cluster) in enumerate(zip(scored, signatures, clusters)):
+        candidate["minhash"] = sig
+        if cluster is None:
+            unique.append(position)
+            continue
+        kind, ref, similarity = cluster
+        candidate["duplicate_of"] = ref if kind == "stored" else scored[ref]
+        candidate["similarity"] = similarity
+        if kind == "stored" and stored_owners.get(ref) != owner:
+            own = duplicate_index.find([owner], sig)
+            if own is not None:
+                # Копия уже есть в таблице владельца - она и представитель
+                candidate["duplicate_of"], candidate["similarity"] = own
+                continue
+            if ref in copies:
+                # Вторая копия того же резюме в пачке - дубликат первой
+                candidate["duplicate_of"] = scored[copies[ref]]
+                continue
+            copies[ref] = position
+            candidate["stored_copy"] = True
+            unique.append(position)
+    metrics.count("duplicates_skipped", len(scored) - len(unique))
+    return unique
+
+
+def is_skipped_duplicate(candidate) -> bool:
+    # Такой дубликат не оценен и не сохраняется: его представитель уже есть в таблице владельца
+    return "duplicate_of" in candidate and not candidate.get("stored_copy")
+
+
+# --- Сохранение ---
+def save_candidates(store, owner, candidates, search_index, duplicate_index, feature_store):
+    """Записывает новых кандидатов, их поисковый индекс, MinHash-подписи и признаки; дубликаты - в журнал."""
+    # Пропущенные дубликаты в таблицу кандидатов не попадают, они записываются в журнал своего представителя
+    new_candidates = [candidate for candidate in candidates if not is_skipped_duplicate(candidate)]
+    with metrics.timer("candidate_store_insert", documents=len(new_candidates)):
+        ids = store.add_candidates(owner, new_candidates)
+    for candidate, candidate_id in zip(new_candidates, ids):
+        candidate["id"] = candidate_id
+    # Индекс обновляется сразу после записи, основы слов берутся из уже выполненной предобработки
+    documents = [(candidate["id"], candidate["raw_text"], candidate.get("processed_text"))
+                 for candidate in new_candidates if candidate.get("raw_text")]
+    with metrics.timer("search_index_update", documents=len(documents)):
+        search_index.add_documents(documents)
+
+    # Признаки нужны feature_store rescore; при оценке сервисом их сохраняет сам сервис
+    by_version = {}
+    for candidate in new_candidates:
+        if candidate.get("features") is not None:
+            version, row = candidate["features"]
+            by_version.setdefault(version, []).append((candidate["file_hash"], row))
+    for version, rows in by_version.items():
+        with metrics.timer("feature_store_put", documents=len(rows)):
+            feature_store.put(version, [file_hash for file_hash, _ in rows],
+                              sp.vstack([row for _, row in rows], format="csr"))
+
+    duplicate_index.add(owner, [(candidate["id"], candidate["minhash"])
+                                for candidate in new_candidates if candidate.get("minhash") is not None])
+    duplicates = []
+    for candidate in candidates:
+        if "duplicate_of" in candidate:
+            representative = candidate["duplicate_of"]
+            representative_id = representative if isinstance(representative, int) else representative["id"]
+            duplicates.append((representative_id, candidate["file_name"], candidate["file_hash"],
+                               candidate["similarity"]))
+    duplicate_index.record_duplicates(duplicates)
+    return ids
@@ -0,0 +1,336 @@
+import atexit
+import io
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing.connection import wait
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from candidate_store import DB_PATH
+import metrics
+
+try:
+    import resource
+except ImportError:  # Windows: лимит памяти не ставится, остается лимит времени
+    resource = None
+
+# Разбор PDF, извлечение полей и предобработка выполняются в отдельных процессах
+# с лимитом времени и памяти на документ. Зависший или раздувшийся процесс
+# убивается, документ получает строку с ошибкой, остальная пачка продолжается.
+# Пул процессов один на процесс приложения и переиспользуется между пачками.
+
+ISOLATION_ENABLED = os.getenv("ISOLATION_ENABLED", "1") != "0"
+ISOLATION_WORKERS = int(os.getenv("ISOLATION_WORKERS", str(min(4, os.cpu_count() or 1))))
+DOCUMENT_TIMEOUT_S = float(os.getenv("DOCUMENT_TIMEOUT_S", "20"))
+# Сколько памяти сверх уже загруженных словарей может занять один документ
+DOCUMENT_MEMORY_MB = int(os.getenv("DOCUMENT_MEMORY_MB", "512"))
+# После скольких сбоев один и тот же PDF больше не обрабатывается
+QUARANTINE_AFTER_FAILURES = int(os.getenv("QUARANTINE_AFTER_FAILURES", "2"))
+
+QUARANTINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quarantine (
+    file_hash TEXT PRIMARY KEY,
+    file_name TEXT,
+    reason TEXT NOT NULL,
+    failures INTEGER NOT NULL,
+    last_failed_at REAL NOT NULL
+);
+"""
+
+
+def analyze_pdf(pdf_bytes: bytes) -> Dict:
+    """Все недоверенные этапы обработки одного PDF: текст, поля анкеты, признаки."""
+    from resume_pipeline import ParsedDocument, extract_text_from_pdf, extract_resume_info, prepare_document
+
+    with metrics.timer("extract_text_from_pdf"):
+        raw_text = extract_text_from_pdf(io.BytesIO(pdf_bytes))
+    if "[Ошибка]" in raw_text:
+        return {"raw_text": raw_text}
+    # Текст разбирается один раз; совпадения словарей возвращаются для комментария
+    doc = ParsedDocument(raw_text)
+    manual, processed_text = prepare_document(doc)
+    with metrics.timer("extract_resume_info"):
+        info = extract_resume_info(doc)
+    return {
+        "raw_text": raw_text,
+        "info": info,
+        "matches": doc.matches(),
+        "manual": manual,
+        "processed_text": processed_text
+    }
+
+
+def _current_vm_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker_main(conn, memory_mb):
+    # Библиотеки загружаются до лимита памяти. Обычно их уже загрузил forkserver, но Python 3.11 не передает
+    # ему sys.path, и вне каталога репозитория preload молча не срабатывает: без этого импорта
+    # catboost и словари отображались бы в память уже под лимитом и не помещались
+    import resume_pipeline  # noqa: F401
+    if resource is not None and memory_mb:
+        # Лимит адресного пространства считается от уже занятого: словари и модель не в счет
+        limit = _current_vm_bytes() + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+        pdf_bytes, metrics_enabled = request
+        # Замеры этапов остаются в этом процессе, поэтому возвращаются вместе с результатом
+        metrics.set_enabled(metrics_enabled)
+        try:
+            with metrics.capture() as timings:
+                result = analyze_pdf(pdf_bytes)
+            result["timings"] = timings
+        except MemoryError:
+            conn.send({"error": f"превышен лимит памяти {memory_mb} МБ", "fatal": True})
+            return  # после MemoryError процесс лучше не переиспользовать
+        except Exception as e:
+            result = {"error": f"ошибка обработки: {e}"}
+        conn.send(result)
+
+
+class DocumentSandbox:
+    """
+    Пул изолированных процессов, общий для всех пачек процесса:
+
+        results = shared_sandbox().run([pdf_bytes, ...])
+
+    Каждый результат - словарь analyze_pdf или {"error": причина}.
+    run можно вызывать из нескольких потоков: каждый вызов берет свободные
+    воркеры, недостающие запускаются до n_workers.
+    """
+
+    def __init__(self, n_workers: int = ISOLATION_WORKERS, timeout_s: float = DOCUMENT_TIMEOUT_S,
+                 memory_mb: int = DOCUMENT_MEMORY_MB):
+        self.n_workers = max(1, n_workers)
+        self.timeout_s = timeout_s
+        self.memory_mb = memory_mb
+        if sys.platform == "win32":
+            self._context = multiprocessing.get_context("spawn")
+        else:
+            # Воркеры форкаются от однопоточного forkserver, а не от сервера Streamlit: fork многопоточного
+            # процесса может унести в дочерний захваченную блокировку (например, metrics._lock).
+            # Словари pymorphy3 и NLTK forkserver загружает один раз, воркеры их наследуют
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload(["resume_pipeline"])
+        self._idle = []
+        self._started = 0
+        self._cond = threading.Condition()
+        self.pid = os.getpid()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn, self.memory_mb), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _stop_worker(self, worker, kill=False):
+        process, conn = worker
+        if kill:
+            process.kill()
+        else:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        process.join(timeout=1)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+
+    def _acquire(self, wanted):
+        # Ждет хотя бы одного воркера: свободного или еще не запущенного в пределах n_workers
+        with self._cond:
+            while not self._idle and self._started >= self.n_workers:
+                self._cond.wait()
+            workers = [self._idle.pop() for _ in range(min(wanted, len(self._idle)))]
+            to_start = min(wanted - len(workers), self.n_workers - self._started)
+            self._started += to_start
+        started = 0
+        try:
+            for _ in range(to_start):
+                workers.append(self._start_worker())
+                started += 1
+        except Exception:
+            # Незапущенные места возвращаются в лимит, уже взятые воркеры - в пул
+            with self._cond:
+                self._started -= to_start - started
+            self._release(workers)
+            raise
+        return workers
+
+    def _release(self, workers):
+        with self._cond:
+            self._idle.extend(workers)
+            self._cond.notify_all()
+
+    def run(self, documents: Sequence[bytes], max_workers: Optional[int] = None) -> List[Dict]:
+        results: List[Optional[Dict]] = [None] * len(documents)
+        if not documents:
+            return results
+        pending = deque(range(len(documents)))
+        idle = self._acquire(min(max_workers or self.n_workers, len(documents)))
+        try:
+            self._run(documents, results, pending, idle)
+        finally:
+            self._release(idle)
+        return results
+
+    def _run(self, documents, results, pending, idle):
+        enabled = metrics.enabled()
+        busy = {}  # conn -> (воркер, номер документа, срок)
+
+        while pending or busy:
+            while pending and idle:
+                worker = idle.pop()
+                position = pending.popleft()
+                try:
+                    worker[1].send((documents[position], enabled))
+                except (BrokenPipeError, OSError):
+                    pending.appendleft(position)
+                    idle.append(self._replace(worker, kill=True))
+                    continue
+                busy[worker[1]] = (worker, position, time.monotonic() + self.timeout_s)
+
+            nearest = min(deadline for _, _, deadline in busy.values())
+            for conn in wait(list(busy), timeout=max(0.0, nearest - time.monotonic())):
+                worker, position, _ = busy.pop(conn)
+                try:
+                    results[position] = conn.recv()
+                except (EOFError, OSError):
+                    results[position] = {"error": "процесс обработки аварийно завершился "
+                                                  f"(код {worker[0].exitcode})"}
+                if results[position].pop("fatal", False) or not worker[0].is_alive():
+                    worker = self._replace(worker, kill=True)
+                idle.append(worker)
+
+            now = time.monotonic()
+            for conn, (worker, position, deadline) in list(busy.items()):
+                if now >= deadline:
+                    del busy[conn]
+                    results[position] = {"error": f"превышен лимит времени {self.timeout_s:.0f} с"}
+                    idle.append(self._replace(worker, kill=True))
+
+    def _replace(self, worker, kill=False):
+        self._stop_worker(worker, kill=kill)
+        return self._start_worker()
+
+    def close(self):
+        # Останавливаются свободные воркеры; занятые вернутся в пул уже после закрытия и не нужны
+        with self._cond:
+            workers, self._idle = self._idle, []
+            self._started -= len(workers)
+        for worker in workers:
+            self._stop_worker(worker)
+
+
+_sandbox = None
+_sandbox_lock = threading.Lock()
+
+
+def shared_sandbox() -> DocumentSandbox:
+    """Пул процесса; после fork (воркеры job_queue) дочерний процесс заводит свой."""
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is None or _sandbox.pid != os.getpid():
+            _sandbox = DocumentSandbox()
+            atexit.register(_sandbox.close)
+        return _sandbox
+
+
+def analyze_documents(documents: Sequence[bytes], n_workers: int = ISOLATION_WORKERS) -> List[Dict]:
+    """Обрабатывает пачку PDF в изоляции или, если она выключена, в текущем процессе."""
+    if not ISOLATION_ENABLED:
+        results = []
+        for pdf_bytes in documents:
+            try:
+                results.append(analyze_pdf(pdf_bytes))
+            except Exception as e:
+                results.append({"error": f"ошибка обработки: {e}"})
+        return results
+    results = shared_sandbox().run(documents, max_workers=n_workers)
+    for result in results:
+        # Этапы из воркеров попадают в метрики этого процесса, как при обработке без изоляции
+        for stage, seconds, n_documents in result.pop("timings", ()):
+            metrics.observe(stage, seconds, n_documents)
+    metrics.count("isolation_failures", sum(1 for result in results if "error" in result))
+    return results
+
+
+class Quarantine:
+    """PDF, которые уже роняли или вешали обработку, хранятся по sha256."""
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(QUARANTINE_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def blocked(self, file_hashes: Sequence[str]) -> Dict[str, str]:
+        """Хеши из карантина -> причина последнего сбоя."""
+        hashes = list(file_hashes)
+        if not hashes:
+            return {}
+        placeholders = ", ".join("?" * len(hashes))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT file_hash, reason FROM quarantine WHERE file_hash IN ({placeholders}) AND failures >= ?",
+                hashes + [QUARANTINE_AFTER_FAILURES]
+            ).fetchall()
+        return dict(rows)
+
+    def record_failures(self, failures: Sequence[Tuple[str, str, str]]) -> None:
+        # failures - тройки (хеш PDF, имя файла, причина)
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO quarantine (file_hash, file_name, reason, failures, last_failed_at) "
+                "VALUES (?, ?, ?, 1, ?) ON CONFLICT(file_hash) DO UPDATE SET "
+                "failures = failures + 1, reason = excluded.reason, file_name = excluded.file_name, "
+                "last_failed_at = excluded.last_failed_at",
+                [(file_hash, file_name, reason, now) for file_hash, file_name, reason in failures]
+            )
+
+    def entries(self) -> List[Dict]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("SELECT * FROM quarantine ORDER BY last_failed_at DESC").fetchall()
+        return [dict(row) for row in rows]
+
+    def release(self, file_hash: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM quarantine WHERE file_hash = ?", (file_hash,))
@@ -0,0 +1,450 @@
+import argparse
+import csv
+import json
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set
+
+import metrics
+
+# Очередь заданий на оценку в файле SQLite без внешних сервисов. Интерфейс,
+# загрузка с почты и консольная команда ставят задания, воркеры на одной или
+# нескольких машинах забирают их с арендой (lease): задание воркера, который
+# упал или завис и перестал продлевать аренду, достается другому. Результат
+# записывается в ту же базу, сохраняет его в candidates.db сторона, поставившая
+# задание. PDF передаются хешами, байты воркер читает из общего BLOB_DIR.
+#
+# Для нескольких машин база и BLOB_DIR должны лежать на общей файловой системе
+# с рабочими блокировками POSIX; журнал по умолчанию DELETE, так как WAL через
+# сетевую файловую систему не работает.
+
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "0") == "1"
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "jobs.db")
+JOB_QUEUE_JOURNAL_MODE = os.getenv("JOB_QUEUE_JOURNAL_MODE", "DELETE")
+JOB_LEASE_S = float(os.getenv("JOB_LEASE_S", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL_S = float(os.getenv("JOB_POLL_INTERVAL_S", "0.5"))
+# Файлов в одном задании: мелкие задания равномернее делятся между воркерами
+JOB_BATCH_FILES = int(os.getenv("JOB_BATCH_FILES", "8"))
+# Сколько секунд сторона, поставившая задание, ждет результата
+JOB_WAIT_TIMEOUT_S = float(os.getenv("JOB_WAIT_TIMEOUT_S", "900"))
+
+SCORE_PDFS = "score_pdfs"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_token TEXT,
+    lease_expires_at REAL,
+    worker TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);
+"""
+
+
+class JobQueue:
+    """
+    Очередь заданий с арендой:
+
+        job_ids = queue.enqueue(SCORE_PDFS, [payload, ...])
+        for job in queue.wait(job_ids):   # сторона, поставившая задания
+            ...
+        job = queue.claim("host:pid")     # воркер
+        queue.complete(job, result)
+    """
+
+    def __init__(self, db_path: str = JOB_QUEUE_DB):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(f"PRAGMA journal_mode={JOB_QUEUE_JOURNAL_MODE}")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _job(row) -> Dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def enqueue(self, kind: str, payloads: Sequence[Dict]) -> List[int]:
+        now = time.time()
+        ids = []
+        with self._connect() as conn:
+            for payload in payloads:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (kind, payload, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (kind, json.dumps(payload, ensure_ascii=False), now, now)
+                )
+                ids.append(cursor.lastrowid)
+        metrics.count("jobs_enqueued", len(ids))
+        return ids
+
+    def claim(self, worker: str, kinds: Sequence[str], lease_s: float = JOB_LEASE_S) -> Optional[Dict]:
+        """Берет самое старое свободное задание или задание с истекшей арендой."""
+        now = time.time()
+        token = uuid.uuid4().hex
+        placeholders = ", ".join("?" * len(kinds))
+        with self._connect() as conn:
+            # Задание, которое уже роняло воркеры JOB_MAX_ATTEMPTS раз, больше не выдается
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'аренда истекла ' || attempts || ' раз', "
+                "lease_token = NULL, updated_at = ? "
+                "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+                (now, now, JOB_MAX_ATTEMPTS)
+            )
+            # Один UPDATE с подзапросом атомарен: два воркера не получат одно задание
+            conn.execute(
+                f"UPDATE jobs SET status = 'running', lease_token = ?, lease_expires_at = ?, worker = ?, "
+                f"attempts = attempts + 1, updated_at = ? WHERE id = ("
+                f"SELECT id FROM jobs WHERE kind IN ({placeholders}) AND "
+                f"(status = 'queued' OR (status = 'running' AND lease_expires_at < ?)) ORDER BY id LIMIT 1)",
+                [token, now + lease_s, worker, now] + list(kinds) + [now]
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE lease_token = ?", (token,)).fetchone()
+        return self._job(row) if row else None
+
+    def heartbeat(self, job: Dict, lease_s: float = JOB_LEASE_S) -> bool:
+        # False - аренду уже перехватил другой воркер, результат этого воркера не нужен
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND lease_token = ?",
+                (time.time() + lease_s, time.time(), job["id"], job["lease_token"])
+            ).rowcount == 1
+
+    def complete(self, job: Dict, result) -> bool:
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, lease_token = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_token = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job["id"], job["lease_token"])
+            ).rowcount == 1
+
+    def fail(self, job: Dict, error: str) -> None:
+        # Ошибка обработчика - повтор, пока не исчерпаны попытки
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "error = ?, lease_token = NULL, updated_at = ? WHERE id = ? AND lease_token = ?",
+                (JOB_MAX_ATTEMPTS, error, time.time(), job["id"], job["lease_token"])
+            )
+
+    def get(self, job_ids: Sequence[int]) -> List[Dict]:
+        ids = list(job_ids)
+        if not ids:
+            return []
+        placeholders = ", ".join("?" * len(ids))
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM jobs WHERE id IN ({placeholders})", ids).fetchall()
+        return [self._job(row) for row in rows]
+
+    def wait(self, job_ids: Sequence[int], timeout: Optional[float] = JOB_WAIT_TIMEOUT_S,
+             poll_interval: float = JOB_POLL_INTERVAL_S) -> Iterator[Dict]:
+        """
+        Выдает задания по мере завершения (done или failed); по таймауту просто
+        возвращается. timeout=0 - один опрос без ожидания, None - ждать без срока.
+        """
+        pending = set(job_ids)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while pending:
+            placeholders = ", ".join("?" * len(pending))
+            with self._connect() as conn:
+                finished = [row["id"] for row in conn.execute(
+                    f"SELECT id FROM jobs WHERE id IN ({placeholders}) AND status IN ('done', 'failed')",
+                    list(pending)
+                )]
+            for job in self.get(finished):
+                pending.discard(job["id"])
+                yield job
+            if pending:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                time.sleep(poll_interval)
+
+    def delete(self, job_ids: Sequence[int]) -> None:
+        # Задания удаляются после того, как результат сохранен; еще не взятые - при отмене
+        ids = list(job_ids)
+        if not ids:
+            return
+        placeholders = ", ".join("?" * len(ids))
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM jobs WHERE id IN ({placeholders})", ids)
+
+    def pending_blob_hashes(self, since: float) -> Set[str]:
+        """Хеши PDF из незавершенных заданий и заданий, завершенных после since, но еще не забранных."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT payload FROM jobs WHERE kind = ? AND (status IN ('queued', 'running') OR updated_at >= ?)",
+                (SCORE_PDFS, since)
+            ).fetchall()
+        return {file_hash for row in rows for _, file_hash in json.loads(row["payload"])["items"]}
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+# --- Обработчик заданий оценки ---
+_blob_store = None
+
+
+def _shared_blob_store():
+    # Одно хранилище на процесс воркера: конструктор обходит весь каталог ради подсчета размера
+    global _blob_store
+    if _blob_store is None:
+        from blob_store import BlobStore, BLOB_DIR
+        _blob_store = BlobStore(BLOB_DIR, cache_max_bytes=0)
+    return _blob_store
+
+
+def encode_features(features):
+    # (версия, строка CSR) -> JSON результата задания
+    version, row = features
+    row = row.tocsr()
+    return {"version": version, "width": row.shape[1],
+            "indices": row.indices.tolist(), "data": row.data.tolist()}
+
+
+def decode_features(encoded):
+    import scipy.sparse as sp
+
+    indices, data = encoded["indices"], encoded["data"]
+    row = sp.csr_matrix((data, indices, [0, len(indices)]), shape=(1, encoded["width"]))
+    return encoded["version"], row
+
+
+def score_documents(items: Sequence[Sequence[str]], bundle, threshold: float) -> List[Dict]:
+    """
+    Оценивает PDF из общего хранилища: items - пары (имя файла, хеш PDF).
+    Для каждого файла возвращает строку кандидата, как ее строит интерфейс
+    (ingest.build_candidates), вместе с признаками для хранилища признаков.
+    Строки с ошибкой содержат "error", сбой разбора - "failure" (в карантин).
+    """
+    from isolation import analyze_documents
+    from ingest import build_candidates, score_candidates
+
+    blob_store = _shared_blob_store()
+    documents = [blob_store.get(file_hash) for _, file_hash in items]
+    present = [position for position, data in enumerate(documents) if data is not None]
+    # В воркере очереди документы разбираются по одному: параллельность дают сами воркеры
+    analyses = dict(zip(present, analyze_documents([documents[position] for position in present], n_workers=1)))
+    candidates, scored, prepared = build_candidates([tuple(item) for item in items], analyses,
+                                                    lambda file_hash: "PDF не найден в общем хранилище")
+    if scored:
+        score_candidates(scored, prepared, bundle.model, bundle.scaler, bundle.tfidf, threshold, bundle.version)
+    for candidate in scored:
+        # Совпадения словарей нужны только комментарию, он уже составлен
+        del candidate["matches"]
+        candidate["features"] = encode_features(candidate["features"])
+    return candidates
+
+
+def collect_job(job: Dict, owner: str, duplicate_index, quarantine) -> List[Dict]:
+    """
+    Результат задания в виде строк для ingest.save_candidates: сбои разбора
+    уходят в карантин, дубликаты помечаются так же, как при оценке в интерфейсе.
+    """
+    from ingest import error_candidate, mark_duplicates, quarantine_failures
+
+    if job["status"] == "failed":
+        return [error_candidate(file_name, file_hash, f"задание не выполнено: {job['error']}")
+                for file_name, file_hash in job["payload"]["items"]]
+    candidates = job["result"]
+    quarantine.record_failures(quarantine_failures(candidates))
+    scored = [candidate for candidate in candidates if "error" not in candidate]
+    for candidate in scored:
+        if candidate.get("features") is not None:
+            candidate["features"] = decode_features(candidate["features"])
+    if scored:
+        # Воркер не видит базу кандидатов владельца, поэтому дубликаты отсеиваются уже после оценки
+        mark_duplicates(scored, owner, duplicate_index)
+    return candidates
+
+
+# --- Воркеры ---
+def run_worker(queue: JobQueue, registry, handlers: Dict[str, Callable], worker: str,
+               lease_s: float = JOB_LEASE_S, poll_interval: float = JOB_POLL_INTERVAL_S,
+               stop: Optional[threading.Event] = None) -> None:
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        job = queue.claim(worker, list(handlers), lease_s)
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+
+        # Аренда продлевается, пока обработчик работает
+        done = threading.Event()
+
+        def keep_lease():
+            while not done.wait(lease_s / 3):
+                if not queue.heartbeat(job, lease_s):
+                    return
+
+        heartbeat = threading.Thread(target=keep_lease, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        started = time.perf_counter()
+        try:
+            with metrics.timer("job_total", documents=len(job["payload"].get("items", [])) or 1):
+                result = handlers[job["kind"]](job["payload"], registry.current())
+        except Exception as e:
+            queue.fail(job, f"{type(e).__name__}: {e}")
+            print(f"[{worker}] задание {job['id']} завершилось ошибкой: {e}")
+        else:
+            if queue.complete(job, result):
+                print(f"[{worker}] задание {job['id']} выполнено за {time.perf_counter() - started:.1f} с")
+            else:
+                print(f"[{worker}] задание {job['id']} уже передано другому воркеру, результат отброшен")
+        finally:
+            done.set()
+            heartbeat.join()
+
+
+def _score_handler(payload, bundle):
+    return score_documents(payload["items"], bundle, payload["threshold"])
+
+
+HANDLERS = {SCORE_PDFS: _score_handler}
+
+
+def run_workers(n_workers: int, db_path: str = JOB_QUEUE_DB) -> None:
+    """Родитель загружает модель и форкает воркеров, как worker_launcher."""
+    from model_registry import ModelRegistry
+
+    registry = ModelRegistry()
+    queue = JobQueue(db_path)
+    host = socket.gethostname()
+    children = []
+    for _ in range(n_workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                # Потоки не переживают fork: наблюдатель за файлами модели у каждого воркера свой
+                registry.start_watcher()
+                run_worker(queue, registry, HANDLERS, f"{host}:{os.getpid()}")
+            finally:
+                os._exit(0)
+        children.append(pid)
+    print(f"Запущено {n_workers} воркеров очереди {db_path} на {host}: {children}")
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for child in children:
+        os.waitpid(child, 0)
+
+
+# --- Консольные команды ---
+def score_files(queue: JobQueue, pdf_files: Sequence[str], threshold: float, output=None, owner=None) -> int:
+    """
+    Ставит файлы в очередь пачками по JOB_BATCH_FILES и пишет результаты в CSV по мере готовности.
+    С owner кандидаты сохраняются тем же путем, что и из интерфейса: дубликаты, поиск, признаки.
+    """
+    from blob_store import BlobStore, BLOB_DIR
+    from candidate_store import CandidateStore
+    from dedup import DuplicateIndex
+    from feature_store import FeatureStore
+    from ingest import save_candidates
+    from isolation import Quarantine
+    from search_index import SearchIndex
+
+    blob_store = BlobStore(BLOB_DIR)
+    items = []
+    for path in pdf_files:
+        with open(path, "rb") as f:
+            items.append((os.path.basename(path), blob_store.put(f.read())))
+    job_ids = queue.enqueue(SCORE_PDFS, [
+        {"items": items[start:start + JOB_BATCH_FILES], "threshold": threshold}
+        for start in range(0, len(items), JOB_BATCH_FILES)
+    ])
+
+    if owner:
+        store = CandidateStore()
+        search_index, duplicate_index, feature_store = SearchIndex(), DuplicateIndex(), FeatureStore()
+        quarantine = Quarantine()
+    started = time.perf_counter()
+    written = 0
+    out = open(output, "w", newline='', encoding='utf-8') if output else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(["Файл", "Вероятность класса 1", "Ошибка"])
+        for job in queue.wait(job_ids, timeout=None):
+            if job["status"] == "failed":
+                rows = [{"file_name": name, "error": job["error"]} for name, _ in job["payload"]["items"]]
+            else:
+                rows = job["result"]
+            for row in rows:
+                writer.writerow([row["file_name"], "" if "error" in row else f"{row['probability']:.4f}",
+                                 row.get("error", "")])
+            if owner:
+                save_candidates(store, owner, collect_job(job, owner, duplicate_index, quarantine),
+                                search_index, duplicate_index, feature_store)
+            written += len(rows)
+            queue.delete([job["id"]])
+            print(f"Готово {written} из {len(items)} ({time.perf_counter() - started:.1f} с)", file=sys.stderr)
+    finally:
+        if output:
+            out.close()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Очередь заданий оценки резюме и ее воркеры")
+    parser.add_argument("--db", default=JOB_QUEUE_DB, help="Файл очереди (общий для всех машин)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="Запустить воркеров на этой машине")
+    worker_parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    score_parser = subparsers.add_parser("score", help="Поставить PDF в очередь и дождаться оценки")
+    score_parser.add_argument("pdf_files", nargs="+")
+    score_parser.add_argument("--output", default=None, help="CSV-файл с результатами (по умолчанию stdout)")
+    score_parser.add_argument("--owner", default=None, help="Сохранить кандидатов в базу этого пользователя")
+    subparsers.add_parser("stats", help="Число заданий по статусам")
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        run_workers(args.workers, args.db)
+        return 0
+    queue = JobQueue(args.db)
+    if args.command == "stats":
+        for status, count in sorted(queue.stats().items()):
+            print(f"{status}: {count}")
+    else:
+        from thresholds import load_thresholds
+        score_files(queue, args.pdf_files, load_thresholds()["threshold"], args.output, args.owner)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
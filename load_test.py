@@ -0,0 +1,294 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmark import generate_corpus, load_pdf_dir, git_commit
+from session_memory import rss_bytes
+
+# Нагрузочный тест веб-интерфейса: несколько сессий app13.py выполняются без
+# браузера через streamlit.testing (AppTest) в одном процессе, как на сервере,
+# где все сессии делят кеши и модель. Каждая сессия входит в систему, загружает
+# пачку резюме, переключает выделение, открывает PDF и формирует Excel.
+#
+# Ограничения AppTest: file_uploader не поддерживается, поэтому пачка проходит
+# через process_pdf_stream - тот же путь, что у кнопки "Обработать файлы".
+# Фрагменты в AppTest перезапускают весь скрипт, так что задержки действий
+# внутри таблицы - оценка сверху.
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app13.py")
+REPO_DIR = os.path.dirname(APP_PATH)
+LOADTEST_PASSWORD = "loadtest"
+PERCENTILES = [50, 90, 95, 99]
+
+
+# --- Замер задержек и памяти ---
+class ActionLatency:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, action, seconds, error=None):
+        with self._lock:
+            self.samples.setdefault(action, []).append(seconds)
+            if error is not None:
+                self.errors.setdefault(action, []).append(error)
+
+    def summary(self):
+        result = {}
+        for action, samples in self.samples.items():
+            values = np.array(samples) * 1000
+            stats = {"calls": len(samples), "errors": len(self.errors.get(action, []))}
+            stats.update({f"p{q}_ms": round(float(np.percentile(values, q)), 1) for q in PERCENTILES})
+            stats["max_ms"] = round(float(values.max()), 1)
+            result[action] = stats
+        return result
+
+
+class RssSampler:
+    """Пик резидентной памяти процесса за время теста, опрос раз в interval секунд."""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def deep_sizeof(obj, seen=None):
+    # Приблизительный размер объекта вместе с вложенными; таблицы и массивы - по их буферам
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if hasattr(obj, "memory_usage") and hasattr(obj, "columns"):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def session_state_size(at):
+    try:
+        state = dict(at.session_state.filtered_state)
+    except AttributeError:
+        return None
+    return deep_sizeof(state)
+
+
+# --- Сценарий одной сессии ---
+def _ingest_script(owner, corpus):
+    # Выполняется внутри AppTest: тот же путь, что у кнопки "Обработать файлы"
+    import streamlit as st
+    import app13
+
+    st.session_state.username = owner
+    app13.process_pdf_stream(((name, data, None) for name, data in corpus), len(corpus), app13.load_model(),
+                             app13.load_thresholds(), app13.get_candidate_store(), owner)
+
+
+def _step(latency, action, run):
+    started = time.perf_counter()
+    try:
+        at = run()
+    except Exception as e:
+        latency.record(action, time.perf_counter() - started, f"{type(e).__name__}: {e}")
+        raise
+    error = at.exception[0].message if len(at.exception) else None
+    latency.record(action, time.perf_counter() - started, error)
+    return at
+
+
+def _keys(elements, prefix):
+    return [element.key for element in elements
+            if element.key and element.key.startswith(prefix) and element.key[len(prefix):].isdigit()]
+
+
+def simulate_user(username, corpus, latency, iterations=3, toggle_rows=3, timeout=60, upload_timeout=600):
+    """Один пользователь от входа до выгрузки; возвращает размер session_state в конце."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    _step(latency, "open_page", at.run)
+    at.text_input[0].input(username)
+    at.text_input[1].input(LOADTEST_PASSWORD)
+    _step(latency, "login", at.button[0].click().run)
+    if not at.session_state["authenticated"]:
+        raise RuntimeError(f"{username}: вход не выполнен")
+
+    ingest = AppTest.from_function(_ingest_script, default_timeout=upload_timeout,
+                                   kwargs={"owner": username, "corpus": corpus})
+    _step(latency, "upload_batch", ingest.run)
+
+    for _ in range(iterations):
+        _step(latency, "rerun", at.run)
+        _step(latency, "select_all", at.checkbox(key="select_all").check().run)
+        for key in _keys(at.checkbox, "select_")[:toggle_rows]:
+            _step(latency, "toggle_row", at.checkbox(key=key).uncheck().run)
+        _step(latency, "select_all", at.checkbox(key="select_all").uncheck().run)
+
+        pdf_keys = _keys(at.button, "pdf_")
+        if pdf_keys:
+            _step(latency, "open_pdf", at.button(key=pdf_keys[0]).click().run)
+            close = next((button for button in at.button if button.label == "Закрыть просмотр PDF"), None)
+            if close is not None:
+                _step(latency, "close_pdf", close.click().run)
+
+        # Excel строится один раз на версию данных, дальше показывается готовый файл
+        if any(button.key == "build_excel" for button in at.button):
+            _step(latency, "export_excel", at.button(key="build_excel").click().run)
+    return session_state_size(at)
+
+
+def write_users(usernames):
+    # Отдельный users.json в рабочей папке теста, настоящие учетные записи не трогаются
+    hashed = hashlib.sha256(LOADTEST_PASSWORD.encode()).hexdigest()
+    users = {username: {"password": hashed, "role": "user", "name": username} for username in usernames}
+    with open("users.json", "w", encoding="utf-8") as f:
+        json.dump(users, f, ensure_ascii=False, indent=4)
+
+
+def run_load_test(corpora, concurrency, ramp_up=0.0, warmup=True, **scenario):
+    usernames = [f"loadtest_{i:02d}" for i in range(len(corpora))]
+    write_users(usernames + ["loadtest_warmup"])
+
+    # Первая сессия загружает модель и словари; в замеры и базовую память она не входит
+    if warmup:
+        simulate_user("loadtest_warmup", corpora[0][:2], ActionLatency(), iterations=1,
+                      timeout=scenario.get("upload_timeout", 600))
+    baseline = rss_bytes()
+
+    latency = ActionLatency()
+    state_sizes = []
+    failures = []
+    started = time.perf_counter()
+    with RssSampler() as sampler, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = []
+        for username, corpus in zip(usernames, corpora):
+            futures.append((username, executor.submit(simulate_user, username, corpus, latency, **scenario)))
+            if ramp_up:
+                time.sleep(ramp_up)
+        for username, future in futures:
+            try:
+                size = future.result()
+                if size is not None:
+                    state_sizes.append(size)
+            except Exception as e:
+                failures.append(f"{username}: {type(e).__name__}: {e}")
+    elapsed = time.perf_counter() - started
+
+    users = len(usernames)
+    return {
+        "actions": latency.summary(),
+        "memory": {
+            "baseline_rss_mb": round(baseline / 2 ** 20, 1),
+            "peak_rss_mb": round(sampler.peak / 2 ** 20, 1),
+            "rss_per_user_mb": round((sampler.peak - baseline) / users / 2 ** 20, 2),
+            "session_state_mean_kb": round(float(np.mean(state_sizes)) / 1024, 1) if state_sizes else None,
+            "session_state_max_kb": round(max(state_sizes) / 1024, 1) if state_sizes else None
+        },
+        "elapsed_s": round(elapsed, 2),
+        "failed_sessions": failures
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест веб-интерфейса с несколькими сессиями")
+    parser.add_argument("--users", type=int, default=5, help="Число одновременных пользователей")
+    parser.add_argument("--concurrency", type=int, default=None, help="Сессий одновременно (по умолчанию все)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Пауза между стартами сессий, с")
+    parser.add_argument("--docs", type=int, default=20, help="Резюме в пачке каждого пользователя")
+    parser.add_argument("--jobs", type=int, default=3, help="Мест работы в каждом резюме (длина текста)")
+    parser.add_argument("--duties", type=int, default=5, help="Обязанностей на каждое место работы")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pdf-dir", default=None, help="Брать реальные PDF из папки вместо синтетики")
+    parser.add_argument("--iterations", type=int, default=3, help="Повторов сценария после загрузки")
+    parser.add_argument("--toggle-rows", type=int, default=3, help="Сколько строк переключать за повтор")
+    parser.add_argument("--timeout", type=float, default=60, help="Лимит одного перезапуска скрипта, с")
+    parser.add_argument("--upload-timeout", type=float, default=600, help="Лимит загрузки пачки, с")
+    parser.add_argument("--workdir", default=None, help="Папка для базы и файлов теста (по умолчанию временная)")
+    parser.add_argument("--no-warmup", action="store_true", help="Не прогревать модель отдельной сессией")
+    parser.add_argument("--output", default=None, help="JSON с результатами (по умолчанию loadtest_<commit>.json)")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    output = os.path.abspath(args.output or f"loadtest_{commit}.json")
+    if args.pdf_dir:
+        corpora = [load_pdf_dir(args.pdf_dir, limit=args.docs)] * args.users
+    else:
+        # У каждого пользователя свои резюме: иначе хранилище признаков и блобов отвечает из кеша
+        corpora = [generate_corpus(args.docs, n_jobs=args.jobs, duties_per_job=args.duties, seed=args.seed + i)
+                   for i in range(args.users)]
+
+    # База, блобы и users.json создаются в рабочей папке, модель берется из репозитория
+    workdir = args.workdir or tempfile.mkdtemp(prefix="aihr_loadtest_")
+    os.makedirs(workdir, exist_ok=True)
+    os.environ.setdefault("MODEL_BUNDLE_DIR", REPO_DIR)
+    os.environ.setdefault("MODEL_POLL_INTERVAL_S", "0")
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    print(f"Рабочая папка: {workdir}", file=sys.stderr)
+
+    result = run_load_test(
+        corpora, args.concurrency or args.users, ramp_up=args.ramp_up, warmup=not args.no_warmup,
+        iterations=args.iterations, toggle_rows=args.toggle_rows, timeout=args.timeout,
+        upload_timeout=args.upload_timeout
+    )
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "users": args.users,
+            "concurrency": args.concurrency or args.users,
+            "docs_per_user": len(corpora[0]) if corpora else 0,
+            "iterations": args.iterations
+        },
+        **result
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for action, stats in result["actions"].items():
+        print(f"{action:<14} n={stats['calls']:<5} p50 {stats['p50_ms']:>8.1f} мс  p95 {stats['p95_ms']:>8.1f} мс  "
+              f"p99 {stats['p99_ms']:>8.1f} мс  ошибок {stats['errors']}")
+    memory = result["memory"]
+    print(f"Память: базовая {memory['baseline_rss_mb']} МБ, пик {memory['peak_rss_mb']} МБ, "
+          f"на пользователя {memory['rss_per_user_mb']} МБ, session_state до {memory['session_state_max_kb']} КБ")
+    for failure in result["failed_sessions"]:
+        print(f"Сессия не завершена: {failure}", file=sys.stderr)
+    print(f"Результаты сохранены в {output}", file=sys.stderr)
+    return 1 if result["failed_sessions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
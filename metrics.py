@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+import numpy as np
+
+# Метрики процесса: таймеры этапов и счетчики. Выключенные метрики
+# сводятся к проверке одного флага и возврату пустого контекста.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+PROMETHEUS_FILE = os.getenv("METRICS_PROMETHEUS_FILE", "metrics.prom")
+# Сколько последних замеров каждого этапа хранится для расчета перцентилей
+RESERVOIR_SIZE = 2048
+
+_lock = threading.Lock()
+_enabled = METRICS_ENABLED
+_started_at = time.time()
+_timings = {}
+_counters = {}
+_NULL = nullcontext()
+# Замеры, которые поток собирает для передачи в другой процесс (см. capture)
+_captured = threading.local()
+
+
+class _StageStats:
+    __slots__ = ("count", "total", "documents", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.documents = 0
+        self.samples = deque(maxlen=RESERVOIR_SIZE)
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(value):
+    global _enabled
+    _enabled = bool(value)
+
+
+def reset():
+    global _started_at
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+        _started_at = time.time()
+
+
+def observe(stage, seconds, documents=1):
+    samples = getattr(_captured, "samples", None)
+    if samples is not None:
+        samples.append((stage, seconds, documents))
+    if not _enabled:
+        return
+    with _lock:
+        stats = _timings.get(stage)
+        if stats is None:
+            stats = _timings[stage] = _StageStats()
+        stats.count += 1
+        stats.total += seconds
+        stats.documents += documents
+        stats.samples.append(seconds)
+
+
+@contextmanager
+def _timer(stage, documents):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, documents)
+
+
+@contextmanager
+def capture():
+    """
+    Собирает замеры текущего потока списком (этап, секунды, документов).
+    Дочерний процесс отдает список вместе с результатом, родитель повторяет его через observe.
+    """
+    previous = getattr(_captured, "samples", None)
+    _captured.samples = []
+    try:
+        yield _captured.samples
+    finally:
+        _captured.samples = previous
+
+
+def timer(stage, documents=1):
+    """Контекстный менеджер замера этапа: with metrics.timer("preprocess_resume"): ..."""
+    if not _enabled:
+        return _NULL
+    return _timer(stage, documents)
+
+
+def timed(stage):
+    """Декоратор, замеряющий каждый вызов функции как один документ этапа stage."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _timer(stage, 1):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def cache_hit(cache, hit):
+    count(f"{cache}_cache_{'hits' if hit else 'misses'}")
+
+
+def snapshot():
+    """Сводка по этапам: число вызовов, p50/p95, документы в секунду."""
+    with _lock:
+        timings = {stage: (stats.count, stats.total, stats.documents, list(stats.samples))
+                   for stage, stats in _timings.items()}
+        counters = dict(_counters)
+    stages = []
+    for stage, (calls, total, documents, samples) in sorted(timings.items()):
+        values = np.array(samples) * 1000
+        stages.append({
+            "stage": stage,
+            "calls": calls,
+            "documents": documents,
+            "total_s": round(total, 3),
+            "p50_ms": round(float(np.percentile(values, 50)), 2) if len(values) else 0.0,
+            "p95_ms": round(float(np.percentile(values, 95)), 2) if len(values) else 0.0,
+            "docs_per_s": round(documents / total, 2) if total else None
+        })
+    caches = {}
+    for name, value in counters.items():
+        for suffix, field in (("_cache_hits", "hits"), ("_cache_misses", "misses")):
+            if name.endswith(suffix):
+                caches.setdefault(name[:-len(suffix)], {"hits": 0, "misses": 0})[field] = value
+    for stats in caches.values():
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+    return {"since": _started_at, "stages": stages, "counters": counters, "caches": caches}
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def to_prometheus():
+    """Текстовый формат Prometheus (для textfile-коллектора node_exporter)."""
+    with _lock:
+        timings = {stage: (stats.count, stats.total, stats.documents, list(stats.samples))
+                   for stage, stats in _timings.items()}
+        counters = dict(_counters)
+    lines = [
+        "# HELP resume_stage_seconds Время выполнения этапа обработки резюме",
+        "# TYPE resume_stage_seconds summary"
+    ]
+    for stage, (calls, total, _, samples) in sorted(timings.items()):
+        label = _escape_label(stage)
+        if samples:
+            for quantile in (0.5, 0.95):
+                lines.append(f'resume_stage_seconds{{stage="{label}",quantile="{quantile}"}} '
+                             f'{float(np.quantile(samples, quantile)):.6f}')
+        lines.append(f'resume_stage_seconds_sum{{stage="{label}"}} {total:.6f}')
+        lines.append(f'resume_stage_seconds_count{{stage="{label}"}} {calls}')
+    lines += [
+        "# HELP resume_stage_documents_total Документы, прошедшие этап",
+        "# TYPE resume_stage_documents_total counter"
+    ]
+    for stage, (_, _, documents, _) in sorted(timings.items()):
+        lines.append(f'resume_stage_documents_total{{stage="{_escape_label(stage)}"}} {documents}')
+    lines += [
+        "# HELP resume_events_total Счетчики событий (запросы, кеши, ошибки)",
+        "# TYPE resume_events_total counter"
+    ]
+    for name, value in sorted(counters.items()):
+        lines.append(f'resume_events_total{{name="{_escape_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=PROMETHEUS_FILE):
+    # Пишем через временный файл, чтобы коллектор не прочитал половину
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(to_prometheus())
+    os.replace(tmp_path, path)
+    return path
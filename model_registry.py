@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+import metrics
+
+# Горячая замена модели без перезапуска сервера. Комплект (CatBoost, скейлер,
+# TF-IDF) идентифицируется контрольной суммой файлов. Новый комплект грузится в
+# фоновом потоке и подменяется одной операцией присваивания: пачка, уже взявшая
+# старый комплект, дорабатывает на нем.
+
+logger = logging.getLogger(__name__)
+
+MODEL_BUNDLE_DIR = os.getenv("MODEL_BUNDLE_DIR", ".")
+MODEL_POLL_INTERVAL_S = float(os.getenv("MODEL_POLL_INTERVAL_S", "30"))
+
+ModelBundle = namedtuple("ModelBundle", ["version", "model", "scaler", "tfidf", "loaded_at"])
+
+
+def _file_signature(paths):
+    # Дешевая проверка по размеру и времени изменения, без чтения файлов
+    signature = []
+    for path in sorted(paths.values()):
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+def bundle_checksum(bundle_dir=MODEL_BUNDLE_DIR, model_path=None):
+    """
+    Версия комплекта - первые 12 символов sha256 по содержимому всех трех файлов.
+    model_path заменяет модель комплекта, как в load_artifacts.
+    """
+    from resume_pipeline import artifact_paths
+
+    paths = artifact_paths(bundle_dir)
+    if model_path:
+        paths["model"] = model_path
+    digest = hashlib.sha256()
+    for name, path in sorted(paths.items()):
+        digest.update(name.encode("utf-8"))
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def load_bundle(bundle_dir=MODEL_BUNDLE_DIR, version=None):
+    # version - уже посчитанная bundle_checksum, чтобы не читать файлы второй раз
+    from resume_pipeline import load_artifacts, prepare_document, score_prepared
+
+    version = version or bundle_checksum(bundle_dir)
+    model, scaler, tfidf = load_artifacts(bundle_dir=bundle_dir)
+    # Пробная оценка: несовместимый комплект не должен заменить рабочий
+    score_prepared([prepare_document("")], model, scaler, tfidf)
+    return ModelBundle(version, model, scaler, tfidf, time.time())
+
+
+class ModelRegistry:
+    """
+    Текущий комплект модели и фоновая проверка файлов:
+
+        bundle = registry.current()  # один раз на пачку
+        score(..., bundle.model, bundle.scaler, bundle.tfidf)
+    """
+
+    def __init__(self, bundle_dir=MODEL_BUNDLE_DIR, poll_interval=MODEL_POLL_INTERVAL_S):
+        from resume_pipeline import artifact_paths
+
+        self.bundle_dir = bundle_dir
+        self.poll_interval = poll_interval
+        self._paths = artifact_paths(bundle_dir)
+        self._signature = _file_signature(self._paths)
+        self._bundle = load_bundle(bundle_dir)
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self.loading = False
+        self.last_error = None
+        self.last_checked_at = time.time()
+
+    def current(self) -> ModelBundle:
+        return self._bundle
+
+    def check(self, wait=False):
+        """
+        Запускает фоновую загрузку, если файлы комплекта изменились. С wait=True
+        загружает в текущем потоке, сначала дождавшись уже идущей загрузки.
+        """
+        from resume_pipeline import artifact_paths
+
+        self.last_checked_at = time.time()
+        self._paths = artifact_paths(self.bundle_dir)
+        signature = _file_signature(self._paths)
+        if signature == self._signature:
+            return False
+        if wait:
+            self._reload(signature, blocking=True)
+            return True
+        if self.loading:
+            return False
+        thread = threading.Thread(target=self._reload, args=(signature,), name="model-reload", daemon=True)
+        thread.start()
+        return True
+
+    def _reload(self, signature, blocking=False):
+        if not self._reload_lock.acquire(blocking=blocking):
+            return
+        self.loading = True
+        try:
+            # Загрузка, которую дождались, могла уже принять эти файлы
+            if signature == self._signature:
+                return
+            # Файлы могут еще копироваться: грузим только если они не менялись секунду
+            time.sleep(1.0)
+            if _file_signature(self._paths) != signature:
+                return
+            with metrics.timer("model_reload", documents=0):
+                version = bundle_checksum(self.bundle_dir)
+                if version == self._bundle.version:
+                    self._signature = signature
+                    return
+                bundle = load_bundle(self.bundle_dir, version=version)
+            # Файлы поменялись во время чтения: версия может не соответствовать загруженному,
+            # комплект не принимается, следующая проверка загрузит его заново
+            if _file_signature(self._paths) != signature:
+                return
+            previous = self._bundle.version
+            self._bundle = bundle
+            self._signature = signature
+            self.last_error = None
+            metrics.count("model_reloads")
+            logger.info("Модель обновлена: %s -> %s", previous, bundle.version)
+        except Exception as e:
+            # Старый комплект остается рабочим; повторная попытка - при следующем изменении файлов
+            self._signature = signature
+            self.last_error = f"{type(e).__name__}: {e}"
+            metrics.count("model_reload_errors")
+            logger.error("Не удалось загрузить новую модель: %s", self.last_error)
+        finally:
+            self.loading = False
+            self._reload_lock.release()
+
+    def start_watcher(self):
+        if self._watcher is not None or self.poll_interval <= 0:
+            return
+
+        def watch():
+            while True:
+                time.sleep(self.poll_interval)
+                self.check()
+
+        self._watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def status(self):
+        bundle = self._bundle
+        return {
+            "version": bundle.version,
+            "loaded_at": bundle.loaded_at,
+            "loading": self.loading,
+            "last_error": self.last_error,
+            "last_checked_at": self.last_checked_at
+        }
@@ -2,15 +2,28 @@ import imaplib
 import email
 from email.header import decode_header
 import os
+import select
+import threading
+import time
 from dotenv import load_dotenv
 
-def download_pdfs():
-    """
-    Загружает PDF-файлы с почты и сохраняет их в папку resume.
-    
-    Returns:
-        list: Список путей к загруженным файлам
-    """
+import metrics
+
+# --- Настройки фонового опроса почты ---
+MAIL_POLL_ENABLED = os.getenv("MAIL_POLL_ENABLED", "0") == "1"
+# Базовый интервал опроса; после пустых опросов и ошибок он растет до максимума
+MAIL_POLL_INTERVAL_S = float(os.getenv("MAIL_POLL_INTERVAL_S", "60"))
+MAIL_POLL_MAX_INTERVAL_S = float(os.getenv("MAIL_POLL_MAX_INTERVAL_S", "900"))
+# RFC 2177: IDLE нужно перезапускать не реже, чем раз в 29 минут
+MAIL_IDLE_TIMEOUT_S = float(os.getenv("MAIL_IDLE_TIMEOUT_S", str(25 * 60)))
+# Пользователь, в таблицу которого попадают резюме с почты
+MAIL_OWNER = os.getenv("MAIL_OWNER", "admin")
+
+# Указываем папку, куда будем сохранять все вложения .pdf
+SAVE_DIR = "resume"
+
+
+def load_mail_settings():
     # Указываем путь к файлу с переменными окружения
     # Если файл находится в другом месте, измените путь
     env_path = "pochtalion.env"
@@ -23,86 +36,282 @@ def download_pdfs():
     EMAIL = os.getenv("EMAIL")
     PASSWORD = os.getenv("EMAIL_PASSWORD")
     IMAP_SERVER = os.getenv("IMAP_SERVER", "imap.yandex.com")
-    
+
     # Проверяем, что переменные с логином и паролем загружены
     if not EMAIL or not PASSWORD:
         raise ValueError("EMAIL или PASSWORD не указаны в переменных окружения")
-    
-    # Указываем папку, куда будем сохранять все вложения .pdf
-    SAVE_DIR = "resume"
-    
-    # Создаём директорию для сохранения PDF-файлов, если её ещё нет
+    return EMAIL, PASSWORD, IMAP_SERVER
+
+
+def connect(timeout=None):
+    EMAIL, PASSWORD, IMAP_SERVER = load_mail_settings()
+    # Подключаемся к почтовому серверу через защищенное соединение
+    mail = imaplib.IMAP4_SSL(IMAP_SERVER, timeout=timeout)
+    # Входим в почтовый ящик и выбираем папку "Входящие"
+    mail.login(EMAIL, PASSWORD)
+    mail.select("inbox")
+    return mail
+
+
+def save_attachments(message):
+    """Сохраняет PDF-вложения письма в SAVE_DIR и возвращает пути к ним."""
     os.makedirs(SAVE_DIR, exist_ok=True)
-    
+    saved = []
+    # Проходимся по частям письма (тело, вложения и т.д.)
+    for part in message.walk():
+        # Пропускаем контейнерные части (многочастные письма)
+        if part.get_content_maintype() == 'multipart':
+            continue
+        # Пропускаем части, у которых нет заголовка Content-Disposition (чаще всего это тело письма)
+        if part.get('Content-Disposition') is None:
+            continue
+
+        # Получаем имя вложенного файла
+        filename = part.get_filename()
+
+        if filename:
+            # Декодируем имя файла (может быть в base64 или других кодировках)
+            decoded_filename, encoding = decode_header(filename)[0]
+            if isinstance(decoded_filename, bytes):
+                decoded_filename = decoded_filename.decode(encoding or "utf-8")
+
+            # Проверяем, что файл действительно PDF
+            if decoded_filename.lower().endswith(".pdf"):
+                # Формируем путь, по которому сохраним файл
+                filepath = os.path.join(SAVE_DIR, decoded_filename)
+
+                # Сохраняем файл в указанную папку
+                with open(filepath, "wb") as f:
+                    f.write(part.get_payload(decode=True))
+
+                saved.append(filepath)
+                metrics.count("mail_attachments_saved")
+
+                print(f"Сохранен файл: {filepath}")
+    return saved
+
+
+def fetch_unseen(mail):
+    """Скачивает вложения всех непрочитанных писем открытой сессии; письма помечаются прочитанными."""
+    downloaded_files = []
+    # Ищем все непрочитанные письма
+    status, messages = mail.search(None, '(UNSEEN)')
+
+    # Получаем список ID писем (байты), разбиваем в список
+    email_ids = messages[0].split()
+
+    # Обрабатываем каждое письмо из найденных
+    for email_id in email_ids:
+        # Получаем сырое содержимое письма по ID
+        with metrics.timer("mail_fetch_message"):
+            res, msg_data = mail.fetch(email_id, "(RFC822)")
+        raw_email = msg_data[0][1]
+        metrics.count("mail_messages_fetched")
+
+        # Преобразуем байты в email-объект
+        downloaded_files.extend(save_attachments(email.message_from_bytes(raw_email)))
+    return downloaded_files
+
+
+@metrics.timed("mail_download_pdfs")
+def download_pdfs():
+    """
+    Загружает PDF-файлы с почты и сохраняет их в папку resume.
+
+    Returns:
+        list: Список путей к загруженным файлам
+    """
     # Список путей к загруженным файлам
     downloaded_files = []
-    
+
     try:
-        # Подключаемся к почтовому серверу через защищенное соединение
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-        
-        # Входим в почтовый ящик
-        mail.login(EMAIL, PASSWORD)
-        
-        # Выбираем папку "Входящие"
-        mail.select("inbox")
-        
-        # Ищем все непрочитанные письма
-        status, messages = mail.search(None, '(UNSEEN)')
-        
-        # Получаем список ID писем (байты), разбиваем в список
-        email_ids = messages[0].split()
-        
-        # Обрабатываем каждое письмо из найденных
-        for email_id in email_ids:
-            # Получаем сырое содержимое письма по ID
-            res, msg_data = mail.fetch(email_id, "(RFC822)")
-            raw_email = msg_data[0][1]
-            
-            # Преобразуем байты в email-объект
-            message = email.message_from_bytes(raw_email)
-            
-            # Проходимся по частям письма (тело, вложения и т.д.)
-            for part in message.walk():
-                # Пропускаем контейнерные части (многочастные письма)
-                if part.get_content_maintype() == 'multipart':
-                    continue
-                # Пропускаем части, у которых нет заголовка Content-Disposition (чаще всего это тело письма)
-                if part.get('Content-Disposition') is None:
-                    continue
-                
-                # Получаем имя вложенного файла
-                filename = part.get_filename()
-                
-                if filename:
-                    # Декодируем имя файла (может быть в base64 или других кодировках)
-                    decoded_filename, encoding = decode_header(filename)[0]
-                    if isinstance(decoded_filename, bytes):
-                        decoded_filename = decoded_filename.decode(encoding or "utf-8")
-                    
-                    # Проверяем, что файл действительно PDF
-                    if decoded_filename.lower().endswith(".pdf"):
-                        # Формируем путь, по которому сохраним файл
-                        filepath = os.path.join(SAVE_DIR, decoded_filename)
-                        
-                        # Сохраняем файл в указанную папку
-                        with open(filepath, "wb") as f:
-                            f.write(part.get_payload(decode=True))
-                        
-                        # Добавляем путь к файлу в список загруженных
-                        downloaded_files.append(filepath)
-                        
-                        print(f"Сохранен файл: {filepath}")
-        
+        mail = connect()
+        downloaded_files = fetch_unseen(mail)
+
         # Завершаем сессию и выходим из почтового ящика
         mail.logout()
-        
+
     except Exception as e:
+        metrics.count("mail_errors")
         print(f"Ошибка при загрузке резюме с почты: {e}")
-    
+
     return downloaded_files
 
+
+# --- Фоновый опрос почты ---
+class MailPoller:
+    """
+    Фоновый поток с постоянной IMAP-сессией. Если сервер поддерживает IDLE,
+    поток ждет уведомления о новом письме, иначе опрашивает ящик с интервалом,
+    который удваивается после пустых опросов и ошибок. Новые вложения
+    передаются в on_files(пути); при ошибке оценки файлы повторяются в следующем цикле.
+    """
+
+    def __init__(self, on_files, interval=MAIL_POLL_INTERVAL_S, max_interval=MAIL_POLL_MAX_INTERVAL_S,
+                 idle_timeout=MAIL_IDLE_TIMEOUT_S):
+        self.on_files = on_files
+        self.interval = interval
+        self.max_interval = max_interval
+        self.idle_timeout = idle_timeout
+        self._mail = None
+        self._pending = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._delay = interval
+        self.state = "остановлен"
+        self.idle_supported = None
+        self.last_poll_at = None
+        self.last_files = 0
+        self.files_total = 0
+        self.consecutive_errors = 0
+        self.last_error = None
+        self.last_error_at = None
+        self.next_poll_at = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mail-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        # Проверить ящик сейчас, не дожидаясь интервала или уведомления IDLE
+        self._wake.set()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _connect(self):
+        self.state = "подключение"
+        self._mail = connect(timeout=30)
+        self.idle_supported = "IDLE" in self._mail.capabilities
+
+    def _disconnect(self):
+        if self._mail is None:
+            return
+        try:
+            self._mail.logout()
+        except Exception:
+            pass
+        self._mail = None
+
+    def _poll(self):
+        if self._mail is None:
+            self._connect()
+        self.state = "загрузка"
+        # NOOP забирает у сервера изменения ящика, появившиеся с прошлого опроса
+        self._mail.noop()
+        with metrics.timer("mail_poll"):
+            self._pending.extend(fetch_unseen(self._mail))
+        self.last_poll_at = time.time()
+        self.last_files = len(self._pending)
+        if self._pending:
+            self.state = "оценка"
+            files = list(self._pending)
+            self.on_files(files)
+            self._pending = []
+            self.files_total += len(files)
+        return self.last_files
+
+    def _idle(self, timeout):
+        """Ждет в IDLE уведомления о новом письме; True - пришло письмо."""
+        mail = self._mail
+        # imaplib до Python 3.14 не умеет IDLE, команда отправляется вручную
+        tag = mail._new_tag()
+        mail.send(tag + b" IDLE\r\n")
+        if not mail.readline().startswith(b"+"):
+            raise imaplib.IMAP4.error("сервер отклонил IDLE")
+        self.state = "ожидание (IDLE)"
+        got_mail = False
+        deadline = time.monotonic() + timeout
+        # Строка читается только когда сокет готов: таймаут чтения ломает буферизованный файл imaplib,
+        # и все следующие readline падают с OSError. Короткое ожидание select - чтобы замечать wake и stop
+        while not got_mail and not self._wake.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            pending = getattr(mail.sock, "pending", None)  # расшифрованные, но не прочитанные данные SSL
+            if not (pending and pending()):
+                readable, _, _ = select.select([mail.sock], [], [], min(5.0, remaining))
+                if not readable:
+                    continue
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("сервер закрыл соединение")
+            got_mail = b"EXISTS" in line or b"RECENT" in line
+        mail.send(b"DONE\r\n")
+        while True:
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("сервер закрыл соединение")
+            if line.startswith(tag):
+                break
+            # Уведомление могло прийти вместе с другой строкой и остаться в буфере imaplib
+            got_mail = got_mail or b"EXISTS" in line or b"RECENT" in line
+        return got_mail
+
+    def _wait(self, delay):
+        self.next_poll_at = time.time() + delay
+        if self._mail is not None and self.idle_supported and not self._pending:
+            self._idle(min(delay, self.idle_timeout))
+        else:
+            self.state = "ожидание"
+            self._wake.wait(delay)
+        self._wake.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                found = self._poll()
+                if found or self.consecutive_errors:
+                    self._delay = self.interval
+                self.consecutive_errors = 0
+                self.last_error = None
+                metrics.count("mail_polls")
+                if self._stop.is_set():
+                    break
+                # При IDLE сервер сам сообщит о письме, интервал только ограничивает ожидание
+                self._wait(self.idle_timeout if self.idle_supported else self._delay)
+                if not found and not self.idle_supported:
+                    # Пустой опрос: реже ходим в ящик, пока письма не появятся
+                    self._delay = min(self._delay * 2, self.max_interval)
+            except Exception as e:
+                self.consecutive_errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                self.last_error_at = time.time()
+                metrics.count("mail_errors")
+                print(f"Ошибка опроса почты: {self.last_error}")
+                self._disconnect()
+                self._delay = min(self.interval * 2 ** self.consecutive_errors, self.max_interval)
+                self.state = "ошибка, повтор"
+                self.next_poll_at = time.time() + self._delay
+                self._wake.wait(self._delay)
+                self._wake.clear()
+        self._disconnect()
+        self.state = "остановлен"
+
+    def status(self):
+        return {
+            "state": self.state,
+            "running": self.running(),
+            "idle_supported": self.idle_supported,
+            "last_poll_at": self.last_poll_at,
+            "last_files": self.last_files,
+            "files_total": self.files_total,
+            "pending_files": len(self._pending),
+            "consecutive_errors": self.consecutive_errors,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "next_poll_at": self.next_poll_at
+        }
+
 if __name__ == "__main__":
     # Если файл запущен напрямую, вызываем функцию
     downloaded_files = download_pdfs()
-    print(f"Загружено {len(downloaded_files)} файлов")
\ No newline at end of file
+    print(f"Загружено {len(downloaded_files)} файлов")
@@ -0,0 +1,372 @@
+import os
+import re
+import string
+import joblib
+import fitz  # PyMuPDF
+import pdf2image
+import pymorphy3
+import nltk
+from nltk.corpus import stopwords
+from nltk.stem.snowball import SnowballStemmer
+from catboost import CatBoostClassifier
+
+import metrics
+from feature_assembly import assemble_features, predict_proba_batch, explain_batch
+
+# Общий конвейер обработки резюме: не зависит от Streamlit, поэтому его
+# используют и веб-интерфейс, и сервис оценки, и консольные скрипты.
+
+MODEL_PATH = "catboost_model.cbm"
+
+# Готовый набор стоп-слов (список NLTK для русского с правками из _build_stopwords)
+STOPWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stopwords.joblib")
+
+# --- Инициализация морфологического анализатора и стеммера ---
+morph = pymorphy3.MorphAnalyzer()
+stemmer = SnowballStemmer("russian")
+
+
+def _build_stopwords():
+    # Запасной путь без stopwords.joblib: список NLTK, скачивается, только если его нет в кеше
+    try:
+        default_stopwords = set(stopwords.words("russian"))
+    except LookupError:
+        nltk.download("stopwords", quiet=True)
+        default_stopwords = set(stopwords.words("russian"))
+    return (default_stopwords - {"без", "для", "по", "при", "над"}) | {
+        "резюме", "обновлено", "контакт", "зарплата", "телефон", "месяц", "лет",
+        "января", "февраля", "марта", "апреля", "мая", "июня", "июля", "августа",
+        "сентября", "октября", "ноября", "декабря", "должность", "работа",
+        "компания", "обязанности", "основной", "задача", "опыт", "место",
+        "года", "году", "владение", "информация", "образование", "гражданство"
+    }
+
+
+# Набор из репозитория: импорт не ходит в сеть (бенчмарк, сервис оценки, preload forkserver)
+custom_stopwords = set(joblib.load(STOPWORDS_PATH)) if os.path.exists(STOPWORDS_PATH) else _build_stopwords()
+
+# --- Ручные фичи ---
+features = {
+    "sales_experience": [
+        r"опыт.*прода", r"звонк[а-я]*", r"\bCRM\b", r"SPIN", r"AIDA", r"скрипт",
+        r"обработка заявк", r"воронк", r"телемаркет", r"менеджер по продаж"
+    ],
+    "hard_skills": [
+        r"возражен", r"переговор", r"следовать инструкц", r"многозада",
+        r"ведение.*переговор", r"обработка входящ", r"1с", r"excel", r"анализ"
+    ],
+    "soft_skills": [
+        r"мотивир", r"самостоят", r"проактив", r"обуча[еия]", r"дружелюб", r"стрессоустойчив",
+        r"клиентоориент", r"гибкост", r"адаптир", r"энергичн", r"настойчив", r"коммуникаб"
+    ],
+    "performance_metrics": [
+        r"конверс", r"выручк", r"чек", r"план", r"результат", r"рост.*конверс",
+        r"лояльн", r"возврат", r"kpi", r"достиж", r"удвоил", r"выполн", r"закрыт"
+    ]
+}
+
+# --- Словари для комментариев и разделы резюме ---
+# Нежелательные области опыта
+RED_FLAG_AREAS = {
+    "фитнес": ["фитнес", "тренер", "спортивный клуб", "фитнес центр", "тренажерный зал"],
+    "недвижимость": ["недвижимость", "риэлтор", "агент по недвижимости", "агентство недвижимости", "продажа квартир", "продажа домов"],
+    "авто": ["автосалон", "автомобили", "машины", "продажа авто", "автодилер", "продавец авто"],
+    "банки": ["банк", "кредитный специалист", "кредитный менеджер", "финансовый консультант", "ипотечный", "кредитные продукты"],
+    "салоны красоты": ["салон красоты", "косметика", "парикмахер", "стилист", "визажист", "косметолог"],
+    "продавец-консультант": ["продавец-консультант", "консультант по продажам", "продавец в магазине", "консультация покупателей", "работа в торговом зале"]
+}
+
+# Положительные индикаторы (телефонные продажи)
+POSITIVE_INDICATORS = [
+    "телефонные продажи", "холодные звонки", "телемаркетинг", "продажи по телефону",
+    "call-центр", "колл центр", "телефонные переговоры", "обзвон клиентов",
+    "холодная база", "лиды", "удаленные продажи", "оператор call-центра"
+]
+
+# Ключевые навыки для продаж
+SKILL_PATTERNS = {
+    "CRM": ["crm", "срм", "customer relationship management"],
+    "Холодные звонки": ["холодные звонки", "холодный обзвон", "холодная база"],
+    "Работа с возражениями": ["возражен", "работа с возражениями", "отработка возражений"],
+    "Ведение переговоров": ["переговоры", "ведение переговоров", "навыки переговоров"],
+    "SPIN/AIDA": ["spin", "aida", "техника продаж", "методы продаж"],
+    "Выполнение плана": ["план продаж", "выполнение плана", "перевыполнение плана", "плановые показатели"],
+    "Аналитика продаж": ["аналитика", "анализ продаж", "продажная воронка", "конверсия"]
+}
+
+# Заголовки разделов выгрузки hh.ru и метки, которыми их заменяет preprocess_resume
+SECTION_HEADINGS = {
+    "[COVER]": "сопроводительное письмо",
+    "[POSITION]": "желаемая должность и зарплата",
+    "[SPECIALIZATIONS]": "специализации",
+    "[SKILLS]": "навыки",
+    "[ABOUT]": "обо мне",
+    "[EXPERIENCE]": "опыт работы",
+    "[EDUCATION]": "образование",
+    "[LANGUAGES]": "знание языков",
+    "[EXTRA]": "дополнительная информация"
+}
+
+PHONE_RE = re.compile(r'\+7\s*\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}')
+POSITION_RE = re.compile(r"[жЖ]елаемая должность и зарплата\s*[:—]?\s*\s*(.*?)(?=\n|$)", re.IGNORECASE | re.DOTALL)
+CITY_RE = re.compile(r'(Москва|Санкт-Петербург|Екатеринбург|Казань|Новосибирск|Самара|Омск|Челябинск)')
+AGE_RE = re.compile(r',\s(\d{2})\s*(год|лет|года),')
+SALARY_RE = re.compile(r'\d{2,3}\s*(000|т.р.)\s*(₽|р|руб)')
+# Для признаков модели: ее обучали на тексте в нижнем регистре с переводами строк,
+# замененными пробелами, а с DOTALL "т.р." совпадает так же и в тексте с переводами
+SALARY_FEATURE_RE = re.compile(SALARY_RE.pattern, re.DOTALL)
+
+
+class ParsedDocument:
+    """
+    Текст резюме, разобранный один раз: поля анкеты, начала разделов и
+    совпадения словарей. Поля для таблицы, ручные признаки и комментарий
+    читаются отсюда, а не ищутся в тексте заново:
+
+        doc = ParsedDocument(raw_text)
+        info = extract_resume_info(doc)
+        manual, processed_text = prepare_document(doc)
+        comment, is_red_flag = comment_from_matches(doc.matches(), predicted_class)
+    """
+
+    def __init__(self, raw_text):
+        self.raw_text = raw_text
+        self.lower = raw_text.lower()
+        # Начало каждого раздела в тексте в нижнем регистре; -1, если раздела нет
+        self.sections = {tag: self.lower.find(heading) for tag, heading in SECTION_HEADINGS.items()}
+
+        # Поля анкеты ищутся в исходном тексте: их значения показываются как есть
+        phone_match = PHONE_RE.search(raw_text)
+        self.phone = phone_match.group() if phone_match else None
+        position_match = POSITION_RE.search(raw_text)
+        self.position = position_match.group(1).strip() if position_match else None
+        city_match = CITY_RE.search(raw_text)
+        self.city = city_match.group(1) if city_match else None
+        age_match = AGE_RE.search(raw_text)
+        self.age = int(age_match.group(1)) if age_match else None
+        salary_match = SALARY_RE.search(raw_text)
+        self.salary = re.sub(r'\D', '', salary_match.group(0)) if salary_match else None
+        # Возраст и зарплата для ручных признаков: совпадение в нижнем регистре находит
+        # и "25 Лет", и "50 000 РУБ", которых нет в поле анкеты
+        age_match = AGE_RE.search(self.lower)
+        self.feature_age = int(age_match.group(1)) if age_match else None
+        salary_match = SALARY_FEATURE_RE.search(self.lower)
+        self.feature_salary = re.sub(r'\D', '', salary_match.group(0)) if salary_match else None
+        head = self.lower[:500]
+        self.gender = "Женщина" if 'женщина,' in head else ("Мужчина" if 'мужчина,' in head else None)
+
+        # Совпадения словарей для комментария
+        self.red_flag_areas = [area for area, keywords in RED_FLAG_AREAS.items()
+                               if any(keyword in self.lower for keyword in keywords)]
+        self.has_phone_sales = any(indicator in self.lower for indicator in POSITIVE_INDICATORS)
+        self.sales_skills = [skill for skill, patterns in SKILL_PATTERNS.items()
+                             if any(pattern in self.lower for pattern in patterns)]
+
+    def matches(self):
+        # Все, что нужно комментарию; словарь без текста дешево передается между процессами
+        return {
+            "red_flag_areas": self.red_flag_areas,
+            "has_phone_sales": self.has_phone_sales,
+            "sales_skills": self.sales_skills
+        }
+
+
+def parse_document(text):
+    # Функции ниже принимают и строку, и уже разобранный документ
+    return text if isinstance(text, ParsedDocument) else ParsedDocument(text)
+
+# --- Функции для анализа резюме и комментирования (перенесены из comments.py) ---
+def detect_red_flag_areas(text):
+    doc = parse_document(text)
+    # Если есть red flags, но нет телефонных продаж
+    is_red_flag = bool(doc.red_flag_areas) and not doc.has_phone_sales
+    return is_red_flag, doc.red_flag_areas, doc.has_phone_sales
+
+def comment_from_matches(matches, predicted_class):
+    red_flag_areas = matches["red_flag_areas"]
+    has_phone_sales = matches["has_phone_sales"]
+    sales_skills = matches["sales_skills"]
+    is_red_flag = bool(red_flag_areas) and not has_phone_sales
+
+    # Начинаем с пустого комментария
+    comment = ""
+    
+    if is_red_flag:
+        red_flag_str = ", ".join(set(red_flag_areas))
+        comment += f"RED FLAG: Имеет опыт работы в областях: {red_flag_str}, но отсутствует опыт телефонных продаж."
+    elif red_flag_areas and has_phone_sales:
+        red_flag_str = ", ".join(set(red_flag_areas))
+        comment += f"Имеет опыт работы в областях: {red_flag_str}, но присутствует опыт телефонных продаж, что является положительным фактором."
+    elif has_phone_sales:
+        comment += "Кандидат имеет опыт телефонных продаж, что соответствует требованиям позиции."
+    elif predicted_class == 0:
+        comment += "Недостаточное соответствие требованиям."
+    
+    # Анализ наличия ключевых навыков для продаж
+    if sales_skills:
+        skills_str = ", ".join(sales_skills)
+        comment += f" Обладает следующими навыками: {skills_str}."
+    else:
+        comment += " В резюме не указаны ключевые навыки для телефонных продаж."
+    
+    return comment, is_red_flag
+
+def get_detailed_comment(text, predicted_class, relevance_prob):
+    return comment_from_matches(parse_document(text).matches(), predicted_class)
+
+# --- Загрузка модели и вспомогательных объектов ---
+def artifact_paths(bundle_dir="."):
+    # Файлы комплекта модели: CatBoost, скейлер и векторизатор (.pkl или .joblib)
+    paths = {"model": os.path.join(bundle_dir, MODEL_PATH)}
+    for name, stem in (("scaler", "scaler"), ("tfidf", "tfidf_vectorizer")):
+        pkl_path = os.path.join(bundle_dir, f"{stem}.pkl")
+        paths[name] = pkl_path if os.path.exists(pkl_path) else os.path.join(bundle_dir, f"{stem}.joblib")
+    return paths
+
+def load_artifacts(model_path=None, mmap_mode=None, bundle_dir="."):
+    # mmap_mode="r" отображает массивы joblib в память вместо копирования,
+    # так их страницы делятся между процессами
+    paths = artifact_paths(bundle_dir)
+    model_path = model_path or paths["model"]
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Файл модели {model_path} не найден!")
+    model = CatBoostClassifier()
+    model.load_model(model_path)
+    scaler = joblib.load(paths["scaler"], mmap_mode=mmap_mode)
+    tfidf = joblib.load(paths["tfidf"], mmap_mode=mmap_mode)
+    return model, scaler, tfidf
+
+# --- Функции обработки ---
+def extract_text_from_pdf(pdf_file):
+    try:
+        doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
+        text = ""
+        for page in doc:
+            text += page.get_text()
+        doc.close()
+        return text
+    except Exception as e:
+        return f"[Ошибка] {e}"
+
+def render_pdf_pages(pdf_bytes):
+    # Значительно уменьшаем DPI для получения изображений меньшего размера
+    # Чем меньше DPI, тем меньше будет текст
+    return pdf2image.convert_from_bytes(
+        pdf_bytes,
+        dpi=72,  # Уменьшаем DPI до 72 (стандартное разрешение экрана)
+        fmt='jpeg',
+        size=(800, None)  # Ограничиваем ширину изображения 800 пикселями
+    )
+
+def extract_resume_info(text):
+    doc = parse_document(text)
+    return {
+        "phone": doc.phone or "-",
+        "position": doc.position or "-",
+        "city": doc.city or "-",
+        "age": str(doc.age) if doc.age is not None else "-",
+        "gender": doc.gender or "-",
+        "salary": doc.salary or "-"
+    }
+
+def preprocess_resume(text):
+    doc = parse_document(text)
+    text = doc.raw_text
+    cover_idx = doc.sections["[COVER]"]
+    position_idx = doc.sections["[POSITION]"]
+    if cover_idx != -1:
+        text = text[cover_idx:]
+    elif position_idx != -1:
+        text = text[position_idx:]
+    text = re.sub(r'Сопроводительное письмо', '[COVER]', text, flags=re.IGNORECASE)
+    text = re.sub(r'Желаемая должность и зарплата', '[POSITION]', text, flags=re.IGNORECASE)
+    text = re.sub(r'Специализации', '[SPECIALIZATIONS]', text, flags=re.IGNORECASE)
+    text = re.sub(r'Занятость:.*?Опыт работы —', 'Опыт работы —', text, flags=re.DOTALL)
+    text = text.split('История общения с кандидатом')[0]
+    text = re.sub(r'\S+@\S+', ' ', text)
+    text = PHONE_RE.sub(' ', text)
+    text = re.sub(r'http\S+|www\.\S+|\S+\.ru|\S+\.com', ' ', text)
+    months = r'(январ[ья]|феврал[ья]|марта?|апрел[ья]|ма[йя]|июн[ья]|июл[ья]|август[а]?|сентябр[ья]|октябр[ья]|ноябр[ья]|декабр[ья])'
+    text = re.sub(rf'{months}\s+\d{{4}}\s*[—-]\s*{months}\s+\d{{4}}', ' ', text, flags=re.IGNORECASE)
+    text = re.sub(rf'{months}\s+\d{{4}}', ' ', text, flags=re.IGNORECASE)
+    text = re.sub(r'\b\d{1,2}[./]\d{1,2}[./]\d{2,4}\b', ' ', text)
+    text = re.sub(r'\b\d{4}\b', ' ', text)
+    text = re.sub(r'\b\d+\b', ' ', text)
+    text = re.sub(r'<.*?>', ' ', text)
+    text = text.translate(str.maketrans('', '', string.punctuation + '•–—'))
+    replacements = {
+        r'Навыки': '[SKILLS]',
+        r'Обо мне': '[ABOUT]',
+        r'Опыт работы': '[EXPERIENCE]',
+        r'Образование': '[EDUCATION]',
+        r'Знание языков': '[LANGUAGES]',
+        r'Дополнительная информация': '[EXTRA]',
+    }
+    for pattern, tag in replacements.items():
+        text = re.sub(pattern, tag, text, flags=re.IGNORECASE)
+    text = text.lower()
+    words = re.findall(r'\b\w+\b', text)
+    processed_words = []
+    for word in words:
+        if word not in custom_stopwords:
+            lemma = morph.parse(word)[0].normal_form
+            stem = stemmer.stem(lemma)
+            processed_words.append(stem)
+    if len(processed_words) > 2:
+        processed_words = processed_words[:-2]
+    return ' '.join(processed_words)
+
+def extract_features(text, feature_dict):
+    text = text.lower()
+    return {
+        category: sum(int(re.search(pattern, text) is not None) for pattern in patterns)
+        for category, patterns in feature_dict.items()
+    }
+
+def extract_resume_features(text):
+    # Переводы строк не меняют ни одного признака, поэтому хватает текста в нижнем регистре
+    doc = parse_document(text)
+    lower = doc.lower
+    return {
+        'gender': {"Женщина": 1, "Мужчина": -1}.get(doc.gender, 0),
+        'age': doc.feature_age if doc.feature_age is not None else -1,
+        'salary': int(doc.feature_salary) if doc.feature_salary else -1,
+        'student': int('студент' in lower or 'учусь' in lower or 'очная' in lower),
+        'wants_sales_position': int('продаж' in lower),
+        'text_length': len(lower),
+        'num_digits': sum(c.isdigit() for c in lower),
+    }
+
+# --- Оценка ---
+def prepare_document(raw_text):
+    # Возвращает ручные признаки и текст для TF-IDF; принимает и ParsedDocument
+    with metrics.timer("parse_document"):
+        doc = parse_document(raw_text)
+    with metrics.timer("preprocess_resume"):
+        processed_text = preprocess_resume(doc)
+    with metrics.timer("extract_features"):
+        keyword_features = extract_features(processed_text, features)
+    with metrics.timer("extract_resume_features"):
+        resume_features = extract_resume_features(doc)
+    return keyword_features | resume_features, processed_text
+
+def assemble_prepared(prepared, tfidf):
+    manual_rows = [manual for manual, _ in prepared]
+    processed_texts = [text for _, text in prepared]
+    with metrics.timer("assemble_features", documents=len(prepared)):
+        return assemble_features(manual_rows, processed_texts, tfidf)
+
+def score_features(combined_features, model, scaler):
+    with metrics.timer("scale_and_predict_proba", documents=combined_features.shape[0]):
+        return predict_proba_batch(model, scaler, combined_features)
+
+def explain_features(combined_features, model, scaler, manual_keys, tfidf):
+    # Объяснения считаются пачкой сразу после оценки и сохраняются вместе с ней
+    with metrics.timer("explain_batch", documents=combined_features.shape[0]):
+        return explain_batch(model, scaler, combined_features, list(manual_keys), tfidf)
+
+def score_prepared(prepared, model, scaler, tfidf):
+    return score_features(assemble_prepared(prepared, tfidf), model, scaler)
+
+def score_texts(raw_texts, model, scaler, tfidf):
+    return score_prepared([prepare_document(text) for text in raw_texts], model, scaler, tfidf)
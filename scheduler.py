@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import metrics
+
+# Общий на процесс исполнитель оценки. Порции разных пользователей стоят в
+# отдельных очередях; свободный обработчик берет порцию у того, у кого сейчас
+# меньше всего выполняется, при равенстве - по кругу. Поэтому пачка из тысячи
+# файлов не задерживает пачку из пяти дольше, чем на одну порцию.
+
+# Один процессор остается под перерисовку страниц
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Допуск: сколько порций всех пользователей может ждать обработчика
+SCHEDULER_MAX_QUEUED = int(os.getenv("SCHEDULER_MAX_QUEUED", "64"))
+SCHEDULER_ADMIT_TIMEOUT_S = float(os.getenv("SCHEDULER_ADMIT_TIMEOUT_S", "60"))
+# Порций одного прогона в работе одновременно; при 1 следующая порция читается, пока оценивается текущая,
+# а поиск дубликатов видит все уже сохраненные порции
+SCHEDULER_STREAM_INFLIGHT = int(os.getenv("SCHEDULER_STREAM_INFLIGHT", "1"))
+
+
+def _pick(rotation, queued, running):
+    # Порядок выдачи: меньше выполняемых порций - раньше, при равенстве - по кругу
+    candidates = [owner for owner in rotation if queued.get(owner)]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda owner: (running.get(owner, 0), rotation.index(owner)))
+
+
+class SchedulerBusy(Exception):
+    """Очередь заполнена дольше допустимого времени ожидания."""
+
+
+class FairScheduler:
+    def __init__(self, workers=SCORING_WORKERS, max_queued=SCHEDULER_MAX_QUEUED):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._queues = OrderedDict()  # владелец -> очередь (future, fn, args, kwargs, поставлена)
+        self._running = {}  # владелец -> число выполняемых порций
+        self._queued = 0
+        self._completed = 0
+        self._cond = threading.Condition()
+        self._threads = [threading.Thread(target=self._work, name=f"scoring-worker-{n}", daemon=True)
+                         for n in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, owner, fn, *args, timeout=SCHEDULER_ADMIT_TIMEOUT_S, **kwargs) -> Future:
+        """Ставит fn(*args, **kwargs) в очередь владельца; при полной очереди ждет не дольше timeout."""
+        future = Future()
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._queued < self.max_queued, timeout):
+                metrics.count("scheduler_rejected")
+                raise SchedulerBusy(f"в очереди {self._queued} порций, свободного места нет {timeout:.0f} с")
+            self._queues.setdefault(owner, deque()).append((future, fn, args, kwargs, time.perf_counter()))
+            self._queued += 1
+            self._cond.notify_all()
+        return future
+
+    def _next(self):
+        owner = _pick(list(self._queues), {owner: len(queue) for owner, queue in self._queues.items()}, self._running)
+        if owner is None:
+            return None, None
+        task = self._queues[owner].popleft()
+        if not self._queues[owner]:
+            del self._queues[owner]
+        else:
+            self._queues.move_to_end(owner)
+        self._queued -= 1
+        self._running[owner] = self._running.get(owner, 0) + 1
+        return owner, task
+
+    def _work(self):
+        while True:
+            with self._cond:
+                owner, task = self._next()
+                while task is None:
+                    self._cond.wait()
+                    owner, task = self._next()
+                # Освободилось место в очереди для ждущих submit
+                self._cond.notify_all()
+            future, fn, args, kwargs, enqueued_at = task
+            try:
+                if future.set_running_or_notify_cancel():
+                    metrics.observe("scheduler_wait", time.perf_counter() - enqueued_at, documents=0)
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running[owner] -= 1
+                    if not self._running[owner]:
+                        del self._running[owner]
+                    self._completed += 1
+                    self._cond.notify_all()
+
+    def position(self, owner):
+        """Сколько порций других владельцев будет выдано раньше очередной порции owner; None - ничего не ждет."""
+        with self._cond:
+            if not self._queues.get(owner):
+                return None
+            queued = {name: len(queue) for name, queue in self._queues.items()}
+            running = dict(self._running)
+            rotation = list(self._queues)
+        # Повторяем выбор _next на копии, пока не дойдет очередь до owner
+        ahead = 0
+        while True:
+            chosen = _pick(rotation, queued, running)
+            if chosen == owner:
+                return ahead
+            ahead += 1
+            queued[chosen] -= 1
+            running[chosen] = running.get(chosen, 0) + 1
+            rotation.remove(chosen)
+            rotation.append(chosen)
+
+    def stats(self):
+        with self._cond:
+            owners = set(self._queues) | set(self._running)
+            return {
+                "workers": self.workers,
+                "busy": sum(self._running.values()),
+                "queued": self._queued,
+                "completed": self._completed,
+                "owners": {owner: {"queued": len(self._queues.get(owner, ())), "running": self._running.get(owner, 0)}
+                           for owner in sorted(owners)}
+            }
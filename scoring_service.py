@@ -0,0 +1,319 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Адрес сервиса для клиентов; если переменная не задана, оценка идет в процессе
+SCORING_SERVICE_URL = os.getenv("SCORING_SERVICE_URL")
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class MicroBatcher:
+    """
+    Объединяет запросы, пришедшие в пределах max_wait_ms, в один вызов predict_proba.
+
+    В очередь попадают уже подготовленные документы (ручные признаки и текст
+    для TF-IDF): их готовит клиент или, для запросов с сырым текстом, поток
+    запроса. Признаки собираются здесь векторизатором сервиса, поэтому и в
+    хранилище признаков они пишутся под его версией.
+    """
+
+    def __init__(self, model, scaler, tfidf, max_batch=64, max_wait_ms=5.0, model_version=None,
+                 feature_store=None, manual_keys=None):
+        from feature_store import manual_feature_names
+
+        self.model = model
+        self.scaler = scaler
+        self.tfidf = tfidf
+        self.model_version = model_version
+        self.feature_store = feature_store
+        # Ручные признаки, с которыми обучен пакет модели, в порядке столбцов
+        self.manual_keys = list(manual_keys) if manual_keys is not None else manual_feature_names()
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.requests_total = 0
+        self.documents_total = 0
+        self.batches_total = 0
+        self.batch_sizes = Counter()
+        self.busy_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name="scoring-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, prepared, file_hashes=None) -> Future:
+        # Результат - (вероятности, объяснения, версия векторизатора).
+        # Некорректный запрос отклоняется здесь ValueError и не попадает в общую пачку
+        prepared = [(self._check_manual(manual), processed_text) for manual, processed_text in prepared]
+        future = Future()
+        self._queue.put((prepared, file_hashes or [None] * len(prepared), future))
+        return future
+
+    def _check_manual(self, manual):
+        # Ключи сверяются с пакетом модели и переставляются в его порядок столбцов
+        if not isinstance(manual, dict):
+            raise ValueError("ручные признаки должны быть словарем")
+        missing = [key for key in self.manual_keys if key not in manual]
+        extra = [key for key in manual if key not in self.manual_keys]
+        if missing or extra:
+            raise ValueError(f"ручные признаки не совпадают с моделью: нет {missing}, лишние {extra}")
+        return {key: manual[key] for key in self.manual_keys}
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _collect(self):
+        # Ждем первый запрос без ограничения, остальные - не дольше max_wait
+        items = [self._queue.get()]
+        documents = len(items[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while documents < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            items.append(item)
+            documents += len(item[0])
+        return items
+
+    def _score(self, prepared):
+        from resume_pipeline import assemble_prepared, score_features, explain_features
+
+        X = assemble_prepared(prepared, self.tfidf)
+        probabilities = score_features(X, self.model, self.scaler).tolist()
+        explanations = explain_features(X, self.model, self.scaler, self.manual_keys, self.tfidf)
+        return X, probabilities, explanations
+
+    def _save_features(self, version, file_hashes, X):
+        if self.feature_store is None or not any(file_hashes):
+            return
+        try:
+            self.feature_store.put(version, file_hashes, X)
+        except Exception as e:
+            # Оценка важнее: без сохраненных признаков документ просто пересчитается при rescore
+            logger.warning("Не удалось сохранить признаки: %s", e)
+
+    def _run(self):
+        from feature_store import vectorizer_version
+
+        version = vectorizer_version(self.tfidf, self.manual_keys)
+        while True:
+            items = self._collect()
+            prepared = [doc for docs, _, _ in items for doc in docs]
+            file_hashes = [file_hash for _, hashes, _ in items for file_hash in hashes]
+            started = time.perf_counter()
+            try:
+                X, probabilities, explanations = self._score(prepared)
+            except Exception:
+                # Пачка упала - оцениваем запросы по одному, чтобы ошибка досталась только виновнику
+                for docs, hashes, future in items:
+                    try:
+                        X, probabilities, explanations = self._score(docs)
+                    except Exception as e:
+                        future.set_exception(e)
+                        continue
+                    self._save_features(version, hashes, X)
+                    future.set_result((probabilities, explanations, version))
+            else:
+                self._save_features(version, file_hashes, X)
+                offset = 0
+                for docs, _, future in items:
+                    future.set_result((probabilities[offset:offset + len(docs)],
+                                       explanations[offset:offset + len(docs)], version))
+                    offset += len(docs)
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self.requests_total += len(items)
+                self.documents_total += len(prepared)
+                self.batches_total += 1
+                self.batch_sizes[len(prepared)] += 1
+                self.busy_seconds += elapsed
+
+    def metrics(self) -> dict:
+        with self._lock:
+            avg_batch = self.documents_total / self.batches_total if self.batches_total else 0.0
+            return {
+                "queue_depth": self.queue_depth(),
+                "requests_total": self.requests_total,
+                "documents_total": self.documents_total,
+                "batches_total": self.batches_total,
+                "avg_batch_size": round(avg_batch, 2),
+                "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                "model_busy_seconds": round(self.busy_seconds, 3)
+            }
+
+
+def make_handler(batcher):
+    from resume_pipeline import prepare_document
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send_json(200, batcher.metrics())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                if "documents" in body:
+                    # Клиент уже подготовил документы: повторной лемматизации нет
+                    documents = body["documents"]
+                    prepared = [(document["manual"], document["processed_text"]) for document in documents]
+                    file_hashes = [document.get("file_hash") for document in documents]
+                else:
+                    prepared = [prepare_document(text) for text in body["texts"]]
+                    file_hashes = None
+                probabilities, explanations, version = (
+                    batcher.submit(prepared, file_hashes).result() if prepared else ([], [], None)
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                self._send_json(400, {"error": f"Некорректный запрос: {e}"})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {
+                "probabilities": probabilities,
+                "explanations": explanations,
+                "model_version": batcher.model_version,
+                "vectorizer_version": version
+            })
+
+        def log_message(self, format, *args):
+            # Не засоряем вывод строкой на каждый запрос
+            pass
+
+    return ScoringHandler
+
+
+def build_server(model, scaler, tfidf, host=DEFAULT_HOST, port=DEFAULT_PORT, max_batch=64,
+                 max_wait_ms=5.0, sock=None, model_version=None):
+    # sock - уже открытый слушающий сокет (общий для нескольких процессов при pre-fork)
+    from feature_store import FeatureStore
+
+    batcher = MicroBatcher(model, scaler, tfidf, max_batch=max_batch, max_wait_ms=max_wait_ms,
+                           model_version=model_version, feature_store=FeatureStore())
+    handler = make_handler(batcher)
+    if sock is None:
+        return ThreadingHTTPServer((host, port), handler)
+    server = ThreadingHTTPServer((host, port), handler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.server_name, server.server_port = host, port
+    return server
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, max_batch=64, max_wait_ms=5.0):
+    from resume_pipeline import load_artifacts
+    from model_registry import MODEL_BUNDLE_DIR, bundle_checksum
+
+    model, scaler, tfidf = load_artifacts(bundle_dir=MODEL_BUNDLE_DIR)
+    server = build_server(model, scaler, tfidf, host, port, max_batch, max_wait_ms,
+                          model_version=bundle_checksum(MODEL_BUNDLE_DIR))
+    print(f"Сервис оценки резюме запущен на http://{host}:{port} "
+          f"(пакет до {max_batch}, ожидание {max_wait_ms} мс)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# --- Клиент ---
+def score_remote(raw_texts: List[str], url: Optional[str] = None, timeout: float = 120) -> List[float]:
+    url = url or SCORING_SERVICE_URL or f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+    response = requests.post(f"{url.rstrip('/')}/score", json={"texts": list(raw_texts)}, timeout=timeout)
+    if response.status_code != 200:
+        raise Exception(f"Сервис оценки вернул ошибку: {response.status_code} - {response.text}")
+    return response.json()["probabilities"]
+
+
+def score_prepared_remote(prepared, file_hashes=None, url: Optional[str] = None, timeout: float = 120) -> dict:
+    """
+    Оценивает подготовленные документы (ручные признаки, текст для TF-IDF).
+    Ответ: probabilities, explanations, model_version и vectorizer_version сервиса;
+    признаки документов с file_hash сервис сам сохраняет в хранилище признаков.
+    """
+    url = url or SCORING_SERVICE_URL or f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+    hashes = list(file_hashes) if file_hashes is not None else [None] * len(prepared)
+    documents = [{"manual": manual, "processed_text": processed_text, "file_hash": file_hash}
+                 for (manual, processed_text), file_hash in zip(prepared, hashes)]
+    response = requests.post(f"{url.rstrip('/')}/score", json={"documents": documents}, timeout=timeout)
+    if response.status_code != 200:
+        raise Exception(f"Сервис оценки вернул ошибку: {response.status_code} - {response.text}")
+    return response.json()
+
+
+def service_metrics(url: Optional[str] = None, timeout: float = 5) -> dict:
+    url = url or SCORING_SERVICE_URL or f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+    return requests.get(f"{url.rstrip('/')}/metrics", timeout=timeout).json()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный сервис оценки резюме")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Запустить сервис")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--max-batch", type=int, default=64)
+    serve_parser.add_argument("--max-wait-ms", type=float, default=5.0)
+
+    score_parser = subparsers.add_parser("score", help="Оценить PDF через запущенный сервис")
+    score_parser.add_argument("pdf_files", nargs="+")
+    score_parser.add_argument("--url", default=None)
+
+    subparsers.add_parser("metrics", help="Показать метрики сервиса").add_argument("--url", default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.host, args.port, args.max_batch, args.max_wait_ms)
+    elif args.command == "score":
+        from resume_pipeline import extract_text_from_pdf
+
+        texts = []
+        for path in args.pdf_files:
+            with open(path, "rb") as f:
+                texts.append(extract_text_from_pdf(f))
+        for path, proba in zip(args.pdf_files, score_remote(texts, args.url)):
+            print(f"{proba:.3f}\t{path}")
+    elif args.command == "metrics":
+        print(json.dumps(service_metrics(args.url), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
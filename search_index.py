@@ -0,0 +1,196 @@
+import math
+import re
+import sqlite3
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from candidate_store import DB_PATH
+
+# Инвертированный индекс по оцененным резюме. Термы документа - основы слов,
+# которые уже дает preprocess_resume, и токены исходного текста (они сохраняют
+# то, что предобработка выбрасывает: "1с", города, цифры). Индекс лежит в той же
+# базе SQLite, что и кандидаты, и удаляется вместе с ними триггером.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_postings (
+    term TEXT NOT NULL,
+    candidate_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, candidate_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_search_postings_candidate ON search_postings(candidate_id);
+CREATE TABLE IF NOT EXISTS search_docs (
+    candidate_id INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS trg_candidates_search_cleanup AFTER DELETE ON candidates
+BEGIN
+    DELETE FROM search_postings WHERE candidate_id = old.id;
+    DELETE FROM search_docs WHERE candidate_id = old.id;
+END;
+"""
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+OR_OPERATORS = {"или", "or", "|"}
+_TOKEN_RE = re.compile(r'\w+')
+_QUERY_RE = re.compile(r'(-?)"([^"]+)"|(\S+)')
+
+
+def raw_tokens(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1]
+
+
+def document_terms(raw_text: str, processed_text: Optional[str] = None) -> Counter:
+    if processed_text is None:
+        from resume_pipeline import preprocess_resume
+        processed_text = preprocess_resume(raw_text)
+    terms = Counter(processed_text.split())
+    terms.update(raw_tokens(raw_text))
+    return terms
+
+
+def query_terms(word: str) -> Tuple[str, ...]:
+    # Слово запроса совпадает либо с основой (как в preprocess_resume), либо с токеном как есть
+    from resume_pipeline import morph, stemmer
+    word = word.lower()
+    stem = stemmer.stem(morph.parse(word)[0].normal_form)
+    return tuple(dict.fromkeys([stem, word]))
+
+
+def parse_query(query: str) -> List[Dict[str, List[Tuple[str, ...]]]]:
+    """
+    Разбирает булев запрос: слова через пробел - И, "ИЛИ"/"OR" - альтернатива,
+    "-слово" - исключение, фраза в кавычках - все ее слова обязательны.
+    Возвращает список альтернатив {"include": [...], "exclude": [...]}.
+    """
+    clauses = [{"include": [], "exclude": []}]
+    for negated_phrase, phrase, word in _QUERY_RE.findall(query):
+        if word and word.lower() in OR_OPERATORS:
+            if clauses[-1]["include"] or clauses[-1]["exclude"]:
+                clauses.append({"include": [], "exclude": []})
+            continue
+        negated = bool(negated_phrase) if phrase else word.startswith("-")
+        text = phrase if phrase else word.lstrip("-")
+        target = clauses[-1]["exclude" if negated else "include"]
+        target.extend(query_terms(token) for token in raw_tokens(text) or _TOKEN_RE.findall(text.lower()))
+    return [clause for clause in clauses if clause["include"] or clause["exclude"]]
+
+
+class SearchIndex:
+    """Инвертированный индекс с ранжированием BM25 поверх candidates.db."""
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_documents(self, documents: Iterable[Tuple[int, str, Optional[str]]]) -> int:
+        # documents - тройки (id кандидата, исходный текст, текст после preprocess_resume или None)
+        postings = []
+        lengths = []
+        for candidate_id, raw_text, processed_text in documents:
+            terms = document_terms(raw_text, processed_text)
+            postings.extend((term, candidate_id, tf) for term, tf in terms.items())
+            lengths.append((candidate_id, sum(terms.values())))
+        if not lengths:
+            return 0
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM search_postings WHERE candidate_id = ?",
+                             [(candidate_id,) for candidate_id, _ in lengths])
+            conn.executemany("INSERT INTO search_postings (term, candidate_id, tf) VALUES (?, ?, ?)", postings)
+            conn.executemany("INSERT OR REPLACE INTO search_docs (candidate_id, length) VALUES (?, ?)", lengths)
+        return len(lengths)
+
+    def index_missing(self, batch_size: int = 200) -> int:
+        # Догоняет индекс для кандидатов, оцененных до его появления
+        indexed = 0
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT c.id, c.raw_text FROM candidates c "
+                    "LEFT JOIN search_docs d ON d.candidate_id = c.id "
+                    "WHERE d.candidate_id IS NULL AND c.raw_text IS NOT NULL LIMIT ?",
+                    (batch_size,)
+                ).fetchall()
+            if not rows:
+                return indexed
+            indexed += self.add_documents((candidate_id, raw_text, None) for candidate_id, raw_text in rows)
+
+    def _postings(self, owner: str, terms: List[str]):
+        placeholders = ", ".join("?" * len(terms))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT p.term, p.candidate_id, p.tf, d.length FROM search_postings p "
+                f"JOIN search_docs d ON d.candidate_id = p.candidate_id "
+                f"JOIN candidates c ON c.id = p.candidate_id "
+                f"WHERE p.term IN ({placeholders}) AND c.owner = ?",
+                terms + [owner]
+            ).fetchall()
+            n_docs, avg_length = conn.execute(
+                "SELECT COUNT(*), AVG(d.length) FROM search_docs d "
+                "JOIN candidates c ON c.id = d.candidate_id WHERE c.owner = ?",
+                (owner,)
+            ).fetchone()
+        return rows, n_docs, avg_length or 1.0
+
+    def search(self, owner: str, query: str, mode: str = "ranked", limit: int = 100) -> List[Tuple[int, float]]:
+        """
+        Возвращает [(id кандидата, релевантность)] по убыванию релевантности.
+        mode="ranked" - достаточно любого слова запроса, mode="boolean" - логика parse_query.
+        """
+        clauses = parse_query(query)
+        if mode == "ranked":
+            words = [terms for clause in clauses for terms in clause["include"]]
+            clauses = [{"include": [terms], "exclude": []} for terms in words]
+        words = list(dict.fromkeys(terms for clause in clauses for key in ("include", "exclude")
+                                   for terms in clause[key]))
+        if not words:
+            return []
+        rows, n_docs, avg_length = self._postings(owner, sorted({term for terms in words for term in terms}))
+
+        term_tf = defaultdict(dict)
+        lengths = {}
+        for term, candidate_id, tf, length in rows:
+            term_tf[term][candidate_id] = tf
+            lengths[candidate_id] = length
+        word_tf = {}
+        for terms in words:
+            merged = defaultdict(int)
+            for term in terms:
+                for candidate_id, tf in term_tf[term].items():
+                    merged[candidate_id] += tf
+            word_tf[terms] = merged
+
+        matched = set()
+        for clause in clauses:
+            # Альтернатива из одних исключений ничего не находит
+            if not clause["include"]:
+                continue
+            ids = set.intersection(*(set(word_tf[terms]) for terms in clause["include"]))
+            for terms in clause["exclude"]:
+                ids -= set(word_tf[terms])
+            matched |= ids
+
+        scores = defaultdict(float)
+        for terms in {terms for clause in clauses for terms in clause["include"]}:
+            postings = word_tf[terms]
+            df = len(postings)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for candidate_id, tf in postings.items():
+                if candidate_id in matched:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[candidate_id] / avg_length)
+                    scores[candidate_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(matched, key=lambda candidate_id: (-scores[candidate_id], candidate_id))
+        return [(candidate_id, round(scores[candidate_id], 3)) for candidate_id in ranked[:limit]]
@@ -0,0 +1,232 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from pympler import asizeof, muppy, summary, tracker
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Память Streamlit-процесса: размер состояния каждой сессии, крупнейшие типы
+# объектов и рост со временем. Чужое состояние сессии из другого потока не
+# меняется: вытеснение ставится в очередь и выполняется самой сессией в начале
+# ее следующего прогона скрипта (enforce).
+
+# Предел состояния одной сессии; 0 - без предела
+SESSION_STATE_CAP_MB = float(os.getenv("SESSION_STATE_CAP_MB", "64"))
+MEMORY_SAMPLE_INTERVAL_S = float(os.getenv("MEMORY_SAMPLE_INTERVAL_S", "60"))
+MEMORY_HISTORY_LEN = int(os.getenv("MEMORY_HISTORY_LEN", "1440"))
+# Как часто прогон сессии пересчитывает размер ее состояния: asizeof обходит все вложенные объекты
+SESSION_MEMORY_CHECK_INTERVAL_S = float(os.getenv("SESSION_MEMORY_CHECK_INTERVAL_S", "30"))
+
+# Ключи, без которых сессия не работает: авторизация и выбор строк
+PROTECTED_KEYS = {"authenticated", "user_role", "user_name", "username", "selected_rows", "results_page"}
+# Что можно сбросить без потери данных: Excel и просмотр PDF строятся заново из хранилища,
+# списки ошибок и дубликатов - только уведомления о последней загрузке
+EVICTABLE_KEYS = ("excel_export", "selected_pdf", "ingest_errors", "duplicate_files")
+
+
+def rss_bytes():
+    """Текущая резидентная память процесса в байтах."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    import resource
+    # На macOS ru_maxrss в байтах, на Linux - в килобайтах; это пик, а не текущее значение
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def key_sizes(state):
+    """Размер каждого значения состояния сессии в байтах вместе с вложенными объектами."""
+    return {key: asizeof.asizeof(value) for key, value in dict(state).items()}
+
+
+_sessions_unavailable_logged = False
+
+
+def list_sessions():
+    """
+    Все сессии сервера: (id, состояние, активна ли). Вне запущенного сервера - пустой
+    список; None - в этой версии Streamlit список сессий недоступен.
+    """
+    import streamlit
+    from streamlit.runtime import Runtime
+
+    if not Runtime.exists():
+        return []
+    # Публичного API для списка сессий нет. Runtime._session_mgr и SessionInfo проверены на
+    # streamlit==1.44.0 из requirements.txt; при обновлении Streamlit проверить заново
+    list_fn = getattr(getattr(Runtime.instance(), "_session_mgr", None), "list_sessions", None)
+    try:
+        return [(info.session.id, info.session.session_state, info.is_active()) for info in list_fn()]
+    except (AttributeError, TypeError):
+        global _sessions_unavailable_logged
+        if not _sessions_unavailable_logged:
+            _sessions_unavailable_logged = True
+            logger.warning("Список сессий недоступен в streamlit %s, учитываются только сессии со своим прогоном",
+                           streamlit.__version__)
+        return None
+
+
+def current_session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+class MemoryMonitor:
+    """
+    Общий на процесс: история RSS и суммарного состояния сессий, пределы и
+    очередь вытеснений. Сессия вызывает enforce(st.session_state) в начале прогона.
+    """
+
+    def __init__(self, cap_mb=SESSION_STATE_CAP_MB, interval=MEMORY_SAMPLE_INTERVAL_S,
+                 history_len=MEMORY_HISTORY_LEN):
+        self.cap_bytes = int(cap_mb * 1024 * 1024)
+        self.interval = interval
+        self.history = deque(maxlen=history_len)
+        self._evictions = {}  # id сессии -> набор ключей или None (все вытесняемые)
+        self._sizes = {}  # id сессии -> размер на последнем прогоне
+        self._checked = {}  # id сессии -> время последнего замера
+        self._lock = threading.Lock()
+        self._tracker = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+
+        def sample():
+            while True:
+                self.sample()
+                time.sleep(self.interval)
+
+        self._thread = threading.Thread(target=sample, name="memory-sampler", daemon=True)
+        self._thread.start()
+
+    def sample(self):
+        # Размер берется с последнего прогона каждой сессии: фоновый поток не обходит чужое состояние
+        sessions = list_sessions()
+        if sessions is not None:
+            self.forget([session_id for session_id, _, _ in sessions])
+        with self._lock:
+            sizes = dict(self._sizes)
+        entry = {
+            "at": time.time(),
+            "rss": rss_bytes(),
+            # Без списка сессий закрытые не отличить от живых, считаются все замеренные
+            "sessions": len(sizes) if sessions is None else len(sessions),
+            "session_state": sum(sizes.values())
+        }
+        self.history.append(entry)
+        return entry
+
+    def session_report(self):
+        """Размер состояния каждой сессии и ее крупнейших ключей."""
+        report = []
+        sessions = list_sessions()
+        if sessions is None:
+            # Чужие сессии недоступны: только размеры с их прогонов, без разбивки по ключам
+            with self._lock:
+                sizes = dict(self._sizes)
+            sessions = [(session_id, {}, True) for session_id in sizes]
+        for session_id, state, active in sessions:
+            try:
+                values = dict(state.filtered_state)
+                sizes = key_sizes(values)
+                total = sum(sizes.values())
+            except (RuntimeError, KeyError, AttributeError):
+                # Сессия как раз выполняет скрипт и меняет состояние; берем размер с ее прогона
+                values, sizes = {}, {}
+                total = self._sizes.get(session_id, 0)
+            report.append({
+                "session_id": session_id,
+                "username": values.get("username"),
+                "active": active,
+                "total": total,
+                "keys": sorted(sizes.items(), key=lambda item: item[1], reverse=True)
+            })
+        report.sort(key=lambda row: row["total"], reverse=True)
+        return report
+
+    def top_types(self, limit=20):
+        """Крупнейшие типы объектов процесса: (тип, число, байты). Обход всех объектов - секунды."""
+        with metrics.timer("memory_top_types"):
+            rows = summary.summarize(muppy.get_objects())
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows[:limit]
+
+    def growth(self, limit=20):
+        """Прирост по типам с прошлого вызова; первый вызов только запоминает исходное состояние."""
+        with self._lock:
+            if self._tracker is None:
+                self._tracker = tracker.SummaryTracker()
+                return []
+            diff = self._tracker.diff()
+        diff.sort(key=lambda row: row[2], reverse=True)
+        return diff[:limit]
+
+    def request_eviction(self, session_id, keys=None):
+        with self._lock:
+            if keys is None or self._evictions.get(session_id, set()) is None:
+                self._evictions[session_id] = None
+            else:
+                self._evictions.setdefault(session_id, set()).update(keys)
+
+    def enforce(self, state, session_id, force=False):
+        """
+        Выполняет запрошенные вытеснения и предел размера для текущей сессии.
+        Размер пересчитывается не чаще SESSION_MEMORY_CHECK_INTERVAL_S, если нет
+        запроса на вытеснение или force (после загрузки файлов). Возвращает список вытесненных ключей.
+        """
+        now = time.monotonic()
+        with self._lock:
+            requested = self._evictions.pop(session_id, set())
+            due = now - self._checked.get(session_id, float("-inf")) >= SESSION_MEMORY_CHECK_INTERVAL_S
+            if not (force or requested is None or requested or due):
+                return []
+            self._checked[session_id] = now
+        evicted = []
+
+        def evict(key):
+            if key in state and key not in PROTECTED_KEYS:
+                del state[key]
+                evicted.append(key)
+
+        for key in (EVICTABLE_KEYS if requested is None else requested):
+            evict(key)
+
+        with metrics.timer("session_memory_check"):
+            sizes = key_sizes(state)
+        total = sum(sizes.values())
+        if self.cap_bytes and total > self.cap_bytes:
+            # Сначала сбрасываются крупнейшие кеши сессии
+            for key in sorted((key for key in EVICTABLE_KEYS if key in sizes), key=sizes.get, reverse=True):
+                evict(key)
+                total -= sizes[key]
+                if total <= self.cap_bytes:
+                    break
+            metrics.count("session_cap_evictions")
+        with self._lock:
+            self._sizes[session_id] = total
+        if evicted:
+            metrics.count("session_keys_evicted", len(evicted))
+        return evicted
+
+    def forget(self, live_session_ids):
+        # Закрытые сессии больше не учитываются в суммарном размере
+        with self._lock:
+            for session_id in set(self._sizes) - set(live_session_ids):
+                del self._sizes[session_id]
+                self._evictions.pop(session_id, None)
+                self._checked.pop(session_id, None)
@@ -0,0 +1,86 @@
+import logging
+import os
+
+import pytest
+
+import blob_store
+from blob_store import BlobStore
+
+
+class Pins:
+    """Подмена referenced_hashes: считает вызовы и возвращает заданный набор."""
+
+    def __init__(self):
+        self.hashes = set()
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return set(self.hashes)
+
+
+@pytest.fixture
+def pins():
+    return Pins()
+
+
+@pytest.fixture
+def store(tmp_path, pins):
+    return BlobStore(root=str(tmp_path / "blobs"), max_bytes=1000, cache_max_bytes=0, referenced=pins)
+
+
+def blob(n, size=300):
+    return bytes([n]) * size
+
+
+def age(store, blob_hash, seconds_ago):
+    past = os.path.getmtime(store._path(blob_hash)) - seconds_ago
+    os.utime(store._path(blob_hash), (past, past))
+
+
+def test_eviction_removes_oldest_unpinned(store, pins):
+    first = store.put(blob(1))
+    second = store.put(blob(2))
+    third = store.put(blob(3))
+    age(store, first, 30)
+    age(store, second, 20)
+    age(store, third, 10)
+    pins.hashes = {first}
+    latest = store.put(blob(4))
+
+    assert store.exists(first)
+    assert not store.exists(second)
+    assert store.exists(third)
+    assert store.exists(latest)
+    assert store.total_bytes() <= 900
+
+
+def test_pinned_blobs_over_limit_do_not_rescan_every_put(store, pins, caplog):
+    pinned = [store.put(blob(n)) for n in range(3)]
+    pins.hashes = set(pinned)
+    with caplog.at_level(logging.WARNING, logger="blob_store"):
+        store.put(blob(3))
+        assert pins.calls == 1
+        # До конца интервала повтора запись не сканирует каталог и не спрашивает используемые хеши
+        for n in range(4, 8):
+            store.put(blob(n))
+        assert pins.calls == 1
+    assert all(store.exists(blob_hash) for blob_hash in pinned)
+    warnings = [record for record in caplog.records if "при лимите" in record.getMessage()]
+    assert len(warnings) == 1
+
+
+def test_eviction_retries_after_cooldown(store, pins, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_EVICT_RETRY_S", 0.0)
+    pinned = [store.put(blob(n)) for n in range(3)]
+    pins.hashes = set(pinned)
+    store.put(blob(3))
+    assert pins.calls == 1
+
+    # Задания завершились, интервал повтора истек - следующая запись снова чистит хранилище
+    pins.hashes = set()
+    latest = store.put(blob(9))
+    assert pins.calls == 2
+    assert store.exists(latest)
+    assert not store.exists(pinned[0])
+    assert store.total_bytes() <= 900
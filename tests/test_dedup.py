@@ -0,0 +1,51 @@
+import pytest
+
+from candidate_store import CandidateStore
+from dedup import DuplicateIndex, cluster_batch, signature
+
+BASE = [f"слово{i}" for i in range(60)]
+
+
+def text(words):
+    return " ".join(words)
+
+
+@pytest.fixture
+def index(tmp_path):
+    db_path = str(tmp_path / "candidates.db")
+    CandidateStore(db_path)
+    return DuplicateIndex(db_path)
+
+
+def test_short_text_has_no_signature():
+    assert signature("два слова") is None
+    assert signature(text(BASE)) is not None
+
+
+def test_new_documents_and_batch_duplicates(index):
+    near_copy = BASE[:-1] + ["другое"]
+    signatures = [signature(text(BASE)), signature(text(f"иное{i}" for i in range(60))),
+                  signature(text(near_copy)), None, signature(text(BASE))]
+    clusters = cluster_batch(index, ["user"], signatures)
+
+    assert clusters[0] is None and clusters[1] is None and clusters[3] is None
+    # Дубликаты внутри пачки ссылаются на первый документ кластера
+    kind, ref, similarity = clusters[2]
+    assert (kind, ref) == ("batch", 0) and 0.8 <= similarity < 1.0
+    assert clusters[4] == ("batch", 0, 1.0)
+
+
+def test_stored_duplicates_respect_owners(index):
+    sig = signature(text(BASE))
+    index.add("mail", [(7, sig)])
+
+    assert cluster_batch(index, ["user", "mail"], [sig]) == [("stored", 7, 1.0)]
+    assert cluster_batch(index, None, [sig]) == [("stored", 7, 1.0)]
+    assert cluster_batch(index, ["user"], [sig]) == [None]
+    assert index.owners_of([7, 8]) == {7: "mail"}
+
+
+def test_different_documents_are_not_clustered(index):
+    index.add("user", [(1, signature(text(BASE)))])
+    other = signature(text(BASE[:30] + [f"новое{i}" for i in range(30)]))
+    assert cluster_batch(index, ["user"], [other]) == [None]
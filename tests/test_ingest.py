@@ -0,0 +1,70 @@
+import pytest
+
+import ingest
+from candidate_store import CandidateStore
+from dedup import DuplicateIndex
+from feature_store import FeatureStore
+from pochtalion import MAIL_OWNER
+from search_index import SearchIndex
+
+TEXT = " ".join(f"слово{i}" for i in range(40))
+OTHER = " ".join(f"другое{i}" for i in range(40))
+
+
+def candidate(file_name, processed_text, probability=0.5):
+    return {
+        "file_name": file_name, "file_hash": file_name, "phone": "-", "position": "-", "city": "-",
+        "age": "-", "gender": "-", "salary": "-", "raw_text": processed_text,
+        "processed_text": processed_text, "probability": probability, "comment": ""
+    }
+
+
+@pytest.fixture
+def stores(tmp_path):
+    db_path = str(tmp_path / "candidates.db")
+    store = CandidateStore(db_path)
+    return (store, SearchIndex(db_path), DuplicateIndex(db_path),
+            FeatureStore(root=str(tmp_path / "features"), db_path=db_path))
+
+
+def ingest_batch(stores, owner, candidates):
+    store, search_index, duplicate_index, feature_store = stores
+    unique = ingest.mark_duplicates(candidates, owner, duplicate_index)
+    ingest.save_candidates(store, owner, candidates, search_index, duplicate_index, feature_store)
+    return unique
+
+
+def test_own_duplicate_is_skipped(stores):
+    store, _, duplicate_index, _ = stores
+    ingest_batch(stores, "user", [candidate("a.pdf", TEXT)])
+    upload = candidate("a-copy.pdf", TEXT)
+    assert ingest_batch(stores, "user", [upload]) == []
+
+    assert ingest.is_skipped_duplicate(upload)
+    assert store.count("user") == 1
+    representative_id = store.ids("user")[0]
+    assert [d["file_name"] for d in duplicate_index.duplicates_of(representative_id)] == ["a-copy.pdf"]
+
+
+def test_copy_of_mail_candidate_is_stored_for_owner(stores):
+    store, _, duplicate_index, _ = stores
+    ingest_batch(stores, MAIL_OWNER, [candidate("mail.pdf", TEXT)])
+    mail_id = store.ids(MAIL_OWNER)[0]
+
+    uploads = [candidate("upload.pdf", TEXT), candidate("upload-2.pdf", TEXT), candidate("new.pdf", OTHER)]
+    assert ingest_batch(stores, "user", uploads) == [0, 2]
+
+    assert not ingest.is_skipped_duplicate(uploads[0])
+    assert ingest.is_skipped_duplicate(uploads[1])
+    assert store.count("user") == 2
+    copy = store.get(uploads[0]["id"])
+    assert copy["file_name"] == "upload.pdf" and copy["duplicate_of"] == mail_id
+    assert store.get(uploads[2]["id"])["duplicate_of"] is None
+    # Вторая копия в пачке ссылается на сохраненную копию владельца
+    assert [d["file_name"] for d in duplicate_index.duplicates_of(copy["id"])] == ["upload-2.pdf"]
+    assert [d["file_name"] for d in duplicate_index.duplicates_of(mail_id)] == ["upload.pdf"]
+
+    # Следующая загрузка того же резюме - уже дубликат своей строки
+    again = candidate("again.pdf", TEXT)
+    assert ingest_batch(stores, "user", [again]) == []
+    assert store.count("user") == 2
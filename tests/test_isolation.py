@@ -0,0 +1,43 @@
+import pytest
+
+import ingest
+import isolation
+from isolation import Quarantine
+
+
+@pytest.fixture
+def quarantine(tmp_path, monkeypatch):
+    monkeypatch.setattr(isolation, "QUARANTINE_AFTER_FAILURES", 2)
+    return Quarantine(str(tmp_path / "candidates.db"))
+
+
+def test_pdf_is_blocked_after_repeated_failures(quarantine):
+    quarantine.record_failures([("aa", "a.pdf", "таймаут")])
+    assert quarantine.blocked(["aa", "bb"]) == {}
+
+    quarantine.record_failures([("aa", "a-renamed.pdf", "превышен лимит памяти")])
+    assert quarantine.blocked(["aa", "bb"]) == {"aa": "превышен лимит памяти"}
+    entry, = quarantine.entries()
+    assert entry["file_name"] == "a-renamed.pdf" and entry["failures"] == 2
+
+
+def test_release_unblocks(quarantine):
+    quarantine.record_failures([("aa", "a.pdf", "таймаут")] * 2)
+    assert "aa" in quarantine.blocked(["aa"])
+    quarantine.release("aa")
+    assert quarantine.blocked(["aa"]) == {}
+    assert quarantine.entries() == []
+
+
+def test_only_sandbox_failures_are_quarantined(quarantine):
+    candidates = [
+        ingest.error_candidate("crash.pdf", "aa", "процесс разбора завершился", failure=True),
+        ingest.error_candidate("missing.pdf", "bb", "PDF не найден в общем хранилище"),
+    ]
+    assert ingest.quarantine_failures(candidates) == [("aa", "crash.pdf", "процесс разбора завершился")]
+    quarantine.record_failures(ingest.quarantine_failures(candidates) * 2)
+    assert set(quarantine.blocked(["aa", "bb"])) == {"aa"}
+
+
+def test_blocked_with_no_hashes(quarantine):
+    assert quarantine.blocked([]) == {}
@@ -0,0 +1,56 @@
+import pytest
+
+import job_queue
+from job_queue import SCORE_PDFS, JobQueue
+
+# Аренда, истекшая сразу после выдачи: воркер "завис" и не продлевает ее
+EXPIRED = -1.0
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+
+def test_claim_is_exclusive_while_lease_is_held(queue):
+    job_id, = queue.enqueue(SCORE_PDFS, [{"items": []}])
+    job = queue.claim("a", [SCORE_PDFS])
+    assert job["id"] == job_id and job["attempts"] == 1
+    assert queue.claim("b", [SCORE_PDFS]) is None
+    assert queue.claim("b", ["other"]) is None
+
+
+def test_expired_lease_is_taken_over(queue):
+    job_id, = queue.enqueue(SCORE_PDFS, [{"items": []}])
+    stale = queue.claim("a", [SCORE_PDFS], lease_s=EXPIRED)
+
+    job = queue.claim("b", [SCORE_PDFS])
+    assert job["id"] == job_id and job["worker"] == "b" and job["attempts"] == 2
+    # Зависший воркер потерял аренду: его продление и результат отклоняются
+    assert not queue.heartbeat(stale)
+    assert not queue.complete(stale, ["stale"])
+    assert queue.heartbeat(job)
+    assert queue.complete(job, ["fresh"])
+    done, = queue.get([job_id])
+    assert done["status"] == "done" and done["result"] == ["fresh"]
+
+
+def test_job_fails_after_max_expired_leases(queue, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 2)
+    job_id, = queue.enqueue(SCORE_PDFS, [{"items": []}])
+    assert queue.claim("a", [SCORE_PDFS], lease_s=EXPIRED)["attempts"] == 1
+    assert queue.claim("b", [SCORE_PDFS], lease_s=EXPIRED)["attempts"] == 2
+
+    assert queue.claim("c", [SCORE_PDFS]) is None
+    failed, = queue.get([job_id])
+    assert failed["status"] == "failed" and "2" in failed["error"]
+    assert [job["id"] for job in queue.wait([job_id], timeout=0)] == [job_id]
+
+
+def test_failed_handler_is_retried(queue, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 2)
+    job_id, = queue.enqueue(SCORE_PDFS, [{"items": []}])
+    queue.fail(queue.claim("a", [SCORE_PDFS]), "boom")
+    assert queue.get([job_id])[0]["status"] == "queued"
+    queue.fail(queue.claim("a", [SCORE_PDFS]), "boom")
+    assert queue.get([job_id])[0]["status"] == "failed"
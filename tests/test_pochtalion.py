@@ -0,0 +1,82 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from pochtalion import MailPoller
+
+
+class FakeMail:
+    """Клиентская сторона IMAP на socketpair: readline и send - как в imaplib."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile("rb")
+
+    def _new_tag(self):
+        return b"A001"
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        return self.file.readline()
+
+
+def imap_server(sock, notify=None, notify_delay=0.0):
+    # На каждый IDLE отвечает продолжением, после DONE - завершением команды
+    reader = sock.makefile("rb")
+    while True:
+        line = reader.readline()
+        if not line:
+            return
+        if line.endswith(b" IDLE\r\n"):
+            sock.sendall(b"+ idling\r\n")
+            if notify:
+                time.sleep(notify_delay)
+                sock.sendall(notify)
+        elif line == b"DONE\r\n":
+            sock.sendall(b"A001 OK IDLE terminated\r\n")
+
+
+@pytest.fixture
+def idle_poller():
+    client, server = socket.socketpair()
+    client.settimeout(5)
+
+    def start(notify=None, notify_delay=0.0):
+        threading.Thread(target=imap_server, args=(server, notify, notify_delay), daemon=True).start()
+        poller = MailPoller(on_files=lambda files: None)
+        poller._mail = FakeMail(client)
+        return poller
+
+    yield start
+    client.close()
+    server.close()
+
+
+def test_idle_timeout_keeps_connection_usable(idle_poller):
+    poller = idle_poller()
+    assert poller._idle(0.3) is False
+    # Повторный IDLE на том же соединении: буферизованный файл imaplib не сломан таймаутом
+    assert poller._idle(0.3) is False
+
+
+def test_idle_reports_new_mail(idle_poller):
+    poller = idle_poller(notify=b"* 4 EXISTS\r\n", notify_delay=0.2)
+    started = time.monotonic()
+    assert poller._idle(5) is True
+    assert time.monotonic() - started < 2
+
+
+def test_idle_notification_buffered_with_continuation(idle_poller):
+    # Уведомление пришло в одном пакете с "+ idling" и осталось в буфере: оно находится после DONE
+    poller = idle_poller(notify=b"* 4 EXISTS\r\n")
+    assert poller._idle(0.3) is True
+
+
+def test_idle_stops_on_wake(idle_poller):
+    poller = idle_poller()
+    poller.wake()
+    assert poller._idle(5) is False
@@ -0,0 +1,72 @@
+import re
+
+import pytest
+
+from resume_pipeline import extract_resume_features, extract_resume_info
+
+TEXTS = [
+    "Иванов Иван\nМужчина, 25 лет, родился 1 мая 2000\nМосква\n+7 (912) 345-67-89\n"
+    "Желаемая должность и зарплата\nМенеджер по продажам\n60 000 ₽ на руки",
+    # Регистр и переводы строк, на которых поле анкеты и признак модели расходятся
+    "Петрова Анна\nЖенщина, 31 Лет, родилась 2 июня 1994\nКазань\n50 000 РУБ",
+    "Сидоров Петр\nМужчина, 40 года,\n70 т.р\n₽ ожидания\nстудент",
+]
+
+
+def legacy_info(text):
+    # Поля анкеты до общего разбора документа: поиск в исходном тексте
+    info = {"phone": "-", "position": "-", "city": "-", "age": "-", "gender": "-", "salary": "-"}
+    phone_match = re.search(r'\+7\s*\(?\d{3}\)?[\s\-]?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}', text)
+    if phone_match:
+        info["phone"] = phone_match.group()
+    position_match = re.search(r"[жЖ]елаемая должность и зарплата\s*[:—]?\s*\s*(.*?)(?=\n|$)", text,
+                               re.IGNORECASE | re.DOTALL)
+    if position_match:
+        info["position"] = position_match.group(1).strip()
+    city_match = re.search(r'(Москва|Санкт-Петербург|Екатеринбург|Казань|Новосибирск|Самара|Омск|Челябинск)', text)
+    if city_match:
+        info["city"] = city_match.group(1)
+    age_match = re.search(r',\s(\d{2})\s*(год|лет|года),', text)
+    if age_match:
+        info["age"] = age_match.group(1)
+    if 'женщина,' in text.lower()[:500]:
+        info["gender"] = "Женщина"
+    elif 'мужчина,' in text.lower()[:500]:
+        info["gender"] = "Мужчина"
+    salary_match = re.search(r'\d{2,3}\s*(000|т.р.)\s*(₽|р|руб)', text)
+    if salary_match:
+        info["salary"] = re.sub(r'\D', '', salary_match.group(0))
+    return info
+
+
+def legacy_features(text):
+    # Ручные признаки до общего разбора: нижний регистр, переводы строк заменены пробелами
+    clean_text = text.replace('\n', ' ').replace('\r', ' ').lower()
+    age_match = re.search(r',\s(\d{2})\s*(год|лет|года),', clean_text)
+    salary_match = re.search(r'\d{2,3}\s*(000|т.р.)\s*(₽|р|руб)', clean_text)
+    return {
+        'gender': 1 if 'женщина,' in clean_text[:500] else (-1 if 'мужчина,' in clean_text[:500] else 0),
+        'age': int(age_match.group(1)) if age_match else -1,
+        'salary': int(re.sub(r'\D', '', salary_match[0])) if salary_match else -1,
+        'student': int('студент' in clean_text or 'учусь' in clean_text or 'очная' in clean_text),
+        'wants_sales_position': int('продаж' in clean_text),
+        'text_length': len(clean_text),
+        'num_digits': sum(c.isdigit() for c in clean_text),
+    }
+
+
+@pytest.mark.parametrize("text", TEXTS, ids=["hh", "case", "newlines"])
+def test_info_matches_original_text(text):
+    assert extract_resume_info(text) == legacy_info(text)
+
+
+@pytest.mark.parametrize("text", TEXTS, ids=["hh", "case", "newlines"])
+def test_features_match_lowercased_text(text):
+    assert extract_resume_features(text) == legacy_features(text)
+
+
+def test_info_and_features_differ_on_case():
+    info = extract_resume_info(TEXTS[1])
+    features = extract_resume_features(TEXTS[1])
+    assert (info["age"], info["salary"]) == ("-", "-")
+    assert (features["age"], features["salary"]) == (31, 50000)
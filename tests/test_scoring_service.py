@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from resume_pipeline import load_artifacts, prepare_document
+from scoring_service import MicroBatcher
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def batcher():
+    model, scaler, tfidf = load_artifacts(bundle_dir=REPO_DIR)
+    # Длинное ожидание, чтобы запросы теста гарантированно попали в одну пачку
+    return MicroBatcher(model, scaler, tfidf, max_batch=64, max_wait_ms=300)
+
+
+def test_submit_rejects_manual_keys_not_in_bundle(batcher):
+    manual, processed_text = prepare_document("Менеджер по продажам, 25 лет")
+    del manual["age"]
+    with pytest.raises(ValueError):
+        batcher.submit([(manual, processed_text)])
+
+    probabilities, explanations, _ = batcher.submit([prepare_document("Водитель")]).result(timeout=30)
+    assert len(probabilities) == 1 and len(explanations) == 1
+
+
+def test_submit_reorders_manual_keys_to_bundle_order(batcher):
+    manual, processed_text = prepare_document("Менеджер по продажам, 25 лет")
+    shuffled = dict(reversed(list(manual.items())))
+    expected, _, _ = batcher.submit([(manual, processed_text)]).result(timeout=30)
+    got, _, _ = batcher.submit([(shuffled, processed_text)]).result(timeout=30)
+    assert got == pytest.approx(expected)
+
+
+def test_failed_request_does_not_fail_its_batch(batcher):
+    good = prepare_document("Менеджер по продажам, холодные звонки, CRM")
+    manual, processed_text = prepare_document("Водитель категории B")
+    manual["age"] = "не число"
+    first = batcher.submit([good])
+    bad = batcher.submit([(manual, processed_text)])
+    last = batcher.submit([good, good])
+
+    assert len(first.result(timeout=30)[0]) == 1
+    assert len(last.result(timeout=30)[0]) == 2
+    with pytest.raises(ValueError):
+        bad.result(timeout=30)
+    # Все три запроса пришли одной пачкой
+    assert batcher.metrics()["batch_size_histogram"].get("4") == 1
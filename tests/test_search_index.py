@@ -0,0 +1,37 @@
+from search_index import parse_query, query_terms
+
+
+def terms(*words):
+    return [query_terms(word) for word in words]
+
+
+def test_words_are_required():
+    assert parse_query("менеджер продаж") == [{"include": terms("менеджер", "продаж"), "exclude": []}]
+
+
+def test_or_splits_alternatives():
+    expected = [{"include": terms("crm"), "exclude": []}, {"include": terms("1с"), "exclude": []}]
+    assert parse_query("crm ИЛИ 1с") == expected
+    assert parse_query("crm or 1с") == expected
+    assert parse_query("crm | 1с") == expected
+
+
+def test_phrase_and_exclusions():
+    assert parse_query('"холодные звонки" -водитель') == [
+        {"include": terms("холодные", "звонки"), "exclude": terms("водитель")}
+    ]
+    assert parse_query('-"салон красоты" Москва') == [
+        {"include": terms("Москва"), "exclude": terms("салон", "красоты")}
+    ]
+
+
+def test_word_matches_stem_or_token():
+    stem_and_word = query_terms("Звонки")
+    assert stem_and_word[-1] == "звонки"
+    assert len(set(stem_and_word)) == len(stem_and_word)
+
+
+def test_empty_alternatives_are_dropped():
+    assert parse_query("") == []
+    assert parse_query("или") == []
+    assert parse_query("ИЛИ crm ИЛИ ИЛИ") == [{"include": terms("crm"), "exclude": []}]
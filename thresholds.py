@@ -0,0 +1,66 @@
+import json
+import os
+
+import numpy as np
+
+SETTINGS_FILE = "settings.json"
+
+# threshold - порог класса 1 и граница красной зоны,
+# green_threshold - начало зеленой зоны
+DEFAULT_THRESHOLDS = {
+    "threshold": 0.19,
+    "green_threshold": 0.81
+}
+
+
+def load_thresholds():
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if os.path.exists(SETTINGS_FILE):
+        with open(SETTINGS_FILE, "r", encoding='utf-8') as f:
+            thresholds.update(json.load(f).get("thresholds", {}))
+    return thresholds
+
+
+def save_thresholds(thresholds):
+    if not 0 <= thresholds["threshold"] <= thresholds["green_threshold"] <= 1:
+        raise ValueError("Пороги должны удовлетворять условию 0 ≤ порог класса ≤ порог зеленой зоны ≤ 1")
+    settings = {}
+    if os.path.exists(SETTINGS_FILE):
+        with open(SETTINGS_FILE, "r", encoding='utf-8') as f:
+            settings = json.load(f)
+    settings["thresholds"] = {key: float(thresholds[key]) for key in DEFAULT_THRESHOLDS}
+    with open(SETTINGS_FILE, "w", encoding='utf-8') as f:
+        json.dump(settings, f, ensure_ascii=False, indent=4)
+
+
+def bucket_ranges(thresholds):
+    # Полуинтервалы вероятности [lo, hi) для цветовых категорий
+    return {
+        "green": (thresholds["green_threshold"], None),
+        "yellow": (thresholds["threshold"], thresholds["green_threshold"]),
+        "red": (None, thresholds["threshold"])
+    }
+
+
+def bucket_labels(thresholds):
+    threshold = round(thresholds["threshold"] * 100)
+    green = round(thresholds["green_threshold"] * 100)
+    return {
+        "green": f"Зеленые (≥{green}%)",
+        "yellow": f"Желтые ({threshold}-{green - 1}%)",
+        "red": f"Красные (<{threshold}%)"
+    }
+
+
+def assign_buckets(probabilities, thresholds):
+    probabilities = np.asarray(probabilities, dtype=float)
+    return np.select(
+        [probabilities >= thresholds["green_threshold"], probabilities < thresholds["threshold"]],
+        ["green", "red"],
+        default="yellow"
+    )
+
+
+def flipped_range(old_threshold, new_threshold):
+    # Класс меняется только у вероятностей между старым и новым порогом
+    return min(old_threshold, new_threshold), max(old_threshold, new_threshold)
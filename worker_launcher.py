@@ -0,0 +1,185 @@
+import argparse
+import csv
+import gc
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+# Артефакты загружаются в родителе до fork и наследуются воркерами copy-on-write
+_ARTIFACTS = None
+
+
+def memory_usage(pid="self"):
+    """
+    Возвращает потребление памяти процесса в КБ: rss, pss (с учетом разделяемых
+    страниц) и shared. Работает через /proc, поэтому только на Linux.
+    """
+    usage = {"rss_kb": 0, "pss_kb": 0, "shared_kb": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name == "Rss":
+                    usage["rss_kb"] = int(value.split()[0])
+                elif name == "Pss":
+                    usage["pss_kb"] = int(value.split()[0])
+                elif name in ("Shared_Clean", "Shared_Dirty"):
+                    usage["shared_kb"] += int(value.split()[0])
+    except FileNotFoundError:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        usage["rss_kb"] = int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return usage
+
+
+def format_memory(usage):
+    return (f"RSS {usage['rss_kb'] / 1024:.1f} МБ, PSS {usage['pss_kb'] / 1024:.1f} МБ, "
+            f"общие {usage['shared_kb'] / 1024:.1f} МБ")
+
+
+def preload():
+    """
+    Загружает словари pymorphy3, стоп-слова NLTK, TF-IDF, скейлер и CatBoost
+    один раз в родительском процессе.
+    """
+    global _ARTIFACTS
+    from resume_pipeline import load_artifacts
+    from model_registry import MODEL_BUNDLE_DIR
+
+    _ARTIFACTS = load_artifacts(mmap_mode="r", bundle_dir=MODEL_BUNDLE_DIR)
+    # Объекты, созданные до fork, исключаются из сборки мусора: иначе обход GC
+    # в воркерах трогает их заголовки и страницы копируются
+    gc.collect()
+    gc.freeze()
+    print(f"Родитель {os.getpid()} загрузил модель: {format_memory(memory_usage())}")
+    return _ARTIFACTS
+
+
+# --- Пакетная оценка файлов ---
+def _score_chunk(paths):
+    from resume_pipeline import extract_text_from_pdf, score_texts
+
+    rows = []
+    texts = []
+    text_paths = []
+    for path in paths:
+        with open(path, "rb") as f:
+            text = extract_text_from_pdf(f)
+        if "[Ошибка]" in text:
+            rows.append((path, None, text))
+        else:
+            texts.append(text)
+            text_paths.append(path)
+    if texts:
+        for path, proba in zip(text_paths, score_texts(texts, *_ARTIFACTS)):
+            rows.append((path, float(proba), ""))
+    return os.getpid(), memory_usage(), rows
+
+
+def run_batch(pdf_files, n_workers, output=None, chunk_size=16):
+    preload()
+    chunks = [pdf_files[i:i + chunk_size] for i in range(0, len(pdf_files), chunk_size)]
+    worker_memory = {}
+    out = open(output, "w", newline='', encoding='utf-8') if output else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(["Файл", "Вероятность класса 1", "Ошибка"])
+        with multiprocessing.get_context("fork").Pool(n_workers) as pool:
+            for pid, usage, rows in pool.imap_unordered(_score_chunk, chunks):
+                worker_memory[pid] = usage
+                for path, proba, error in rows:
+                    writer.writerow([path, "" if proba is None else f"{proba:.4f}", error])
+    finally:
+        if output:
+            out.close()
+    print("\nПамять воркеров:", file=sys.stderr)
+    for pid, usage in sorted(worker_memory.items()):
+        print(f"  воркер {pid}: {format_memory(usage)}", file=sys.stderr)
+
+
+# --- Pre-fork сервис оценки ---
+def run_service(n_workers, host, port, max_batch, max_wait_ms, report_interval):
+    from scoring_service import build_server
+    from model_registry import MODEL_BUNDLE_DIR, bundle_checksum
+
+    preload()
+    # Версия тех же файлов, что загрузил preload, возвращается клиентам с каждой оценкой
+    model_version = bundle_checksum(MODEL_BUNDLE_DIR)
+    # Слушающий сокет открывается в родителе и разделяется всеми воркерами
+    sock = socket.create_server((host, port), backlog=128)
+    children = []
+    for worker_id in range(n_workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                server = build_server(*_ARTIFACTS, host=host, port=port, max_batch=max_batch,
+                                      max_wait_ms=max_wait_ms, sock=sock, model_version=model_version)
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    print(f"Запущено {n_workers} воркеров на http://{host}:{port}: {children}")
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    while children:
+        time.sleep(report_interval)
+        for child in list(children):
+            done, _ = os.waitpid(child, os.WNOHANG)
+            if done:
+                print(f"Воркер {child} завершился")
+                children.remove(child)
+            else:
+                print(f"воркер {child}: {format_memory(memory_usage(child))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Запуск воркеров с общей (copy-on-write) памятью модели и NLP-словарей"
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch_parser = subparsers.add_parser("batch", parents=[common], help="Оценить PDF-файлы пулом воркеров")
+    batch_parser.add_argument("pdf_files", nargs="+")
+    batch_parser.add_argument("--output", default=None, help="CSV-файл с результатами (по умолчанию stdout)")
+    batch_parser.add_argument("--chunk-size", type=int, default=16)
+
+    serve_parser = subparsers.add_parser("serve", parents=[common],
+                                         help="Запустить сервис оценки в нескольких процессах")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--max-batch", type=int, default=64)
+    serve_parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    serve_parser.add_argument("--report-interval", type=float, default=60.0,
+                              help="Как часто печатать память воркеров, сек")
+
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        run_batch(args.pdf_files, args.workers, args.output, args.chunk_size)
+    else:
+        run_service(args.workers, args.host, args.port, args.max_batch, args.max_wait_ms,
+                    args.report_interval)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())